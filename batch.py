@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Compress a directory or manifest of videos with concurrent jobs.
+
+Examples::
+
+    # every video under ~/incoming, two encodes at a time
+    python batch.py ~/incoming --recursive --jobs 2 --report report.jsonl
+
+    # one job per manifest line: a path, or a JSON object with
+    # "input" and optional per-file "settings" overrides
+    python batch.py --manifest backlog.jsonl --retries 2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from compression import VideoCompressor
+from metadata_cache import VIDEO_EXTENSIONS
+from telemetry import get_telemetry
+
+
+def default_jobs(cpu_count=None):
+    """Number of concurrent encodes for this machine.
+
+    libx264 stops scaling well beyond a handful of threads per encode, so
+    several encodes with fewer threads each keep more cores busy.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // 4)
+
+
+def discover_jobs(directory, recursive=False):
+    """One job per video in directory, skipping outputs of earlier runs."""
+    pattern = '**/*' if recursive else '*'
+    return [
+        {'input': str(path), 'settings': {}}
+        for path in sorted(Path(directory).glob(pattern))
+        if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS
+        and not path.stem.endswith('_compressed')
+    ]
+
+
+def read_manifest(manifest_path):
+    """Parse a manifest of plain paths or JSON objects, one job per line."""
+    jobs = []
+    base = Path(manifest_path).parent
+    for line in Path(manifest_path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            entry = json.loads(line)
+            job = {'input': entry['input'], 'settings': entry.get('settings', {})}
+        else:
+            job = {'input': line, 'settings': {}}
+        # Relative paths are relative to the manifest, not the working directory
+        job['input'] = str(base / Path(job['input']).expanduser())
+        jobs.append(job)
+    return jobs
+
+
+class BatchRunner:
+    """Run VideoCompressor jobs concurrently and write a JSON-lines report.
+
+    Up to max_jobs encodes run at once and the cores are divided between
+    them through the x264 threads option. Encodes skip inline quality
+    assessment; outputs are scored on a separate pool instead, so scoring
+    one file overlaps with encoding the next. A failed encode is retried
+    up to retries times with exponential backoff; with resumable=True each
+    file is encoded in checkpointed segments, so a retry (or a rerun of the
+    batch) only encodes the segments that are missing.
+    """
+
+    def __init__(self, compressor, settings, max_jobs=None, retries=1, retry_delay=5.0,
+                 scoring_workers=1, assess_quality=True, resumable=False):
+        self.compressor = compressor
+        self.settings = settings
+        self.max_jobs = max_jobs or default_jobs()
+        self.threads = max(1, (os.cpu_count() or 1) // self.max_jobs)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.scoring_workers = scoring_workers
+        self.assess_quality = assess_quality
+        self.resumable = resumable
+
+    def _encode(self, job):
+        """Encode one job, retrying failures; always returns a report record."""
+        settings = {**self.settings, 'threads': self.threads, **job['settings']}
+        record = {'input': job['input'], 'settings': settings, 'attempts': 0}
+        started = time.time()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            record['attempts'] = attempt + 1
+            try:
+                if self.resumable:
+                    # Segments run one at a time; the job's share of cores goes to each
+                    result = self.compressor.compress_video_chunked(
+                        job['input'], settings, max_workers=1, resume=True, assess_quality=False)
+                else:
+                    result = self.compressor.compress_video(job['input'], settings, assess_quality=False)
+            except FileNotFoundError as e:
+                record.update(status='failed', error=str(e))
+                break  # retrying cannot help
+            except Exception as e:
+                record.update(status='failed', error=str(e))
+            else:
+                record.update(
+                    status='encoded',
+                    output_path=result['output_path'],
+                    compression_ratio=result['compression_ratio'],
+                    encode_fps=result.get('encode_stats', {}).get('fps'),
+                    error=None,
+                )
+                break
+        record['encode_seconds'] = time.time() - started
+        return record
+
+    def _score(self, record):
+        started = time.time()
+        try:
+            record['quality_score'] = self.compressor.quality_assessor.assess_quality(record['output_path'])
+        except Exception as e:
+            record['quality_score'] = None
+            record['error'] = f"Quality assessment failed: {e}"
+        record['score_seconds'] = time.time() - started
+        record['status'] = 'done'
+        return record
+
+    def run(self, jobs, report=None):
+        """Run every job and return the report records in completion order.
+
+        Each record is also written to the report file object as soon as
+        the job finishes.
+        """
+        records = []
+
+        def finish(record):
+            records.append(record)
+            if report is not None:
+                report.write(json.dumps(record) + '\n')
+                report.flush()
+            print(f"[{len(records)}/{len(jobs)}] {record['status']}: {record['input']}", file=sys.stderr)
+
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as encoders, \
+                ThreadPoolExecutor(max_workers=self.scoring_workers) as scorers:
+            pending = {encoders.submit(self._encode, job) for job in jobs}
+            scoring = set()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    if future in scoring:
+                        scoring.discard(future)
+                        finish(record)
+                    elif record['status'] == 'encoded' and self.assess_quality:
+                        scored = scorers.submit(self._score, record)
+                        scoring.add(scored)
+                        pending.add(scored)
+                    else:
+                        if record['status'] == 'encoded':
+                            record['status'] = 'done'
+                        finish(record)
+        return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', help='directory of videos to compress')
+    parser.add_argument('--manifest', help='file listing the videos to compress, one per line')
+    parser.add_argument('--recursive', action='store_true', help='also search subdirectories')
+    parser.add_argument('--preset', choices=['low', 'medium', 'high'], default='medium')
+    parser.add_argument('--bitrate', type=float, default=None,
+                        help='encode at this average bitrate in Mbps instead of a CRF')
+    parser.add_argument('--crf', type=int, default=None)
+    parser.add_argument('--resolution', default='original', choices=['original', '1080p', '720p', '480p'])
+    parser.add_argument('--jobs', type=int, default=None, help='concurrent encodes (default: cores / 4)')
+    parser.add_argument('--retries', type=int, default=1, help='retries per failed encode')
+    parser.add_argument('--retry-delay', type=float, default=5.0, help='seconds before the first retry')
+    parser.add_argument('--scoring-workers', type=int, default=1)
+    parser.add_argument('--no-quality', action='store_true', help='skip quality assessment')
+    parser.add_argument('--resume', action='store_true',
+                        help='encode in checkpointed segments that survive failures and restarts')
+    parser.add_argument('--report', default='batch_report.jsonl', help='JSON-lines report path')
+    parser.add_argument('--metrics', help='write stage timings and resource use here in Prometheus text format')
+    parser.add_argument('--trace', help='write a Chrome trace of every stage here')
+    args = parser.parse_args(argv)
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error('give either a directory or --manifest')
+    jobs = read_manifest(args.manifest) if args.manifest else discover_jobs(args.directory, args.recursive)
+    if not jobs:
+        print('No videos to compress', file=sys.stderr)
+        return 0
+
+    telemetry = get_telemetry()
+    telemetry.trace = telemetry.trace or bool(args.trace)
+    settings = {'preset': args.preset, 'resolution': args.resolution,
+                'bitrate': args.bitrate, 'crf': args.crf,
+                'rate_control': 'bitrate' if args.bitrate and args.crf is None else 'crf'}
+    runner = BatchRunner(VideoCompressor(), settings, args.jobs, args.retries, args.retry_delay,
+                         args.scoring_workers, not args.no_quality, args.resume)
+    print(f"Compressing {len(jobs)} videos, {runner.max_jobs} at a time with "
+          f"{runner.threads} encoder threads each", file=sys.stderr)
+    with open(args.report, 'w') as report:
+        records = runner.run(jobs, report)
+    failed = [r for r in records if r['status'] == 'failed']
+    score_cache = runner.compressor.quality_assessor.score_cache
+    if runner.assess_quality and score_cache:
+        stats = score_cache.stats()
+        print(f"Score cache: {stats['hits']} hits, {stats['misses']} misses", file=sys.stderr)
+    if args.metrics:
+        telemetry.write_prometheus(args.metrics)
+    if args.trace:
+        telemetry.write_chrome_trace(args.trace)
+    print(f"{len(records) - len(failed)} done, {len(failed)} failed; report: {args.report}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Benchmark the hot paths of the video compression optimizer.
+
+Synthetic test videos are generated locally with ffmpeg's lavfi sources
+(testsrc2 with temporal noise) and cached, so runs are reproducible on any
+machine. Each benchmark runs in a fresh process, which keeps its peak RSS
+measurement independent of the others. Results are written as JSON and
+can be compared against a stored baseline::
+
+    python benchmarks/benchmark.py --output bench.json
+    python benchmarks/benchmark.py --baseline bench.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+DEFAULT_SIZES = ['640x360', '1280x720', '1920x1080']
+DEFAULT_CACHE_DIR = ROOT / 'benchmarks' / '.videos'
+
+
+def generate_video(cache_dir, size, duration, fps):
+    """Create (once) a noisy synthetic test video with audio."""
+    import ffmpeg
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"testsrc_{size}_{duration}s_{fps}fps.mp4"
+    if not path.exists():
+        video = ffmpeg.input(f"testsrc2=size={size}:rate={fps}:duration={duration}", f='lavfi')
+        video = video.filter('noise', alls=20, allf='t')
+        audio = ffmpeg.input(f"sine=frequency=440:duration={duration}", f='lavfi')
+        (
+            ffmpeg.output(video, audio, str(path), vcodec='libx264', preset='ultrafast', crf=18,
+                          acodec='aac', pix_fmt='yuv420p')
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    return path
+
+
+def _load_frames(video_path, limit):
+    import cv2
+
+    cap = cv2.VideoCapture(str(video_path))
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def _best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _native_processor():
+    from native import load_video_processor
+
+    VideoProcessor = load_video_processor()
+    if VideoProcessor is None:
+        raise RuntimeError("VideoProcessor extension is not built")
+    return VideoProcessor()
+
+
+def bench_calculate_psnr(video_path, repeats, max_frames):
+    import cv2
+
+    processor = _native_processor()
+    frames = _load_frames(video_path, max_frames)
+    distorted = [cv2.GaussianBlur(f, (7, 7), 0) for f in frames]
+    seconds = _best_time(lambda: [processor.calculate_psnr(a, b) for a, b in zip(frames, distorted)], repeats)
+    return len(frames), 2 * sum(f.nbytes for f in frames), seconds
+
+
+def bench_calculate_ssim(video_path, repeats, max_frames):
+    import cv2
+
+    processor = _native_processor()
+    frames = _load_frames(video_path, max_frames)
+    distorted = [cv2.GaussianBlur(f, (7, 7), 0) for f in frames]
+    seconds = _best_time(lambda: [processor.calculate_ssim(a, b) for a, b in zip(frames, distorted)], repeats)
+    return len(frames), 2 * sum(f.nbytes for f in frames), seconds
+
+
+def bench_ssim_fast(video_path, repeats, max_frames):
+    import cv2
+    from native import load_native_module
+
+    module = load_native_module()
+    if module is None:
+        raise RuntimeError("VideoProcessor extension is not built")
+    metrics = module.QualityMetrics(module.MetricsOptions(luma_only=True, window=module.SSIMWindow.BOX,
+                                                          downscale=2))
+    frames = _load_frames(video_path, max_frames)
+    distorted = [cv2.GaussianBlur(f, (7, 7), 0) for f in frames]
+    seconds = _best_time(lambda: [metrics.ssim(a, b) for a, b in zip(frames, distorted)], repeats)
+    return len(frames), 2 * sum(f.nbytes for f in frames), seconds
+
+
+def bench_analyze_frame(video_path, repeats, max_frames):
+    processor = _native_processor()
+    frames = _load_frames(video_path, max_frames)
+    seconds = _best_time(lambda: [processor.analyze_frame(f) for f in frames], repeats)
+    return len(frames), sum(f.nbytes for f in frames), seconds
+
+
+def bench_analyze_frames(video_path, repeats, max_frames):
+    import numpy as np
+
+    processor = _native_processor()
+    batch = np.stack(_load_frames(video_path, max_frames))
+    seconds = _best_time(lambda: processor.analyze_frames(batch), repeats)
+    return len(batch), batch.nbytes, seconds
+
+
+def bench_analyze_video(video_path, repeats, max_frames):
+    processor = _native_processor()
+    profile = processor.analyze_video(str(video_path))
+    seconds = _best_time(lambda: processor.analyze_video(str(video_path)), repeats)
+    return len(profile['frame_indices']), os.path.getsize(video_path), seconds
+
+
+def bench_optimize_parameters(video_path, repeats, max_frames):
+    processor = _native_processor()
+    frames = _load_frames(video_path, max_frames)
+    seconds = _best_time(lambda: [processor.optimize_parameters(f, 0.9) for f in frames], repeats)
+    return len(frames), sum(f.nbytes for f in frames), seconds
+
+
+def bench_assess_quality(video_path, repeats, max_frames):
+    from metadata_cache import MetadataCache
+    from quality_assessment import QualityAssessor
+
+    # Without the score cache every timed run after the warm-up would be a lookup
+    assessor = QualityAssessor(num_frames=max_frames, metadata_cache=MetadataCache(db_path=None),
+                               score_cache=False)
+    assessor.assess_quality(str(video_path))  # model load and warm-up
+    seconds = _best_time(lambda: assessor.assess_quality(str(video_path)), repeats)
+    return max_frames, os.path.getsize(video_path), seconds
+
+
+def bench_compress_video(video_path, repeats, max_frames):
+    from metadata_cache import MetadataCache
+    from compression import VideoCompressor
+    from quality_assessment import QualityAssessor
+
+    metadata_cache = MetadataCache(db_path=None)
+    # One uncached frame keeps scoring out of the encode timing without writing to the score cache
+    assessor = QualityAssessor(num_frames=1, metadata_cache=metadata_cache, score_cache=False)
+    compressor = VideoCompressor(quality_assessor=assessor, metadata_cache=metadata_cache)
+    frames = compressor.metadata_cache.frame_count(video_path)
+    settings = {'preset': 'medium', 'bitrate': 2, 'resolution': 'original'}
+    seconds = _best_time(lambda: compressor.compress_video(str(video_path), settings), repeats)
+    os.remove(compressor._output_path(video_path))
+    return frames, os.path.getsize(video_path), seconds
+
+
+BENCHMARKS = {
+    'calculate_psnr': bench_calculate_psnr,
+    'calculate_ssim': bench_calculate_ssim,
+    'ssim_fast': bench_ssim_fast,
+    'analyze_frame': bench_analyze_frame,
+    'analyze_frames': bench_analyze_frames,
+    'analyze_video': bench_analyze_video,
+    'optimize_parameters': bench_optimize_parameters,
+    'assess_quality': bench_assess_quality,
+    'compress_video': bench_compress_video,
+}
+
+
+def _run_isolated(name, video_path, repeats, max_frames):
+    """Run one benchmark; executed in a fresh worker process."""
+    frames, num_bytes, seconds = BENCHMARKS[name](video_path, repeats, max_frames)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'frames': frames,
+        'seconds': seconds,
+        'frames_per_sec': frames / seconds if seconds else None,
+        'mb_per_sec': num_bytes / 1e6 / seconds if seconds else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6,
+        'child_peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1e6,
+    }
+
+
+def run_benchmarks(names, videos, repeats, max_frames):
+    results = []
+    for video_path in videos:
+        for name in names:
+            entry = {'name': name, 'video': video_path.name}
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                try:
+                    entry.update(executor.submit(_run_isolated, name, video_path, repeats, max_frames).result())
+                except Exception as e:
+                    entry['error'] = str(e)
+            print(json.dumps(entry), file=sys.stderr)
+            results.append(entry)
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Return the benchmarks whose throughput dropped by more than threshold."""
+    previous = {(r['name'], r['video']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['name'], result['video']))
+        if not old or not old.get('frames_per_sec') or not result.get('frames_per_sec'):
+            continue
+        ratio = result['frames_per_sec'] / old['frames_per_sec']
+        result['baseline_ratio'] = ratio
+        if ratio < 1 - threshold:
+            regressions.append(result)
+    return regressions
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='WIDTHxHEIGHT of test videos')
+    parser.add_argument('--duration', type=int, default=5, help='test video length in seconds')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--max-frames', type=int, default=60, help='frames per frame-level benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per benchmark; the best is kept')
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--output', type=Path, help='write results JSON here (default: stdout)')
+    parser.add_argument('--baseline', type=Path, help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative throughput drop before a regression is reported')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    videos = [generate_video(args.cache_dir, size, args.duration, args.fps) for size in args.sizes]
+    report = {
+        'meta': _metadata(),
+        'results': run_benchmarks(args.benchmarks, videos, args.repeats, args.max_frames),
+    }
+
+    regressions = []
+    if args.baseline:
+        regressions = compare_to_baseline(report['results'], json.loads(args.baseline.read_text()),
+                                          args.threshold)
+        report['regressions'] = [(r['name'], r['video']) for r in regressions]
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    for result in regressions:
+        print(f"Regression: {result['name']} on {result['video']} runs at "
+              f"{result['baseline_ratio']:.2f}x baseline throughput", file=sys.stderr)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
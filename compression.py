@@ -1,25 +1,51 @@
 import ffmpeg
 import numpy as np
 from pathlib import Path
+import json
 import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fractions import Fraction
+from ffmpeg_progress import AggregateProgress, EncodeCancelled, run_with_progress
+from metadata_cache import get_metadata_cache
 from quality_assessment import QualityAssessor
+from score_cache import file_fingerprint
+from telemetry import get_telemetry
+
+# Bitrates in Mbps, in the units of the GUI's bitrate setting
+DEFAULT_LADDER = [
+    {'resolution': '1080p', 'bitrate': 5.0},
+    {'resolution': '720p', 'bitrate': 3.0},
+    {'resolution': '480p', 'bitrate': 1.2},
+]
 
 class VideoCompressor:
-    def __init__(self):
-        self.quality_assessor = QualityAssessor()
+    def __init__(self, quality_assessor=None, metadata_cache=None):
+        self.metadata_cache = metadata_cache or get_metadata_cache()
+        self.quality_assessor = quality_assessor or QualityAssessor(metadata_cache=self.metadata_cache)
+        self.telemetry = get_telemetry()
         self.preset_settings = {
             'low': {'crf': 28, 'preset': 'veryfast'},
             'medium': {'crf': 23, 'preset': 'medium'},
             'high': {'crf': 18, 'preset': 'slow'},
         }
 
+    def _probe(self, input_path):
+        """Return the (cached) ffprobe report for the input."""
+        return self.metadata_cache.probe(input_path)
+
+    def _video_stream(self, probe):
+        """Return the first video stream of an ffprobe report."""
+        return next(s for s in probe['streams'] if s['codec_type'] == 'video')
+
     def _get_video_info(self, input_path):
         """Get video metadata using ffmpeg."""
-        probe = ffmpeg.probe(input_path)
-        video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
-        return video_info
+        return self._video_stream(self._probe(input_path))
 
-    def _get_output_resolution(self, original_width, original_height, target_res):
+    @staticmethod
+    def _get_output_resolution(original_width, original_height, target_res):
         """Calculate output resolution maintaining aspect ratio."""
         if target_res == 'original':
             return original_width, original_height
@@ -30,34 +56,21 @@ class VideoCompressor:
             return original_width, original_height
         
         aspect_ratio = original_width / original_height
-        target_width = int(target_height * aspect_ratio)
+        target_width = int(target_height * aspect_ratio) // 2 * 2  # libx264 needs even sizes
         return target_width, target_height
 
-    def compress_video(self, input_path, settings, progress_callback=None):
-        """Compress video with the specified settings."""
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"Input video not found: {input_path}")
-
-        # Get video info
-        video_info = self._get_video_info(input_path)
-        original_width = int(video_info['width'])
-        original_height = int(video_info['height'])
-
-        # Prepare output path
+    def _output_path(self, input_path):
+        """Return the path compressed output for input_path is written to."""
         input_path = Path(input_path)
-        output_path = input_path.parent / f"{input_path.stem}_compressed{input_path.suffix}"
+        return input_path.parent / f"{input_path.stem}_compressed{input_path.suffix}"
 
-        # Get compression settings
+    def _encoder_kwargs(self, settings, original_width, original_height):
+        """Translate GUI-style settings into libx264 output arguments."""
         preset = settings['preset']
-        target_bitrate = settings['bitrate']
         output_width, output_height = self._get_output_resolution(
             original_width, original_height, settings['resolution']
         )
 
-        # Build ffmpeg command
-        stream = ffmpeg.input(str(input_path))
-        
-        # Apply compression settings
         if preset in self.preset_settings:
             compression_settings = self.preset_settings[preset]
         else:  # Custom settings
@@ -66,49 +79,503 @@ class VideoCompressor:
                 'preset': 'medium'
             }
 
+        kwargs = {
+            'vcodec': 'libx264',
+            's': f"{output_width}x{output_height}",
+            'preset': compression_settings['preset'],
+        }
+        # libx264 lets a CRF override the bitrate, so the bitrate is only used
+        # when the caller asks for average-bitrate rate control
+        if settings.get('rate_control') == 'bitrate':
+            kwargs['video_bitrate'] = f"{settings['bitrate']}M"
+        elif settings.get('crf') is not None:
+            kwargs['crf'] = settings['crf']
+        else:
+            kwargs['crf'] = compression_settings['crf']
+        # Lets a scheduler running several encodes at once split the cores between them
+        if settings.get('threads'):
+            kwargs['threads'] = settings['threads']
+        return kwargs
+
+    def _resolve_target_quality(self, input_path, settings):
+        """Replace a 'target_quality' setting with the CRF/resolution that meets it.
+
+        Settings without a target are returned unchanged. The target is a mean
+        SSIM by default; set 'quality_metric' to 'psnr' to give it in dB.
+
+        'rate_quality_model' names a trained rate_quality.py model: it narrows
+        the trial-encode search, or with 'trial_encodes': False replaces it
+        and the settings are predicted without encoding anything.
+        """
+        if settings.get('target_quality') is None:
+            return settings
+
+        from target_quality import TargetQualitySearch
+
+        model = None
+        if settings.get('rate_quality_model'):
+            from rate_quality import RateQualityModel
+            model = RateQualityModel.load(settings['rate_quality_model'])
+            if settings.get('trial_encodes') is False:
+                return dict(settings, **self._predict_target_quality(input_path, settings, model))
+
+        search = TargetQualitySearch(self, metric=settings.get('quality_metric', 'ssim'))
+        preset = self.preset_settings.get(settings['preset'], {'preset': 'medium'})['preset']
+        result = search.search(input_path, settings['target_quality'],
+                               resolutions=settings.get('candidate_resolutions'), preset=preset, model=model)
+        return dict(settings, crf=result['crf'], resolution=result['resolution'], target_search=result)
+
+    def _predict_target_quality(self, input_path, settings, model):
+        """CRF and resolution for an SSIM target, predicted by a rate-quality model."""
+        if settings.get('quality_metric', 'ssim') != 'ssim':
+            raise ValueError("Rate-quality models predict SSIM; use quality_metric 'ssim'")
+        from native import load_video_processor
+        from rate_quality import content_features
+
+        VideoProcessor = load_video_processor()
+        if VideoProcessor is None:
+            raise RuntimeError("Rate-quality prediction needs the compiled VideoProcessor extension")
+        video_info = self._get_video_info(input_path)
+        width, height = int(video_info['width']), int(video_info['height'])
+        fps = float(Fraction(video_info['avg_frame_rate']))
+        content = content_features(VideoProcessor(), input_path)
+        result = model.choose(content, width, height, fps, settings['target_quality'],
+                              resolutions=settings.get('candidate_resolutions'),
+                              output_size=self._get_output_resolution)
+        return {'crf': result['crf'], 'resolution': result['resolution'], 'target_search': result}
+
+    def compress_video(self, input_path, settings, progress_callback=None, assess_quality=True,
+                       cancel_event=None):
+        """Compress video with the specified settings.
+
+        With assess_quality=False the quality_score is left as None, so the
+        caller can score the output later, e.g. while the next file encodes.
+        Setting cancel_event (a threading.Event) stops the encode, removes
+        the partial output and raises EncodeCancelled.
+
+        The encode uses the 'crf' setting, or the preset's CRF; 'bitrate'
+        (Mbps) is only used with 'rate_control': 'bitrate'.
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input video not found: {input_path}")
+
+        telemetry = self.telemetry
+        with telemetry.stage('target_search'):
+            settings = self._resolve_target_quality(input_path, settings)
+
+        # Get video info
+        with telemetry.stage('probe'):
+            probe = self._probe(input_path)
+        video_info = self._video_stream(probe)
+        original_width = int(video_info['width'])
+        original_height = int(video_info['height'])
+        duration = float(probe['format'].get('duration', 0)) or None
+
+        # Prepare output path
+        input_path = Path(input_path)
+        output_path = self._output_path(input_path)
+
         # Build output stream with settings
+        stream = ffmpeg.input(str(input_path))
         stream = ffmpeg.output(
             stream,
             str(output_path),
-            vcodec='libx264',
             acodec='aac',
-            video_bitrate=f"{target_bitrate}M",
-            s=f"{output_width}x{output_height}",
-            crf=compression_settings['crf'],
-            preset=compression_settings['preset']
+            **self._encoder_kwargs(settings, original_width, original_height)
         )
 
-        # Run compression
+        # Run compression; encoding covers the first 90% of the progress bar
+        encode_callback = None
+        if progress_callback:
+            encode_callback = lambda stats: progress_callback(0.9 * stats['percent'])
+
         try:
-            process = ffmpeg.run_async(
-                stream,
-                pipe_stdout=True,
-                pipe_stderr=True
-            )
+            with telemetry.stage('encode', input=input_path.name):
+                encode_stats = run_with_progress(stream, duration, encode_callback,
+                                                 cancel_event=cancel_event)
+
+            # Assess quality
+            quality_score = None
+            if cancel_event is not None and cancel_event.is_set():
+                raise EncodeCancelled("Encode cancelled")
+            if assess_quality:
+                with telemetry.stage('quality'):
+                    quality_score = self.quality_assessor.assess_quality(str(output_path))
             
-            # Monitor progress
             if progress_callback:
-                while True:
-                    if process.poll() is not None:
-                        break
-                    # Estimate progress (this is a simplified version)
-                    progress_callback(50)  # You would need to implement proper progress tracking
-            
-            process.wait()
+                progress_callback(100)
+
+            return {
+                'output_path': str(output_path),
+                'quality_score': quality_score,
+                'compression_ratio': os.path.getsize(output_path) / os.path.getsize(input_path),
+                'encode_stats': encode_stats,
+                'target_search': settings.get('target_search'),
+            }
+
+        except EncodeCancelled:
+            if output_path.exists():
+                output_path.unlink()
+            raise
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"FFmpeg error: {e.stderr.decode()}")
+        except Exception as e:
+            raise RuntimeError(f"Compression error: {str(e)}")
+
+    def _detect_scene_cuts(self, input_path, threshold):
+        """Return the timestamps (seconds) of scene cuts in the input.
+
+        Detection runs on a downscaled copy of the stream, so it costs one
+        cheap decode pass rather than a full-resolution one.
+        """
+        _, stderr = (
+            ffmpeg.input(str(input_path))
+            .filter('scale', 320, -2)
+            .filter('select', f'gt(scene,{threshold})')
+            .filter('showinfo')
+            .output('-', format='null')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        return [float(t) for t in re.findall(r'pts_time:\s*([0-9.]+)', stderr.decode(errors='replace'))]
+
+    def _plan_segments(self, total_frames, gop_frames, cut_frames=()):
+        """Split [0, total_frames) into (start, end) frame ranges.
+
+        Scene cuts become segment boundaries; stretches without a cut are
+        split into whole GOPs so every segment is at most gop_frames long
+        and starts on a keyframe of a single-pass encode. Cuts closer than
+        a quarter GOP to the previous boundary are dropped to avoid tiny
+        chunks.
+        """
+        min_frames = max(1, gop_frames // 4)
+        boundaries = [0]
+        for cut in sorted(set(cut_frames)) + [total_frames]:
+            while cut - boundaries[-1] > gop_frames:
+                boundaries.append(boundaries[-1] + gop_frames)
+            if cut - boundaries[-1] >= min_frames or cut == total_frames:
+                boundaries.append(cut)
+        if len(boundaries) > 2 and boundaries[-1] - boundaries[-2] < min_frames:
+            del boundaries[-2]
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+    def _encode_chunk(self, input_path, chunk_path, start_frame, num_frames, fps,
+                      encoder_kwargs, is_last, progress_callback=None):
+        """Encode one video-only chunk starting at start_frame."""
+        # Seek half a frame early so rounding never drops the first frame
+        start_time = max(0.0, (start_frame - 0.5) / fps)
+        output_kwargs = dict(encoder_kwargs, an=None)
+        if not is_last:
+            output_kwargs['vframes'] = num_frames
+        stream = ffmpeg.input(str(input_path), ss=f"{start_time:.6f}").output(str(chunk_path), **output_kwargs)
+        return run_with_progress(stream, num_frames / fps, progress_callback)
+
+    def _checkpoint_paths(self, output_path):
+        """Manifest file and segment directory of a resumable encode of output_path."""
+        return (output_path.with_name(output_path.name + '.checkpoint.json'),
+                output_path.with_name(f".{output_path.name}.segments"))
+
+    def _load_checkpoint(self, manifest_path, job):
+        """Return the recorded state if it belongs to the same input and settings."""
+        try:
+            state = json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            return None
+        return state if state.get('job') == job else None
+
+    def _save_checkpoint(self, manifest_path, state):
+        tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(state, indent=1))
+        os.replace(tmp_path, manifest_path)
+
+    def _count_packets(self, path):
+        """Number of video packets in path; only demuxes, nothing is decoded."""
+        probe = ffmpeg.probe(str(path), select_streams='v:0', count_packets=None)
+        return int(probe['streams'][0]['nb_read_packets'])
+
+    def _chunk_is_complete(self, chunk_path, record):
+        """Check a finished chunk against its checkpoint record before reusing it."""
+        if not record or not chunk_path.exists() or chunk_path.stat().st_size != record['size']:
+            return False
+        try:
+            return self._count_packets(chunk_path) == record['packets']
+        except (ffmpeg.Error, KeyError, IndexError, ValueError):
+            return False
+
+    def compress_video_chunked(self, input_path, settings, progress_callback=None,
+                               max_workers=None, scene_threshold=0.4, segment_seconds=10.0,
+                               resume=False, assess_quality=True):
+        """Compress a video as independently encoded chunks run in parallel.
+
+        The video is split at scene cuts (or, with scene_threshold=None or when
+        no cut is found, into fixed GOP-aligned segments), the chunks are
+        encoded concurrently by a bounded pool of ffmpeg processes, and the
+        result is stitched losslessly with the concat demuxer. Audio is
+        encoded once from the source so it stays in sync with the video.
+
+        With resume=True the segment plan and every finished chunk are
+        recorded in a checkpoint manifest next to the output. A later call
+        with the same input and settings verifies the recorded chunks and
+        only encodes the missing ones; the manifest and chunks are removed
+        once the final remux succeeds.
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input video not found: {input_path}")
+
+        input_path = Path(input_path)
+        output_path = self._output_path(input_path)
+        telemetry = self.telemetry
+        with telemetry.stage('target_search'):
+            settings = self._resolve_target_quality(input_path, settings)
+
+        with telemetry.stage('probe'):
+            probe = self._probe(input_path)
+        video_info = self._video_stream(probe)
+        has_audio = any(s['codec_type'] == 'audio' for s in probe['streams'])
+        fps = float(Fraction(video_info['avg_frame_rate']))
+        duration = float(probe['format']['duration'])
+        total_frames = int(video_info.get('nb_frames') or round(duration * fps))
+
+        # Every chunk restarts the GOP, so segments are whole GOPs long
+        gop_frames = max(1, int(round(segment_seconds * fps)))
+        encoder_kwargs = self._encoder_kwargs(
+            settings, int(video_info['width']), int(video_info['height'])
+        )
+        encoder_kwargs['g'] = gop_frames
+
+        cpu_count = os.cpu_count() or 1
+        if max_workers is None:
+            max_workers = max(1, cpu_count // 4)
+        encoder_kwargs.setdefault('threads', max(1, cpu_count // max_workers))
+
+        try:
+            state = None
+            if resume:
+                manifest_path, work_dir = self._checkpoint_paths(output_path)
+                job = {
+                    'input': str(input_path.resolve()),
+                    'fingerprint': file_fingerprint(input_path),
+                    # threads does not change the bitstream enough to matter
+                    'encoder': {k: v for k, v in encoder_kwargs.items() if k != 'threads'},
+                    'scene_threshold': scene_threshold,
+                }
+                state = self._load_checkpoint(manifest_path, job)
+
+            if state is not None:
+                segments = [tuple(segment) for segment in state['segments']]
+            else:
+                cut_frames = []
+                if scene_threshold is not None:
+                    try:
+                        with telemetry.stage('scene_detection'):
+                            cut_times = self._detect_scene_cuts(input_path, scene_threshold)
+                    except ffmpeg.Error:
+                        cut_times = []  # Fall back to fixed segments
+                    cut_frames = [int(round(t * fps)) for t in cut_times]
+                segments = self._plan_segments(total_frames, gop_frames, cut_frames)
+
+            if resume:
+                if state is None:
+                    # Nothing reusable: start over with a clean segment directory
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    state = {'job': job, 'segments': segments, 'done': {}}
+                    self._save_checkpoint(manifest_path, state)
+                work_dir.mkdir(parents=True, exist_ok=True)
+            else:
+                work_dir = Path(tempfile.mkdtemp(prefix=f".{input_path.stem}_chunks_", dir=output_path.parent))
+
+            try:
+                chunk_paths = [work_dir / f"chunk_{i:05d}.mkv" for i in range(len(segments))]
+                progress = AggregateProgress(
+                    total_frames / fps,
+                    (lambda percent: progress_callback(0.9 * percent)) if progress_callback else None,
+                )
+
+                pending = []
+                for i, (start, end) in enumerate(segments):
+                    if resume and self._chunk_is_complete(chunk_paths[i], state['done'].get(str(i))):
+                        progress.update(i, (end - start) / fps)
+                    else:
+                        pending.append(i)
+                reused = len(segments) - len(pending)
+
+                def encode(i):
+                    start, end = segments[i]
+                    # A resumable chunk only gets its final name once it is complete
+                    target = chunk_paths[i].with_suffix('.partial.mkv') if resume else chunk_paths[i]
+                    with telemetry.stage('encode_chunk', chunk=i):
+                        self._encode_chunk(input_path, target, start, end - start, fps, encoder_kwargs,
+                                           i == len(segments) - 1, progress.part_callback(i))
+                    if resume:
+                        os.replace(target, chunk_paths[i])
+                    return i
+
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(encode, i) for i in pending]
+                    try:
+                        for future in as_completed(futures):
+                            i = future.result()
+                            if resume:
+                                state['done'][str(i)] = {
+                                    'size': chunk_paths[i].stat().st_size,
+                                    'packets': self._count_packets(chunk_paths[i]),
+                                }
+                                self._save_checkpoint(manifest_path, state)
+                    except BaseException:
+                        # Don't start queued chunks once one has failed
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+                concat_list = work_dir / 'chunks.txt'
+                concat_list.write_text(''.join(
+                    "file '{}'\n".format(str(p.resolve()).replace("'", "'\\''")) for p in chunk_paths
+                ))
+
+                video = ffmpeg.input(str(concat_list), f='concat', safe=0)
+                streams = [video['v']]
+                output_kwargs = {'vcodec': 'copy'}
+                if has_audio:
+                    streams.append(ffmpeg.input(str(input_path))['a'])
+                    output_kwargs['acodec'] = 'aac'
+                with telemetry.stage('remux'):
+                    (
+                        ffmpeg.output(*streams, str(output_path), **output_kwargs)
+                        .overwrite_output()
+                        .run(quiet=True)
+                    )
+            finally:
+                # Resumable chunks are kept until the output is complete
+                if not resume:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+            if resume:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                manifest_path.unlink()
 
             # Assess quality
-            quality_score = self.quality_assessor.assess_quality(str(output_path))
-            
+            quality_score = None
+            if assess_quality:
+                with telemetry.stage('quality'):
+                    quality_score = self.quality_assessor.assess_quality(str(output_path))
+
             if progress_callback:
                 progress_callback(100)
 
             return {
                 'output_path': str(output_path),
                 'quality_score': quality_score,
-                'compression_ratio': os.path.getsize(output_path) / os.path.getsize(input_path)
+                'compression_ratio': os.path.getsize(output_path) / os.path.getsize(input_path),
+                'chunks': len(segments),
+                'resumed_chunks': reused,
+                'target_search': settings.get('target_search'),
             }
 
         except ffmpeg.Error as e:
             raise RuntimeError(f"FFmpeg error: {e.stderr.decode()}")
         except Exception as e:
             raise RuntimeError(f"Compression error: {str(e)}")
+
+    def _measure_rendition(self, input_path, rendition, measure_fidelity):
+        """Add size, bitrate and quality results to a finished rendition."""
+        path = rendition['output_path']
+        probe = self._probe(path)
+        rendition['size_bytes'] = os.path.getsize(path)
+        rendition['bitrate_kbps'] = rendition['size_bytes'] * 8 / 1000 / float(probe['format']['duration'])
+        rendition['quality_score'] = self.quality_assessor.assess_quality(path)
+        if measure_fidelity:
+            from native import load_video_processor
+            from score_cache import compare_videos_cached
+
+            VideoProcessor = load_video_processor()
+            if VideoProcessor is not None:
+                comparison = compare_videos_cached(VideoProcessor(), input_path, path,
+                                                   frame_step=measure_fidelity)
+                rendition['psnr'] = comparison['psnr_mean']
+                rendition['ssim'] = comparison['ssim_mean']
+        return rendition
+
+    def compress_ladder(self, input_path, rungs=None, preset='medium', progress_callback=None,
+                        measure_fidelity=None, hull_rungs=None):
+        """Encode every rendition of an ABR ladder from a single decode of the input.
+
+        rungs is a list of dicts with a 'resolution' plus a 'bitrate' (Mbps)
+        or a 'crf'; DEFAULT_LADDER is used when omitted. With hull_rungs=N
+        the rungs are instead chosen from the title's measured rate-quality
+        convex hull (see target_quality.convex_hull_ladder). One ffmpeg
+        process splits the decoded video and scales/encodes each rendition
+        to <stem>_<resolution><suffix>. Each rendition is then measured for
+        size, bitrate and model quality score (from sampled frames).
+
+        measure_fidelity=N (a frame step) also adds PSNR/SSIM against the
+        source when the native extension is built. This is off by default:
+        it decodes the full-resolution source once more per rendition, so
+        pass a large step (e.g. 30) to keep it cheap.
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input video not found: {input_path}")
+
+        input_path = Path(input_path)
+        probe = self._probe(input_path)
+        video_info = self._video_stream(probe)
+        has_audio = any(s['codec_type'] == 'audio' for s in probe['streams'])
+        original_width = int(video_info['width'])
+        original_height = int(video_info['height'])
+        duration = float(probe['format'].get('duration', 0)) or None
+
+        if hull_rungs:
+            from target_quality import TargetQualitySearch, convex_hull_ladder
+
+            x264_preset = self.preset_settings.get(preset, {'preset': preset})['preset']
+            trials = TargetQualitySearch(self).sample(input_path, preset=x264_preset)
+            rungs = [{'resolution': t['resolution'], 'crf': t['crf']}
+                     for t in convex_hull_ladder(trials, hull_rungs)]
+        if not rungs:
+            # Never upscale with the default ladder, but always produce something
+            rungs = [r for r in DEFAULT_LADDER
+                     if self._get_output_resolution(original_width, original_height, r['resolution'])[1] <= original_height]
+            rungs = rungs or DEFAULT_LADDER[-1:]
+
+        source = ffmpeg.input(str(input_path))
+        split = source.video.filter_multi_output('split', len(rungs))
+        outputs = []
+        renditions = []
+        for i, rung in enumerate(rungs):
+            settings = dict(rung, preset=preset)
+            if rung.get('crf') is None:
+                settings.setdefault('rate_control', 'bitrate')
+            kwargs = self._encoder_kwargs(settings, original_width, original_height)
+            width, height = (int(v) for v in kwargs.pop('s').split('x'))
+            name = rung['resolution'] if rung['resolution'] != 'original' else f"{width}x{height}"
+            if any(r['name'] == name for r in renditions):
+                name = f"{name}_{i}"
+            output_path = input_path.parent / f"{input_path.stem}_{name}{input_path.suffix}"
+
+            streams = [split.stream(i).filter('scale', width, height)]
+            if has_audio:
+                streams.append(source.audio)
+                kwargs['acodec'] = 'aac'
+            outputs.append(ffmpeg.output(*streams, str(output_path), **kwargs))
+            renditions.append(dict(rung, name=name, width=width, height=height, output_path=str(output_path)))
+
+        encode_callback = None
+        if progress_callback:
+            encode_callback = lambda stats: progress_callback(0.9 * stats['percent'])
+
+        try:
+            with self.telemetry.stage('encode_ladder', renditions=len(renditions)):
+                encode_stats = run_with_progress(ffmpeg.merge_outputs(*outputs), duration, encode_callback)
+
+            # Measuring is decode-bound and the native metrics release the GIL
+            with ThreadPoolExecutor(max_workers=len(renditions)) as executor:
+                renditions = list(executor.map(
+                    lambda r: self._measure_rendition(input_path, r, measure_fidelity), renditions
+                ))
+
+            if progress_callback:
+                progress_callback(100)
+
+            return {'renditions': renditions, 'encode_stats': encode_stats}
+
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"FFmpeg error: {e.stderr.decode()}")
+        except Exception as e:
+            raise RuntimeError(f"Compression error: {str(e)}")
@@ -5,21 +5,91 @@
 
 namespace py = pybind11;
 
-cv::Mat numpy_to_mat(py::array_t<uint8_t>& input) {
-    py::buffer_info buf = input.request();
-    if (buf.ndim != 3) {
-        throw std::runtime_error("Input array must be 3-dimensional");
+// Build a cv::Mat over raw uint8 image memory described by NumPy byte strides.
+// Pixels packed within each row are wrapped in place; anything else is gathered.
+cv::Mat strided_to_mat(uint8_t* data, int rows, int cols, int channels,
+                       py::ssize_t row_stride, py::ssize_t pixel_stride, py::ssize_t channel_stride) {
+    bool packed_rows = channel_stride == 1 && pixel_stride == channels &&
+                       row_stride >= static_cast<py::ssize_t>(cols) * channels;
+    if (packed_rows) {
+        return cv::Mat(rows, cols, CV_8UC(channels), data, static_cast<size_t>(row_stride));
+    }
+
+    cv::Mat mat(rows, cols, CV_8UC(channels));
+    for (int r = 0; r < rows; ++r) {
+        uint8_t* dst = mat.ptr<uint8_t>(r);
+        for (int c = 0; c < cols; ++c) {
+            for (int ch = 0; ch < channels; ++ch) {
+                dst[c * channels + ch] = data[r * row_stride + c * pixel_stride + ch * channel_stride];
+            }
+        }
     }
-    
-    int rows = buf.shape[0];
-    int cols = buf.shape[1];
-    int channels = buf.shape[2];
-    
-    cv::Mat mat(rows, cols, CV_8UC3);
-    std::memcpy(mat.data, buf.ptr, rows * cols * channels);
     return mat;
 }
 
+// Wrap a uint8 NumPy image (H, W), (H, W, 1), (H, W, 3) or (H, W, 4) as a
+// cv::Mat. Arrays whose pixels are packed within each row -- including
+// row-strided views such as crops -- are wrapped without copying, so the
+// returned Mat is only valid while the array is alive. Anything else
+// (column slices, negative strides, ...) is gathered into a new Mat.
+cv::Mat numpy_to_mat(const py::array_t<uint8_t>& input) {
+    if (input.ndim() != 2 && input.ndim() != 3) {
+        throw std::invalid_argument("Input array must be 2-dimensional (grayscale) or 3-dimensional (H, W, C)");
+    }
+
+    int rows = static_cast<int>(input.shape(0));
+    int cols = static_cast<int>(input.shape(1));
+    int channels = input.ndim() == 3 ? static_cast<int>(input.shape(2)) : 1;
+    if (channels != 1 && channels != 3 && channels != 4) {
+        throw std::invalid_argument("Input array must have 1, 3 or 4 channels");
+    }
+
+    return strided_to_mat(const_cast<uint8_t*>(input.data()), rows, cols, channels,
+                          input.strides(0), input.strides(1),
+                          input.ndim() == 3 ? input.strides(2) : 1);
+}
+
+// Convert every frame of an (N, H, W, C) array, or every array yielded by an
+// iterable, to a cv::Mat. Views borrow from the arrays kept alive in owners.
+// Arrays of any other rank are rejected: iterating a single (H, W, 3) frame
+// would otherwise analyze each of its rows as a grayscale frame.
+std::vector<cv::Mat> frames_to_mats(const py::object& frames, std::vector<py::array_t<uint8_t>>& owners) {
+    std::vector<cv::Mat> mats;
+    if (py::isinstance<py::array>(frames)) {
+        if (frames.cast<py::array>().ndim() != 4) {
+            throw std::invalid_argument("Frame batches must be 4-dimensional (N, H, W, C); "
+                                        "use analyze_frame for a single frame");
+        }
+        owners.push_back(frames.cast<py::array_t<uint8_t>>());
+        const py::array_t<uint8_t>& batch = owners.back();
+        int channels = static_cast<int>(batch.shape(3));
+        if (channels != 1 && channels != 3 && channels != 4) {
+            throw std::invalid_argument("Input array must have 1, 3 or 4 channels");
+        }
+        uint8_t* data = const_cast<uint8_t*>(batch.data());
+        mats.reserve(batch.shape(0));
+        for (py::ssize_t i = 0; i < batch.shape(0); ++i) {
+            mats.push_back(strided_to_mat(data + i * batch.strides(0),
+                                          static_cast<int>(batch.shape(1)),
+                                          static_cast<int>(batch.shape(2)), channels,
+                                          batch.strides(1), batch.strides(2), batch.strides(3)));
+        }
+        return mats;
+    }
+
+    for (py::handle item : py::iter(frames)) {
+        owners.push_back(py::reinterpret_borrow<py::object>(item).cast<py::array_t<uint8_t>>());
+        mats.push_back(numpy_to_mat(owners.back()));
+    }
+    return mats;
+}
+
+void check_same_shape(const cv::Mat& a, const cv::Mat& b) {
+    if (a.size() != b.size() || a.type() != b.type()) {
+        throw std::invalid_argument("Frames must have the same shape");
+    }
+}
+
 PYBIND11_MODULE(video_processor, m) {
     m.doc() = "Video processing optimization module"; // optional module docstring
     
@@ -30,38 +100,281 @@ PYBIND11_MODULE(video_processor, m) {
         .def_readwrite("height", &video_optimizer::VideoProcessor::CompressionParams::height)
         .def_readwrite("preset", &video_optimizer::VideoProcessor::CompressionParams::preset)
         .def_readwrite("target_quality", &video_optimizer::VideoProcessor::CompressionParams::target_quality)
+        .def_readwrite("crf", &video_optimizer::VideoProcessor::CompressionParams::crf)
         .def("__repr__", [](const video_optimizer::VideoProcessor::CompressionParams& p) {
             return "CompressionParams(bitrate=" + std::to_string(p.bitrate) + 
                    ", width=" + std::to_string(p.width) + 
                    ", height=" + std::to_string(p.height) + 
                    ", preset='" + p.preset + "'" +
-                   ", target_quality=" + std::to_string(p.target_quality) + ")";
+                   ", target_quality=" + std::to_string(p.target_quality) +
+                   ", crf=" + std::to_string(p.crf) + ")";
         });
     
-    py::class_<video_optimizer::VideoProcessor>(m, "VideoProcessor")
+    py::enum_<video_optimizer::SSIMWindow>(m, "SSIMWindow")
+        .value("GAUSSIAN", video_optimizer::SSIMWindow::Gaussian)
+        .value("BOX", video_optimizer::SSIMWindow::Box);
+    
+    using MetricsOptions = video_optimizer::MetricsOptions;
+    py::class_<MetricsOptions>(m, "MetricsOptions")
+        .def(py::init([](bool luma_only, video_optimizer::SSIMWindow window, int scales, int downscale) {
+            MetricsOptions options;
+            options.luma_only = luma_only;
+            options.window = window;
+            options.scales = scales;
+            options.downscale = downscale;
+            return options;
+        }), py::arg("luma_only") = false, py::arg("window") = video_optimizer::SSIMWindow::Gaussian,
+            py::arg("scales") = 1, py::arg("downscale") = 1)
+        .def_readwrite("luma_only", &MetricsOptions::luma_only)
+        .def_readwrite("window", &MetricsOptions::window)
+        .def_readwrite("scales", &MetricsOptions::scales)
+        .def_readwrite("downscale", &MetricsOptions::downscale)
+        .def("__repr__", [](const MetricsOptions& o) {
+            return std::string("MetricsOptions(luma_only=") + (o.luma_only ? "True" : "False") +
+                   ", window=" + (o.window == video_optimizer::SSIMWindow::Box ? "BOX" : "GAUSSIAN") +
+                   ", scales=" + std::to_string(o.scales) +
+                   ", downscale=" + std::to_string(o.downscale) + ")";
+        });
+    
+    // Keeps its buffers between calls; use one instance per thread
+    py::class_<video_optimizer::QualityMetrics>(m, "QualityMetrics")
+        .def(py::init<const MetricsOptions&>(), py::arg("options") = MetricsOptions())
+        .def_property_readonly("options", &video_optimizer::QualityMetrics::options)
+        .def("psnr", [](video_optimizer::QualityMetrics& self,
+                        const py::array_t<uint8_t>& original,
+                        const py::array_t<uint8_t>& compressed) {
+            cv::Mat orig = numpy_to_mat(original);
+            cv::Mat comp = numpy_to_mat(compressed);
+            check_same_shape(orig, comp);
+            py::gil_scoped_release release;
+            return self.psnr(orig, comp);
+        })
+        .def("psnr_channels", [](video_optimizer::QualityMetrics& self,
+                                 const py::array_t<uint8_t>& original,
+                                 const py::array_t<uint8_t>& compressed) {
+            cv::Mat orig = numpy_to_mat(original);
+            cv::Mat comp = numpy_to_mat(compressed);
+            check_same_shape(orig, comp);
+            py::gil_scoped_release release;
+            return self.psnrPerChannel(orig, comp);
+        })
+        .def("ssim", [](video_optimizer::QualityMetrics& self,
+                        const py::array_t<uint8_t>& original,
+                        const py::array_t<uint8_t>& compressed) {
+            cv::Mat orig = numpy_to_mat(original);
+            cv::Mat comp = numpy_to_mat(compressed);
+            check_same_shape(orig, comp);
+            py::gil_scoped_release release;
+            return self.ssim(orig, comp);
+        });
+    
+    using SegmentComplexity = video_optimizer::VideoProcessor::SegmentComplexity;
+    py::class_<SegmentComplexity>(m, "SegmentComplexity")
         .def(py::init<>())
-        .def("analyze_frame", [](video_optimizer::VideoProcessor& self, py::array_t<uint8_t>& input) {
+        .def_readwrite("start_frame", &SegmentComplexity::start_frame)
+        .def_readwrite("end_frame", &SegmentComplexity::end_frame)
+        .def_readwrite("start_time", &SegmentComplexity::start_time)
+        .def_readwrite("end_time", &SegmentComplexity::end_time)
+        .def_readwrite("starts_with_cut", &SegmentComplexity::starts_with_cut)
+        .def_readwrite("spatial_information", &SegmentComplexity::spatial_information)
+        .def_readwrite("temporal_information", &SegmentComplexity::temporal_information)
+        .def_readwrite("motion", &SegmentComplexity::motion)
+        .def_readwrite("motion_residual", &SegmentComplexity::motion_residual)
+        .def_readwrite("texture_contrast", &SegmentComplexity::texture_contrast)
+        .def_readwrite("complexity", &SegmentComplexity::complexity)
+        .def("__repr__", [](const SegmentComplexity& s) {
+            return "SegmentComplexity(frames=" + std::to_string(s.start_frame) + "-" +
+                   std::to_string(s.end_frame) +
+                   ", complexity=" + std::to_string(s.complexity) + ")";
+        });
+    
+    py::class_<video_optimizer::VideoProcessor>(m, "VideoProcessor")
+        .def(py::init<const std::string&>(), py::arg("rate_quality_model") = std::string())
+        .def("load_rate_quality_model", &video_optimizer::VideoProcessor::loadRateQualityModel,
+             py::arg("path"))
+        .def_property_readonly("has_rate_quality_model",
+                               &video_optimizer::VideoProcessor::hasRateQualityModel)
+        .def_property_readonly_static("num_content_features", [](py::object) {
+            return video_optimizer::VideoProcessor::kContentFeatureCount;
+        })
+        .def("predict_rate_quality", [](const video_optimizer::VideoProcessor& self,
+                                       const py::array_t<float, py::array::c_style | py::array::forcecast>& content,
+                                       const py::array_t<float, py::array::c_style | py::array::forcecast>& crfs,
+                                       const py::array_t<float, py::array::c_style | py::array::forcecast>& scales) {
+            using video_optimizer::VideoProcessor;
+            if (content.size() != VideoProcessor::kContentFeatureCount) {
+                throw std::invalid_argument("content must hold num_content_features values");
+            }
+            if (crfs.size() != scales.size()) {
+                throw std::invalid_argument("crfs and scales must have the same length");
+            }
+            std::vector<VideoProcessor::RateQualityCandidate> candidates(crfs.size());
+            for (py::ssize_t i = 0; i < crfs.size(); ++i) {
+                candidates[i] = {crfs.data()[i], scales.data()[i]};
+            }
+            std::vector<VideoProcessor::RateQualityPrediction> predictions;
+            {
+                py::gil_scoped_release release;
+                self.predictRateQuality(content.data(), candidates, predictions);
+            }
+
+            py::array_t<float> ssim(predictions.size());
+            py::array_t<float> bits_per_pixel(predictions.size());
+            for (size_t i = 0; i < predictions.size(); ++i) {
+                ssim.mutable_data()[i] = predictions[i].ssim;
+                bits_per_pixel.mutable_data()[i] = predictions[i].bits_per_pixel;
+            }
+            py::dict result;
+            result["ssim"] = ssim;
+            result["bits_per_pixel"] = bits_per_pixel;
+            return result;
+        }, py::arg("content"), py::arg("crfs"), py::arg("scales"))
+        .def("analyze_frame", [](video_optimizer::VideoProcessor& self, const py::array_t<uint8_t>& input) {
             cv::Mat frame = numpy_to_mat(input);
+            py::gil_scoped_release release;
             return self.analyzeFrame(frame);
         })
+        .def("analyze_frames", [](video_optimizer::VideoProcessor& self, const py::object& frames) {
+            std::vector<py::array_t<uint8_t>> owners;
+            std::vector<cv::Mat> mats = frames_to_mats(frames, owners);
+
+            const py::ssize_t count = static_cast<py::ssize_t>(mats.size());
+            py::array_t<float> result({count, static_cast<py::ssize_t>(video_optimizer::VideoProcessor::kFrameFeatureCount)});
+            cv::Mat features(static_cast<int>(count), video_optimizer::VideoProcessor::kFrameFeatureCount,
+                             CV_32F, result.mutable_data());
+            {
+                py::gil_scoped_release release;
+                self.analyzeFrames(mats, features);
+            }
+            return result;
+        }, py::arg("frames"))
+        .def_property_readonly_static("num_features", [](py::object) {
+            return video_optimizer::VideoProcessor::kFrameFeatureCount;
+        })
         .def("calculate_psnr", [](video_optimizer::VideoProcessor& self, 
-                                 py::array_t<uint8_t>& original,
-                                 py::array_t<uint8_t>& compressed) {
+                                 const py::array_t<uint8_t>& original,
+                                 const py::array_t<uint8_t>& compressed) {
             cv::Mat orig = numpy_to_mat(original);
             cv::Mat comp = numpy_to_mat(compressed);
+            check_same_shape(orig, comp);
+            py::gil_scoped_release release;
             return self.calculatePSNR(orig, comp);
         })
         .def("calculate_ssim", [](video_optimizer::VideoProcessor& self,
-                                 py::array_t<uint8_t>& original,
-                                 py::array_t<uint8_t>& compressed) {
+                                 const py::array_t<uint8_t>& original,
+                                 const py::array_t<uint8_t>& compressed) {
             cv::Mat orig = numpy_to_mat(original);
             cv::Mat comp = numpy_to_mat(compressed);
+            check_same_shape(orig, comp);
+            py::gil_scoped_release release;
             return self.calculateSSIM(orig, comp);
         })
         .def("optimize_parameters", [](video_optimizer::VideoProcessor& self,
-                                     py::array_t<uint8_t>& frame,
+                                     const py::array_t<uint8_t>& frame,
                                      float target_quality) {
             cv::Mat input = numpy_to_mat(frame);
+            py::gil_scoped_release release;
             return self.optimizeParameters(input, target_quality);
-        });
+        })
+        .def("optimize_parameters", [](video_optimizer::VideoProcessor& self,
+                                     const SegmentComplexity& segment,
+                                     int width, int height, double fps,
+                                     float target_quality) {
+            py::gil_scoped_release release;
+            return self.optimizeParameters(segment, width, height, fps, target_quality);
+        }, py::arg("segment"), py::arg("width"), py::arg("height"), py::arg("fps"),
+           py::arg("target_quality"))
+        .def("analyze_video", [](video_optimizer::VideoProcessor& self,
+                                const std::string& path,
+                                int analysis_width,
+                                int frame_step,
+                                int max_frames,
+                                int block_size,
+                                int search_range,
+                                float scene_threshold,
+                                double segment_seconds) {
+            video_optimizer::VideoProcessor::TemporalOptions options;
+            options.analysis_width = analysis_width;
+            options.frame_step = frame_step;
+            options.max_frames = max_frames;
+            options.block_size = block_size;
+            options.search_range = search_range;
+            options.scene_threshold = scene_threshold;
+            options.segment_seconds = segment_seconds;
+
+            video_optimizer::VideoProcessor::TemporalProfile profile;
+            {
+                py::gil_scoped_release release;
+                profile = self.analyzeVideo(path, options);
+            }
+
+            py::dict result;
+            result["fps"] = profile.fps;
+            result["width"] = profile.width;
+            result["height"] = profile.height;
+            result["frame_indices"] = py::array_t<int>(profile.frame_indices.size(),
+                                                       profile.frame_indices.data());
+            result["spatial_information"] = py::array_t<float>(profile.spatial_information.size(),
+                                                               profile.spatial_information.data());
+            result["temporal_information"] = py::array_t<float>(profile.temporal_information.size(),
+                                                                profile.temporal_information.data());
+            result["motion"] = py::array_t<float>(profile.motion.size(), profile.motion.data());
+            result["motion_residual"] = py::array_t<float>(profile.motion_residual.size(),
+                                                           profile.motion_residual.data());
+            result["texture_contrast"] = py::array_t<float>(profile.texture_contrast.size(),
+                                                            profile.texture_contrast.data());
+            result["scene_cuts"] = profile.scene_cuts;
+            result["segments"] = profile.segments;
+            return result;
+        }, py::arg("path"), py::arg("analysis_width") = 320, py::arg("frame_step") = 1,
+           py::arg("max_frames") = 0, py::arg("block_size") = 16, py::arg("search_range") = 8,
+           py::arg("scene_threshold") = 0.4f, py::arg("segment_seconds") = 2.0)
+        .def("compare_videos", [](video_optimizer::VideoProcessor& self,
+                                 const std::string& reference_path,
+                                 const std::string& distorted_path,
+                                 int batch_size,
+                                 int frame_step,
+                                 int max_frames,
+                                 const MetricsOptions& metrics) {
+            video_optimizer::VideoProcessor::ComparisonOptions options;
+            options.batch_size = batch_size;
+            options.frame_step = frame_step;
+            options.max_frames = max_frames;
+            options.metrics = metrics;
+
+            video_optimizer::VideoProcessor::VideoComparison comparison;
+            {
+                py::gil_scoped_release release;
+                comparison = self.compareVideos(reference_path, distorted_path, options);
+            }
+
+            py::dict result;
+            result["frame_indices"] = py::array_t<int>(comparison.frame_indices.size(),
+                                                       comparison.frame_indices.data());
+            result["psnr"] = py::array_t<float>(comparison.psnr.size(), comparison.psnr.data());
+            result["ssim"] = py::array_t<float>(comparison.ssim.size(), comparison.ssim.data());
+            result["frames_compared"] = comparison.psnr.size();
+            result["reference_frames"] = comparison.reference_frames;
+            result["distorted_frames"] = comparison.distorted_frames;
+            result["psnr_mean"] = comparison.psnr_mean;
+            result["psnr_min"] = comparison.psnr_min;
+            result["ssim_mean"] = comparison.ssim_mean;
+            result["ssim_min"] = comparison.ssim_min;
+            return result;
+        }, py::arg("reference_path"), py::arg("distorted_path"),
+           py::arg("batch_size") = 32, py::arg("frame_step") = 1, py::arg("max_frames") = 0,
+           py::arg("metrics") = MetricsOptions())
+        .def_static("stats", []() {
+            // {call: {"calls", "frames", "seconds"}}, summed over every instance
+            py::dict result;
+            for (const auto& entry : video_optimizer::VideoProcessor::stats()) {
+                py::dict counters;
+                counters["calls"] = entry.second.calls;
+                counters["frames"] = entry.second.frames;
+                counters["seconds"] = entry.second.seconds;
+                result[py::str(entry.first)] = counters;
+            }
+            return result;
+        })
+        .def_static("reset_stats", &video_optimizer::VideoProcessor::resetStats);
 }
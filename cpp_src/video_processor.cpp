@@ -1,7 +1,15 @@
 #include "video_processor.hpp"
 #include <cmath>
+#include <cstdlib>
+#include <cstring>
+#include <fstream>
+#include <limits>
 #include <algorithm>
+#include <atomic>
+#include <chrono>
 #include <numeric>
+#include <future>
+#include <stdexcept>
 
 using std::vector;
 using std::string;
@@ -11,100 +19,777 @@ using std::accumulate;
 
 namespace video_optimizer {
 
-VideoProcessor::VideoProcessor() {
-    // Initialize model weights (in practice, these would be loaded from a file)
-    model_weights_ = vector<float>(128, 1.0f);
+namespace {
+
+enum class Call { AnalyzeFrame, AnalyzeFrames, PSNR, SSIM, CompareVideos, AnalyzeVideo, Count };
+
+const char* const kCallNames[] = {
+    "analyze_frame", "analyze_frames", "calculate_psnr", "calculate_ssim", "compare_videos", "analyze_video",
+};
+
+struct CallCounter {
+    std::atomic<uint64_t> calls{0};
+    std::atomic<uint64_t> frames{0};
+    std::atomic<uint64_t> nanoseconds{0};
+};
+
+CallCounter call_counters[static_cast<int>(Call::Count)];
+
+// Adds the wall time of its scope, and the frames it was told about, to a counter
+class CallTimer {
+public:
+    explicit CallTimer(Call call, uint64_t frames = 1)
+        : counter_(call_counters[static_cast<int>(call)]), frames_(frames),
+          started_(std::chrono::steady_clock::now()) {}
+
+    ~CallTimer() {
+        auto elapsed = std::chrono::steady_clock::now() - started_;
+        counter_.calls.fetch_add(1, std::memory_order_relaxed);
+        counter_.frames.fetch_add(frames_, std::memory_order_relaxed);
+        counter_.nanoseconds.fetch_add(
+            std::chrono::duration_cast<std::chrono::nanoseconds>(elapsed).count(),
+            std::memory_order_relaxed);
+    }
+
+    void setFrames(uint64_t frames) { frames_ = frames; }
+
+private:
+    CallCounter& counter_;
+    uint64_t frames_;
+    std::chrono::steady_clock::time_point started_;
+};
+
+} // namespace
+
+std::map<string, VideoProcessor::CallStats> VideoProcessor::stats() {
+    std::map<string, CallStats> result;
+    for (int i = 0; i < static_cast<int>(Call::Count); ++i) {
+        CallStats& entry = result[kCallNames[i]];
+        entry.calls = call_counters[i].calls.load(std::memory_order_relaxed);
+        entry.frames = call_counters[i].frames.load(std::memory_order_relaxed);
+        entry.seconds = call_counters[i].nanoseconds.load(std::memory_order_relaxed) * 1e-9;
+    }
+    return result;
+}
+
+void VideoProcessor::resetStats() {
+    for (CallCounter& counter : call_counters) {
+        counter.calls.store(0, std::memory_order_relaxed);
+        counter.frames.store(0, std::memory_order_relaxed);
+        counter.nanoseconds.store(0, std::memory_order_relaxed);
+    }
+}
+
+VideoProcessor::VideoProcessor(const string& rate_quality_model_path) {
+    if (!rate_quality_model_path.empty()) {
+        loadRateQualityModel(rate_quality_model_path);
+    }
 }
 
 VideoProcessor::~VideoProcessor() = default;
 
 vector<float> VideoProcessor::analyzeFrame(const cv::Mat& frame) {
-    // Keep original frame for edge detection
-    working_frame_ = frame.clone();
-    
-    // Extract features
-    return extractFeatures(working_frame_);
+    CallTimer timer(Call::AnalyzeFrame);
+    // The frame may be a view over caller-owned memory; features are read
+    // from it directly, so no copy is kept and concurrent calls are safe.
+    return extractFeatures(frame);
 }
 
-float VideoProcessor::calculatePSNR(const cv::Mat& original, const cv::Mat& compressed) {
-    cv::Mat diff;
-    cv::absdiff(original, compressed, diff);
-    diff.convertTo(diff, CV_32F);
-    diff = diff.mul(diff);
+void VideoProcessor::analyzeFrames(const vector<cv::Mat>& frames, cv::Mat& features) {
+    CallTimer timer(Call::AnalyzeFrames, frames.size());
+    features.create(static_cast<int>(frames.size()), kFrameFeatureCount, CV_32F);
     
-    float mse = static_cast<float>(cv::sum(diff)[0]) / (diff.cols * diff.rows);
+    // Each frame writes its own output row, so frames are processed in parallel
+    cv::parallel_for_(cv::Range(0, static_cast<int>(frames.size())), [&](const cv::Range& range) {
+        for (int i = range.start; i < range.end; ++i) {
+            extractFeatures(frames[i], features.ptr<float>(i));
+        }
+    });
+}
+
+namespace {
+
+float psnrFromMse(double mse) {
     if (mse <= 1e-10) return 100.0f;
-    
-    return 20 * log10(1.0f / sqrt(mse));
+    return static_cast<float>(10.0 * std::log10(255.0 * 255.0 / mse));
 }
 
-float VideoProcessor::calculateSSIM(const cv::Mat& original, const cv::Mat& compressed) {
+} // namespace
+
+QualityMetrics::QualityMetrics(const MetricsOptions& options) : options_(options) {}
+
+cv::Scalar QualityMetrics::squaredErrorSums(const cv::Mat& original, const cv::Mat& compressed,
+                                            int& channels) {
+    const cv::Mat* a = &original;
+    const cv::Mat* b = &compressed;
+    if (options_.luma_only && original.channels() > 1) {
+        int code = original.channels() == 4 ? cv::COLOR_BGRA2GRAY : cv::COLOR_BGR2GRAY;
+        cv::cvtColor(original, gray_a_, code);
+        cv::cvtColor(compressed, gray_b_, code);
+        a = &gray_a_;
+        b = &gray_b_;
+    }
+    // Alpha is not part of the picture
+    channels = min(3, a->channels());
+    cv::absdiff(*a, *b, difference_);
+    difference_.convertTo(squared_, CV_32F);
+    cv::multiply(squared_, squared_, squared_);
+    return cv::sum(squared_);
+}
+
+float QualityMetrics::psnr(const cv::Mat& original, const cv::Mat& compressed) {
+    int channels = 0;
+    cv::Scalar sums = squaredErrorSums(original, compressed, channels);
+    double total = 0.0;
+    for (int c = 0; c < channels; ++c) {
+        total += sums[c];
+    }
+    return psnrFromMse(total / (static_cast<double>(original.total()) * channels));
+}
+
+vector<float> QualityMetrics::psnrPerChannel(const cv::Mat& original, const cv::Mat& compressed) {
+    int channels = 0;
+    cv::Scalar sums = squaredErrorSums(original, compressed, channels);
+    vector<float> result(channels);
+    for (int c = 0; c < channels; ++c) {
+        result[c] = psnrFromMse(sums[c] / static_cast<double>(original.total()));
+    }
+    return result;
+}
+
+void QualityMetrics::preparePlanes(const cv::Mat& original, const cv::Mat& compressed) {
+    const cv::Mat* a = &original;
+    const cv::Mat* b = &compressed;
+    if (options_.luma_only && original.channels() > 1) {
+        int code = original.channels() == 4 ? cv::COLOR_BGRA2GRAY : cv::COLOR_BGR2GRAY;
+        cv::cvtColor(original, gray_a_, code);
+        cv::cvtColor(compressed, gray_b_, code);
+        a = &gray_a_;
+        b = &gray_b_;
+    }
+    if (options_.downscale > 1) {
+        cv::Size size(max(1, a->cols / options_.downscale), max(1, a->rows / options_.downscale));
+        cv::resize(*a, small_a_, size, 0, 0, cv::INTER_AREA);
+        cv::resize(*b, small_b_, size, 0, 0, cv::INTER_AREA);
+        a = &small_a_;
+        b = &small_b_;
+    }
+    if (a->channels() == 1) {
+        planes_a_.assign(1, *a);
+        planes_b_.assign(1, *b);
+    } else if (original.channels() == 4) {
+        // Alpha is not part of the picture
+        planes_a_.resize(3);
+        planes_b_.resize(3);
+        for (int c = 0; c < 3; ++c) {
+            cv::extractChannel(*a, planes_a_[c], c);
+            cv::extractChannel(*b, planes_b_[c], c);
+        }
+    } else {
+        cv::split(*a, planes_a_);
+        cv::split(*b, planes_b_);
+    }
+}
+
+void QualityMetrics::ssimPlane(const cv::Mat& a, const cv::Mat& b, ScaleBuffers& buffers,
+                               double& ssim, double& cs) {
     const float C1 = 6.5025f;  // (0.01 * 255)^2
     const float C2 = 58.5225f; // (0.03 * 255)^2
-    
-    cv::Mat img1, img2;
-    original.convertTo(img1, CV_32F);
-    compressed.convertTo(img2, CV_32F);
-    
-    cv::Mat mu1, mu2;
-    cv::GaussianBlur(img1, mu1, cv::Size(11, 11), 1.5);
-    cv::GaussianBlur(img2, mu2, cv::Size(11, 11), 1.5);
-    
-    cv::Mat mu1_2 = mu1.mul(mu1);
-    cv::Mat mu2_2 = mu2.mul(mu2);
-    cv::Mat mu1_mu2 = mu1.mul(mu2);
-    
-    cv::Mat sigma1_2, sigma2_2, sigma12;
-    cv::GaussianBlur(img1.mul(img1), sigma1_2, cv::Size(11, 11), 1.5);
-    cv::GaussianBlur(img2.mul(img2), sigma2_2, cv::Size(11, 11), 1.5);
-    cv::GaussianBlur(img1.mul(img2), sigma12, cv::Size(11, 11), 1.5);
-    
-    sigma1_2 -= mu1_2;
-    sigma2_2 -= mu2_2;
-    sigma12 -= mu1_mu2;
-    
-    cv::Mat ssim_map = ((2 * mu1_mu2 + C1).mul(2 * sigma12 + C2)) /
-                       ((mu1_2 + mu2_2 + C1).mul(sigma1_2 + sigma2_2 + C2));
-    
-    return static_cast<float>(cv::mean(ssim_map)[0]);
+
+    // Both images and all three second moments are filtered as two
+    // interleaved images, so each pass over the window is shared
+    buffers.means.create(a.size(), CV_32FC2);
+    buffers.moments.create(a.size(), CV_32FC3);
+    for (int r = 0; r < a.rows; ++r) {
+        const uchar* pa = a.ptr<uchar>(r);
+        const uchar* pb = b.ptr<uchar>(r);
+        float* means = buffers.means.ptr<float>(r);
+        float* moments = buffers.moments.ptr<float>(r);
+        for (int c = 0; c < a.cols; ++c) {
+            const float x = pa[c];
+            const float y = pb[c];
+            means[2 * c] = x;
+            means[2 * c + 1] = y;
+            moments[3 * c] = x * x;
+            moments[3 * c + 1] = y * y;
+            moments[3 * c + 2] = x * y;
+        }
+    }
+
+    if (options_.window == SSIMWindow::Box) {
+        cv::boxFilter(buffers.means, buffers.means_blurred, -1, cv::Size(8, 8));
+        cv::boxFilter(buffers.moments, buffers.moments_blurred, -1, cv::Size(8, 8));
+    } else {
+        cv::GaussianBlur(buffers.means, buffers.means_blurred, cv::Size(11, 11), 1.5);
+        cv::GaussianBlur(buffers.moments, buffers.moments_blurred, cv::Size(11, 11), 1.5);
+    }
+
+    double ssim_sum = 0.0;
+    double cs_sum = 0.0;
+    for (int r = 0; r < a.rows; ++r) {
+        const float* means = buffers.means_blurred.ptr<float>(r);
+        const float* moments = buffers.moments_blurred.ptr<float>(r);
+        double ssim_row = 0.0;
+        double cs_row = 0.0;
+        for (int c = 0; c < a.cols; ++c) {
+            const float mu1 = means[2 * c];
+            const float mu2 = means[2 * c + 1];
+            const float sigma1_2 = moments[3 * c] - mu1 * mu1;
+            const float sigma2_2 = moments[3 * c + 1] - mu2 * mu2;
+            const float sigma12 = moments[3 * c + 2] - mu1 * mu2;
+            const float contrast_structure = (2 * sigma12 + C2) / (sigma1_2 + sigma2_2 + C2);
+            const float luminance = (2 * mu1 * mu2 + C1) / (mu1 * mu1 + mu2 * mu2 + C1);
+            ssim_row += luminance * contrast_structure;
+            cs_row += contrast_structure;
+        }
+        ssim_sum += ssim_row;
+        cs_sum += cs_row;
+    }
+    const double count = static_cast<double>(a.total());
+    ssim = ssim_sum / count;
+    cs = cs_sum / count;
 }
 
-VideoProcessor::CompressionParams VideoProcessor::optimizeParameters(const cv::Mat& frame, float target_quality) {
-    CompressionParams params;
-    
-    // Extract features from the frame
-    vector<float> features = analyzeFrame(frame);
-    
-    // Predict quality for different parameter combinations
-    float best_quality_diff = std::numeric_limits<float>::max();
-    
-    // Grid search over parameters
-    for (int bitrate : {1000000, 2000000, 4000000, 8000000}) {
-        for (float scale : {0.5f, 0.75f, 1.0f}) {
-            int width = static_cast<int>(frame.cols * scale);
-            int height = static_cast<int>(frame.rows * scale);
-            
-            // Predict quality for this parameter combination
-            float predicted_quality = predictQuality(features);
-            float quality_diff = std::abs(predicted_quality - target_quality);
-            
-            if (quality_diff < best_quality_diff) {
-                best_quality_diff = quality_diff;
-                params.bitrate = bitrate;
-                params.width = width;
-                params.height = height;
-                params.preset = "medium";
-                params.target_quality = predicted_quality;
+double QualityMetrics::ssimOfPlanes(const cv::Mat& a, const cv::Mat& b) {
+    // Scale weights from Wang, Simoncelli and Bovik's multi-scale SSIM
+    static const double kScaleWeights[5] = {0.0448, 0.2856, 0.3001, 0.2363, 0.1333};
+    const int scales = min(5, max(1, options_.scales));
+    if (static_cast<int>(scales_.size()) < scales) {
+        scales_.resize(scales);
+    }
+
+    const cv::Mat* x = &a;
+    const cv::Mat* y = &b;
+    double ssim = 0.0, cs = 0.0;
+    double product = 1.0, weight_sum = 0.0;
+    int scale = 0;
+    while (true) {
+        ssimPlane(*x, *y, scales_[scale], ssim, cs);
+        // Scales that would be smaller than the window are skipped and the
+        // remaining weights renormalized
+        if (scale + 1 == scales || x->cols / 2 < 11 || x->rows / 2 < 11) {
+            break;
+        }
+        product *= std::pow(max(cs, 0.0), kScaleWeights[scale]);
+        weight_sum += kScaleWeights[scale];
+
+        ScaleBuffers& next = scales_[scale + 1];
+        cv::resize(*x, next.a, cv::Size(x->cols / 2, x->rows / 2), 0, 0, cv::INTER_AREA);
+        cv::resize(*y, next.b, cv::Size(y->cols / 2, y->rows / 2), 0, 0, cv::INTER_AREA);
+        x = &next.a;
+        y = &next.b;
+        ++scale;
+    }
+    if (scales == 1) {
+        return ssim;
+    }
+    product *= std::pow(max(ssim, 0.0), kScaleWeights[scale]);
+    weight_sum += kScaleWeights[scale];
+    return std::pow(product, 1.0 / weight_sum);
+}
+
+float QualityMetrics::ssim(const cv::Mat& original, const cv::Mat& compressed) {
+    preparePlanes(original, compressed);
+    double total = 0.0;
+    for (size_t c = 0; c < planes_a_.size(); ++c) {
+        total += ssimOfPlanes(planes_a_[c], planes_b_[c]);
+    }
+    return static_cast<float>(total / planes_a_.size());
+}
+
+float VideoProcessor::calculatePSNR(const cv::Mat& original, const cv::Mat& compressed) {
+    CallTimer timer(Call::PSNR);
+    // One set of metric buffers per thread, reused across calls
+    thread_local QualityMetrics metrics;
+    return metrics.psnr(original, compressed);
+}
+
+float VideoProcessor::calculateSSIM(const cv::Mat& original, const cv::Mat& compressed) {
+    CallTimer timer(Call::SSIM);
+    thread_local QualityMetrics metrics;
+    return metrics.ssim(original, compressed);
+}
+
+namespace {
+
+// Decode up to limit sampled frames from capture into the reusable batch
+// buffers. Skipped frames are only grabbed, never converted to BGR.
+int readFrameBatch(cv::VideoCapture& capture, vector<cv::Mat>& batch, int& position,
+                   int frame_step, int limit, vector<int>* indices) {
+    int count = 0;
+    while (count < limit && capture.grab()) {
+        if (position % frame_step == 0) {
+            capture.retrieve(batch[count]);
+            if (indices) {
+                indices->push_back(position);
             }
+            ++count;
         }
+        ++position;
     }
-    
+    return count;
+}
+
+// Gray-level co-occurrence statistics of an 8-bit image quantized to 16
+// levels, over right and lower neighbours counted symmetrically. Writes
+// contrast, homogeneity, energy and correlation.
+void glcmFeatures(const cv::Mat& gray, float* out) {
+    const int levels = 16;
+    double counts[levels][levels] = {};
+    for (int r = 0; r < gray.rows; ++r) {
+        const uchar* row = gray.ptr<uchar>(r);
+        const uchar* below = r + 1 < gray.rows ? gray.ptr<uchar>(r + 1) : nullptr;
+        for (int c = 0; c < gray.cols; ++c) {
+            int a = row[c] >> 4;
+            if (c + 1 < gray.cols) {
+                int b = row[c + 1] >> 4;
+                counts[a][b] += 1.0;
+                counts[b][a] += 1.0;
+            }
+            if (below) {
+                int b = below[c] >> 4;
+                counts[a][b] += 1.0;
+                counts[b][a] += 1.0;
+            }
+        }
+    }
+
+    double total = 0.0;
+    for (int i = 0; i < levels; ++i) {
+        for (int j = 0; j < levels; ++j) {
+            total += counts[i][j];
+        }
+    }
+    if (total == 0.0) {
+        out[0] = 0.0f;
+        out[1] = 1.0f;
+        out[2] = 1.0f;
+        out[3] = 1.0f;
+        return;
+    }
+
+    // The matrix is symmetric, so both marginals share one mean and variance
+    double mean = 0.0;
+    for (int i = 0; i < levels; ++i) {
+        for (int j = 0; j < levels; ++j) {
+            mean += i * counts[i][j] / total;
+        }
+    }
+    double contrast = 0.0, homogeneity = 0.0, energy = 0.0, variance = 0.0, covariance = 0.0;
+    for (int i = 0; i < levels; ++i) {
+        for (int j = 0; j < levels; ++j) {
+            double p = counts[i][j] / total;
+            contrast += p * (i - j) * (i - j);
+            homogeneity += p / (1.0 + std::abs(i - j));
+            energy += p * p;
+            variance += p * (i - mean) * (i - mean);
+            covariance += p * (i - mean) * (j - mean);
+        }
+    }
+    out[0] = static_cast<float>(contrast);
+    out[1] = static_cast<float>(homogeneity);
+    out[2] = static_cast<float>(std::sqrt(energy));
+    out[3] = variance > 0.0 ? static_cast<float>(covariance / variance) : 1.0f;
+}
+
+// Block motion between two same-size 8-bit frames using a three-step search
+// around the zero vector. Returns the mean motion vector length and the mean
+// absolute motion-compensated error (0-1) over all blocks.
+void blockMotion(const cv::Mat& previous, const cv::Mat& current, int block_size, int search_range,
+                 float& motion, float& residual) {
+    const int block_rows = current.rows / block_size;
+    const int block_cols = current.cols / block_size;
+    if (block_rows == 0 || block_cols == 0) {
+        motion = 0.0f;
+        residual = static_cast<float>(cv::norm(previous, current, cv::NORM_L1) /
+                                      (255.0 * current.total()));
+        return;
+    }
+
+    vector<double> row_motion(block_rows, 0.0);
+    vector<double> row_error(block_rows, 0.0);
+    cv::parallel_for_(cv::Range(0, block_rows), [&](const cv::Range& range) {
+        for (int by = range.start; by < range.end; ++by) {
+            for (int bx = 0; bx < block_cols; ++bx) {
+                const int x = bx * block_size;
+                const int y = by * block_size;
+                const cv::Mat block = current(cv::Rect(x, y, block_size, block_size));
+                auto sad = [&](int dx, int dy) {
+                    return cv::norm(block, previous(cv::Rect(x + dx, y + dy, block_size, block_size)),
+                                    cv::NORM_L1);
+                };
+
+                int best_dx = 0, best_dy = 0;
+                double best = sad(0, 0);
+                for (int step = max(1, search_range / 2); step >= 1; step /= 2) {
+                    const int center_dx = best_dx, center_dy = best_dy;
+                    for (int sy = -1; sy <= 1; ++sy) {
+                        for (int sx = -1; sx <= 1; ++sx) {
+                            int dx = center_dx + sx * step;
+                            int dy = center_dy + sy * step;
+                            if ((sx == 0 && sy == 0) || std::abs(dx) > search_range ||
+                                std::abs(dy) > search_range || x + dx < 0 || y + dy < 0 ||
+                                x + dx + block_size > previous.cols ||
+                                y + dy + block_size > previous.rows) {
+                                continue;
+                            }
+                            double cost = sad(dx, dy);
+                            if (cost < best) {
+                                best = cost;
+                                best_dx = dx;
+                                best_dy = dy;
+                            }
+                        }
+                    }
+                }
+                row_motion[by] += std::sqrt(static_cast<double>(best_dx * best_dx + best_dy * best_dy));
+                row_error[by] += best;
+            }
+        }
+    });
+
+    const double blocks = static_cast<double>(block_rows) * block_cols;
+    motion = static_cast<float>(accumulate(row_motion.begin(), row_motion.end(), 0.0) / blocks);
+    residual = static_cast<float>(accumulate(row_error.begin(), row_error.end(), 0.0) /
+                                  (blocks * block_size * block_size * 255.0));
+}
+
+// Combined 0-1 coding difficulty of a segment. Detail (SI) and temporal
+// change (TI) are normalized by typical values for natural video; the
+// motion-compensated error weighs most because it is what the encoder
+// cannot predict.
+float segmentComplexity(const VideoProcessor::SegmentComplexity& segment) {
+    float spatial = min(1.0f, segment.spatial_information / 80.0f);
+    float temporal = min(1.0f, segment.temporal_information / 40.0f);
+    float unpredictable = min(1.0f, segment.motion_residual * 8.0f);
+    return 0.35f * spatial + 0.25f * temporal + 0.4f * unpredictable;
+}
+
+} // namespace
+
+VideoProcessor::VideoComparison VideoProcessor::compareVideos(const string& reference_path,
+                                                              const string& distorted_path,
+                                                              const ComparisonOptions& options) {
+    CallTimer timer(Call::CompareVideos, 0);
+    cv::VideoCapture reference(reference_path);
+    if (!reference.isOpened()) {
+        throw std::runtime_error("Could not open reference video: " + reference_path);
+    }
+    cv::VideoCapture distorted(distorted_path);
+    if (!distorted.isOpened()) {
+        throw std::runtime_error("Could not open distorted video: " + distorted_path);
+    }
+
+    VideoComparison result;
+    result.reference_frames = static_cast<int>(reference.get(cv::CAP_PROP_FRAME_COUNT));
+    result.distorted_frames = static_cast<int>(distorted.get(cv::CAP_PROP_FRAME_COUNT));
+
+    const int batch_size = max(1, options.batch_size);
+    const int frame_step = max(1, options.frame_step);
+    vector<cv::Mat> reference_batch(batch_size);
+    vector<cv::Mat> distorted_batch(batch_size);
+
+    int reference_position = 0;
+    int distorted_position = 0;
+    vector<int> batch_indices;
+    while (true) {
+        int limit = batch_size;
+        if (options.max_frames > 0) {
+            limit = min(limit, options.max_frames - static_cast<int>(result.psnr.size()));
+        }
+        if (limit <= 0) {
+            break;
+        }
+
+        // Both streams advance in lock-step, so frame n of one is paired with
+        // frame n of the other. Decode them concurrently.
+        batch_indices.clear();
+        auto distorted_count = std::async(std::launch::async, readFrameBatch,
+                                          std::ref(distorted), std::ref(distorted_batch),
+                                          std::ref(distorted_position), frame_step, limit,
+                                          nullptr);
+        int reference_count = readFrameBatch(reference, reference_batch, reference_position,
+                                             frame_step, limit, &batch_indices);
+        int count = min(reference_count, distorted_count.get());
+        if (count == 0) {
+            break;
+        }
+
+        size_t offset = result.psnr.size();
+        result.psnr.resize(offset + count);
+        result.ssim.resize(offset + count);
+        result.frame_indices.insert(result.frame_indices.end(),
+                                    batch_indices.begin(), batch_indices.begin() + count);
+
+        cv::parallel_for_(cv::Range(0, count), [&](const cv::Range& range) {
+            QualityMetrics metrics(options.metrics);
+            cv::Mat aligned;
+            for (int i = range.start; i < range.end; ++i) {
+                const cv::Mat& ref = reference_batch[i];
+                const cv::Mat* dist = &distorted_batch[i];
+                if (dist->size() != ref.size()) {
+                    cv::resize(*dist, aligned, ref.size(), 0, 0, cv::INTER_AREA);
+                    dist = &aligned;
+                }
+                result.psnr[offset + i] = metrics.psnr(ref, *dist);
+                result.ssim[offset + i] = metrics.ssim(ref, *dist);
+            }
+        });
+
+        if (count < limit) {
+            break;
+        }
+    }
+
+    if (!result.psnr.empty()) {
+        float count = static_cast<float>(result.psnr.size());
+        result.psnr_mean = accumulate(result.psnr.begin(), result.psnr.end(), 0.0f) / count;
+        result.ssim_mean = accumulate(result.ssim.begin(), result.ssim.end(), 0.0f) / count;
+        result.psnr_min = *std::min_element(result.psnr.begin(), result.psnr.end());
+        result.ssim_min = *std::min_element(result.ssim.begin(), result.ssim.end());
+    }
+
+    timer.setFrames(result.psnr.size());
+    return result;
+}
+
+VideoProcessor::TemporalProfile VideoProcessor::analyzeVideo(const string& path,
+                                                             const TemporalOptions& options) {
+    CallTimer timer(Call::AnalyzeVideo, 0);
+    cv::VideoCapture capture(path);
+    if (!capture.isOpened()) {
+        throw std::runtime_error("Could not open video: " + path);
+    }
+
+    TemporalProfile profile;
+    profile.fps = capture.get(cv::CAP_PROP_FPS);
+    if (profile.fps <= 0.0) {
+        profile.fps = 25.0;
+    }
+    const int frame_step = max(1, options.frame_step);
+    const int block_size = max(4, options.block_size);
+
+    // Reusable decode buffers plus a two-frame ring of downscaled luma
+    cv::Mat frame, gray, sobel_x, sobel_y, magnitude, difference;
+    cv::Mat ring[2];
+    cv::Mat histograms[2];
+    int current = 0;
+    bool have_previous = false;
+
+    SegmentComplexity segment;
+    int segment_frames = 0;
+    int segment_transitions = 0;  // frames with a previous frame in the same scene
+    auto close_segment = [&](int end_frame) {
+        if (segment_frames == 0) {
+            return;
+        }
+        const float n = static_cast<float>(segment_frames);
+        const float transitions = static_cast<float>(max(1, segment_transitions));
+        segment.end_frame = end_frame;
+        segment.end_time = end_frame / profile.fps;
+        segment.spatial_information /= n;
+        segment.texture_contrast /= n;
+        segment.temporal_information /= transitions;
+        segment.motion /= transitions;
+        segment.motion_residual /= transitions;
+        segment.complexity = segmentComplexity(segment);
+        profile.segments.push_back(segment);
+        segment = SegmentComplexity();
+        segment_frames = 0;
+        segment_transitions = 0;
+    };
+
+    int position = 0;
+    while (capture.grab()) {
+        const int index = position++;
+        if (index % frame_step != 0) {
+            continue;
+        }
+        if (options.max_frames > 0 && static_cast<int>(profile.frame_indices.size()) >= options.max_frames) {
+            break;
+        }
+        if (!capture.retrieve(frame) || frame.empty()) {
+            break;
+        }
+        if (profile.width == 0) {
+            profile.width = frame.cols;
+            profile.height = frame.rows;
+        }
+
+        if (frame.channels() == 1) {
+            gray = frame;
+        } else {
+            cv::cvtColor(frame, gray, frame.channels() == 4 ? cv::COLOR_BGRA2GRAY : cv::COLOR_BGR2GRAY);
+        }
+        cv::Mat& luma = ring[current];
+        if (options.analysis_width > 0 && gray.cols > options.analysis_width) {
+            int height = max(1, gray.rows * options.analysis_width / gray.cols);
+            cv::resize(gray, luma, cv::Size(options.analysis_width, height), 0, 0, cv::INTER_AREA);
+        } else {
+            gray.copyTo(luma);
+        }
+
+        // Spatial information: spread of the Sobel gradient magnitude
+        cv::Sobel(luma, sobel_x, CV_32F, 1, 0);
+        cv::Sobel(luma, sobel_y, CV_32F, 0, 1);
+        cv::magnitude(sobel_x, sobel_y, magnitude);
+        cv::Scalar mean, stddev;
+        cv::meanStdDev(magnitude, mean, stddev);
+        const float spatial = static_cast<float>(stddev[0]);
+
+        float texture[4];
+        glcmFeatures(luma, texture);
+
+        const int histogram_size = 32;
+        const float range[] = {0.0f, 256.0f};
+        const float* ranges[] = {range};
+        const int channels[] = {0};
+        cv::calcHist(&luma, 1, channels, cv::Mat(), histograms[current], 1, &histogram_size, ranges);
+        cv::normalize(histograms[current], histograms[current], 1.0, 0.0, cv::NORM_L1);
+
+        float temporal = 0.0f, motion = 0.0f, residual = 0.0f;
+        bool cut = false;
+        if (have_previous) {
+            const cv::Mat& previous = ring[1 - current];
+            cv::subtract(luma, previous, difference, cv::noArray(), CV_16S);
+            cv::meanStdDev(difference, mean, stddev);
+            temporal = static_cast<float>(stddev[0]);
+            blockMotion(previous, luma, block_size, max(1, options.search_range), motion, residual);
+            cut = cv::compareHist(histograms[1 - current], histograms[current],
+                                  cv::HISTCMP_BHATTACHARYYA) > options.scene_threshold;
+        }
+
+        profile.frame_indices.push_back(index);
+        profile.spatial_information.push_back(spatial);
+        profile.temporal_information.push_back(temporal);
+        profile.motion.push_back(motion);
+        profile.motion_residual.push_back(residual);
+        profile.texture_contrast.push_back(texture[0]);
+
+        // A cut starts a new segment, as does reaching the segment length
+        const double time = index / profile.fps;
+        if (cut) {
+            profile.scene_cuts.push_back(index);
+        }
+        if (segment_frames > 0 && (cut || time - segment.start_time >= options.segment_seconds)) {
+            close_segment(index);
+        }
+        if (segment_frames == 0) {
+            segment.start_frame = index;
+            segment.start_time = time;
+            segment.starts_with_cut = cut || profile.segments.empty();
+        }
+        segment.spatial_information += spatial;
+        // Change across a cut says nothing about the motion within either scene
+        if (have_previous && !cut) {
+            segment.temporal_information += temporal;
+            segment.motion += motion;
+            segment.motion_residual += residual;
+            ++segment_transitions;
+        }
+        segment.texture_contrast += texture[0];
+        ++segment_frames;
+
+        current = 1 - current;
+        have_previous = true;
+    }
+    if (!profile.frame_indices.empty()) {
+        close_segment(min(position, profile.frame_indices.back() + frame_step));
+    }
+
+    timer.setFrames(profile.frame_indices.size());
+    return profile;
+}
+
+VideoProcessor::CompressionParams VideoProcessor::optimizeParameters(const cv::Mat& frame, float target_quality) {
+    // A single frame has no motion, so only its spatial information is known;
+    // the frame rate is assumed to be 30 fps
+    const double fps = 30.0;
+
+    cv::Mat gray, luma, sobel_x, sobel_y, magnitude;
+    if (frame.channels() == 1) {
+        gray = frame;
+    } else {
+        cv::cvtColor(frame, gray, frame.channels() == 4 ? cv::COLOR_BGRA2GRAY : cv::COLOR_BGR2GRAY);
+    }
+    // At the analysis width of analyzeVideo, so SI values are comparable
+    if (gray.cols > 320) {
+        cv::resize(gray, luma, cv::Size(320, max(1, gray.rows * 320 / gray.cols)), 0, 0, cv::INTER_AREA);
+    } else {
+        luma = gray;
+    }
+    cv::Sobel(luma, sobel_x, CV_32F, 1, 0);
+    cv::Sobel(luma, sobel_y, CV_32F, 0, 1);
+    cv::magnitude(sobel_x, sobel_y, magnitude);
+    cv::Scalar mean, stddev;
+    cv::meanStdDev(magnitude, mean, stddev);
+
+    SegmentComplexity segment;
+    segment.spatial_information = static_cast<float>(stddev[0]);
+    segment.complexity = segmentComplexity(segment);
+    if (!hasRateQualityModel()) {
+        return optimizeParameters(segment, frame.cols, frame.rows, fps, target_quality);
+    }
+
+    float content[kContentFeatureCount];
+    std::fill(content, content + kContentFeatureCount, std::numeric_limits<float>::quiet_NaN());
+    // Scaled like the training frames, which ffmpeg decodes with area scaling
+    cv::Mat analysis_frame = frame;
+    if (frame.cols > kContentAnalysisWidth) {
+        const int height = max(2, static_cast<int>(std::lround(
+            frame.rows * static_cast<double>(kContentAnalysisWidth) / frame.cols / 2.0)) * 2);
+        cv::resize(frame, analysis_frame, cv::Size(kContentAnalysisWidth, height), 0, 0, cv::INTER_AREA);
+    }
+    extractFeatures(analysis_frame, content);
+    content[kFrameFeatureCount] = segment.spatial_information;
+    return chooseParameters(content, frame.cols, frame.rows, fps, target_quality);
+}
+
+VideoProcessor::CompressionParams VideoProcessor::optimizeParameters(const SegmentComplexity& segment,
+                                                                     int width, int height, double fps,
+                                                                     float target_quality) {
+    if (hasRateQualityModel()) {
+        float content[kContentFeatureCount];
+        std::fill(content, content + kContentFeatureCount, std::numeric_limits<float>::quiet_NaN());
+        content[kFrameFeatureCount] = segment.spatial_information;
+        content[kFrameFeatureCount + 1] = segment.temporal_information;
+        content[kFrameFeatureCount + 2] = segment.motion;
+        content[kFrameFeatureCount + 3] = segment.motion_residual;
+        content[kFrameFeatureCount + 4] = segment.complexity;
+        return chooseParameters(content, width, height, fps, target_quality);
+    }
+
+    // Bits per pixel scale with how hard the segment is to predict and with
+    // the quality asked for; 0.03-0.2 bpp spans static slides to high motion
+    // sports in H.264 at good quality.
+    const float quality = min(1.0f, max(0.0f, target_quality));
+    const double bits_per_pixel = (0.03 + 0.17 * segment.complexity) * (0.5 + quality);
+
+    // Fast, unpredictable motion masks detail, so below high quality targets
+    // such segments are coded at reduced resolution rather than starved of bits
+    double scale = 1.0;
+    if (quality < 0.85f && segment.complexity > 0.6f) {
+        scale = 0.75;
+    }
+
+    CompressionParams params;
+    params.width = static_cast<int>(width * scale) / 2 * 2;
+    params.height = static_cast<int>(height * scale) / 2 * 2;
+    params.bitrate = static_cast<int>(bits_per_pixel * params.width * params.height * (fps > 0.0 ? fps : 25.0));
+    params.preset = "medium";
+    params.target_quality = quality;
     return params;
 }
 
 vector<float> VideoProcessor::extractFeatures(const cv::Mat& frame) {
-    vector<float> features;
-    features.reserve(128);  // Pre-allocate space for features
+    // Frame features followed by zero padding up to the model input size
+    vector<float> features(kFeatureVectorSize, 0.0f);
+    extractFeatures(frame, features.data());
+    return features;
+}
+
+void VideoProcessor::extractFeatures(const cv::Mat& frame, float* features) {
+    int index = 0;
     
     // Convert to floating point for statistical features
     cv::Mat float_frame;
@@ -116,34 +801,164 @@ vector<float> VideoProcessor::extractFeatures(const cv::Mat& frame) {
     
     // Add mean and stddev for each channel
     for (int i = 0; i < 3; ++i) {
-        features.push_back(static_cast<float>(mean[i]));
-        features.push_back(static_cast<float>(stddev[i]));
+        features[index++] = static_cast<float>(mean[i]);
+        features[index++] = static_cast<float>(stddev[i]);
     }
     
+    // Grayscale input is used as-is; BGRA drops its alpha channel
+    cv::Mat gray;
+    if (frame.channels() == 3) {
+        cv::cvtColor(frame, gray, cv::COLOR_BGR2GRAY);
+    } else if (frame.channels() == 4) {
+        cv::cvtColor(frame, gray, cv::COLOR_BGRA2GRAY);
+    } else {
+        gray = frame;
+    }
+
     // Edge detection features (using original 8-bit frame)
     cv::Mat edges;
-    cv::Canny(frame, edges, 100, 200);
-    features.push_back(static_cast<float>(cv::countNonZero(edges)) / (frame.rows * frame.cols));
-    
-    // Texture features using GLCM
-    cv::Mat gray;
-    cv::cvtColor(frame, gray, cv::COLOR_BGR2GRAY);
+    cv::Canny(frame.channels() == 4 ? gray : frame, edges, 100, 200);
+    features[index++] = static_cast<float>(cv::countNonZero(edges)) / (frame.rows * frame.cols);
     
-    // Fill remaining features with placeholder values
-    while (features.size() < 128) {
-        features.push_back(0.0f);
+    // Texture features using GLCM, on a reduced copy for large frames
+    if (gray.cols > 512) {
+        cv::Mat reduced;
+        cv::resize(gray, reduced, cv::Size(512, max(1, gray.rows * 512 / gray.cols)), 0, 0, cv::INTER_AREA);
+        glcmFeatures(reduced, features + index);
+    } else {
+        glcmFeatures(gray, features + index);
     }
-    
-    return features;
+    index += 4;
 }
 
-float VideoProcessor::predictQuality(const vector<float>& features) {
-    // Simple weighted sum of features (in practice, this would be a more sophisticated model)
-    float quality = 0.0f;
-    for (size_t i = 0; i < features.size(); ++i) {
-        quality += features[i] * model_weights_[i];
+namespace {
+
+// Weights file written by rate_quality.py (little-endian):
+//   char magic[4] = "VCRQ"; uint32 version, content features, inputs, outputs;
+//   float32 content_mean[content features]; float32 weights[inputs][outputs]
+const char kRateQualityMagic[4] = {'V', 'C', 'R', 'Q'};
+const uint32_t kRateQualityVersion = 1;
+const int kRateQualityInputs = 2 * VideoProcessor::kContentFeatureCount + 4;
+const int kRateQualityOutputs = 2;  // SSIM, log bits per pixel
+
+// Model inputs for one candidate; must match rate_quality.model_inputs:
+// 1, content, q, q^2, log2(scale), content * q with q = crf / 51
+void rateQualityInputs(const float* content, const VideoProcessor::RateQualityCandidate& candidate,
+                       float* inputs) {
+    const int count = VideoProcessor::kContentFeatureCount;
+    const float q = candidate.crf / 51.0f;
+    inputs[0] = 1.0f;
+    for (int i = 0; i < count; ++i) {
+        inputs[1 + i] = content[i];
+        inputs[count + 4 + i] = content[i] * q;
     }
-    return std::min(1.0f, std::max(0.0f, quality));
+    inputs[count + 1] = q;
+    inputs[count + 2] = q * q;
+    inputs[count + 3] = std::log2(max(1e-3f, candidate.scale));
+}
+
+} // namespace
+
+void VideoProcessor::loadRateQualityModel(const string& path) {
+    std::ifstream file(path, std::ios::binary);
+    if (!file) {
+        throw std::runtime_error("Could not open rate-quality model: " + path);
+    }
+    char magic[4];
+    uint32_t header[4];
+    file.read(magic, sizeof(magic));
+    file.read(reinterpret_cast<char*>(header), sizeof(header));
+    if (!file || std::memcmp(magic, kRateQualityMagic, sizeof(magic)) != 0) {
+        throw std::runtime_error("Not a rate-quality model: " + path);
+    }
+    if (header[0] != kRateQualityVersion || header[1] != static_cast<uint32_t>(kContentFeatureCount) ||
+        header[2] != static_cast<uint32_t>(kRateQualityInputs) ||
+        header[3] != static_cast<uint32_t>(kRateQualityOutputs)) {
+        throw std::runtime_error("Rate-quality model " + path + " does not match this build's features");
+    }
+
+    vector<float> content_mean(kContentFeatureCount);
+    cv::Mat weights(kRateQualityInputs, kRateQualityOutputs, CV_32F);
+    file.read(reinterpret_cast<char*>(content_mean.data()), content_mean.size() * sizeof(float));
+    file.read(reinterpret_cast<char*>(weights.ptr<float>()), weights.total() * sizeof(float));
+    if (!file) {
+        throw std::runtime_error("Truncated rate-quality model: " + path);
+    }
+    content_mean_ = std::move(content_mean);
+    rate_quality_weights_ = weights;
+}
+
+void VideoProcessor::predictRateQuality(const float* content, const vector<RateQualityCandidate>& candidates,
+                                        vector<RateQualityPrediction>& predictions) const {
+    if (!hasRateQualityModel()) {
+        throw std::runtime_error("No rate-quality model is loaded");
+    }
+    float known[kContentFeatureCount];
+    for (int i = 0; i < kContentFeatureCount; ++i) {
+        known[i] = std::isnan(content[i]) ? content_mean_[i] : content[i];
+    }
+
+    const int count = static_cast<int>(candidates.size());
+    cv::Mat inputs(count, kRateQualityInputs, CV_32F);
+    for (int i = 0; i < count; ++i) {
+        rateQualityInputs(known, candidates[i], inputs.ptr<float>(i));
+    }
+    cv::Mat outputs;
+    if (count > 0) {
+        cv::gemm(inputs, rate_quality_weights_, 1.0, cv::noArray(), 0.0, outputs);
+    }
+
+    predictions.resize(count);
+    for (int i = 0; i < count; ++i) {
+        const float* row = outputs.ptr<float>(i);
+        predictions[i].ssim = min(1.0f, max(0.0f, row[0]));
+        predictions[i].bits_per_pixel = std::exp(row[1]);
+    }
+}
+
+VideoProcessor::CompressionParams VideoProcessor::chooseParameters(const float* content, int width, int height,
+                                                                   double fps, float target_quality) const {
+    // Every CRF at full, three-quarter and half resolution, predicted at once
+    vector<RateQualityCandidate> candidates;
+    for (float scale : {1.0f, 0.75f, 0.5f}) {
+        for (int crf = 16; crf <= 40; ++crf) {
+            candidates.push_back({static_cast<float>(crf), scale});
+        }
+    }
+    vector<RateQualityPrediction> predictions;
+    predictRateQuality(content, candidates, predictions);
+
+    if (fps <= 0.0) {
+        fps = 25.0;
+    }
+    // The cheapest candidate meeting the target, or the best one if none does
+    int best = -1;
+    int best_quality = 0;
+    double best_bitrate = std::numeric_limits<double>::max();
+    for (size_t i = 0; i < candidates.size(); ++i) {
+        const int out_width = static_cast<int>(width * candidates[i].scale) / 2 * 2;
+        const int out_height = static_cast<int>(height * candidates[i].scale) / 2 * 2;
+        const double bitrate = predictions[i].bits_per_pixel * out_width * out_height * fps;
+        if (predictions[i].ssim >= target_quality && bitrate < best_bitrate) {
+            best = static_cast<int>(i);
+            best_bitrate = bitrate;
+        }
+        if (predictions[i].ssim > predictions[best_quality].ssim) {
+            best_quality = static_cast<int>(i);
+        }
+    }
+    if (best < 0) {
+        best = best_quality;
+    }
+
+    CompressionParams params;
+    params.width = static_cast<int>(width * candidates[best].scale) / 2 * 2;
+    params.height = static_cast<int>(height * candidates[best].scale) / 2 * 2;
+    params.bitrate = static_cast<int>(predictions[best].bits_per_pixel * params.width * params.height * fps);
+    params.preset = "medium";
+    params.target_quality = predictions[best].ssim;
+    params.crf = static_cast<int>(candidates[best].crf);
+    return params;
 }
 
 } // namespace video_optimizer
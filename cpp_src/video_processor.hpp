@@ -1,4 +1,6 @@
 #pragma once
+#include <cstdint>
+#include <map>
 #include <vector>
 #include <string>
 #include <memory>
@@ -6,13 +8,77 @@
 
 namespace video_optimizer {
 
+enum class SSIMWindow {
+    Gaussian,  // 11x11 Gaussian, sigma 1.5 (the reference SSIM window)
+    Box        // 8x8 box filter over running sums, cheaper at any resolution
+};
+
+struct MetricsOptions {
+    bool luma_only = false;                   // compare BT.601 luma instead of every channel
+    SSIMWindow window = SSIMWindow::Gaussian;
+    int scales = 1;                           // > 1 computes multi-scale SSIM (at most 5 scales)
+    int downscale = 1;                        // compute SSIM at 1/downscale resolution
+};
+
+// Full-reference metrics that keep their intermediate buffers between calls,
+// so scoring a stream of same-size frames allocates nothing after the first
+// pair. An instance is not thread-safe; use one per thread.
+class QualityMetrics {
+public:
+    explicit QualityMetrics(const MetricsOptions& options = MetricsOptions());
+
+    // PSNR over every channel (or luma) with a peak of 255
+    float psnr(const cv::Mat& original, const cv::Mat& compressed);
+    // PSNR of each channel separately (a single value with luma_only)
+    std::vector<float> psnrPerChannel(const cv::Mat& original, const cv::Mat& compressed);
+    // (MS-)SSIM averaged over the compared channels
+    float ssim(const cv::Mat& original, const cv::Mat& compressed);
+
+    const MetricsOptions& options() const { return options_; }
+
+private:
+    struct ScaleBuffers {
+        cv::Mat a, b;                        // 8-bit planes at this scale
+        cv::Mat means, moments;              // (x, y) and (x^2, y^2, xy) per pixel
+        cv::Mat means_blurred, moments_blurred;
+    };
+
+    cv::Scalar squaredErrorSums(const cv::Mat& original, const cv::Mat& compressed, int& channels);
+    void preparePlanes(const cv::Mat& original, const cv::Mat& compressed);
+    void ssimPlane(const cv::Mat& a, const cv::Mat& b, ScaleBuffers& buffers, double& ssim, double& cs);
+    double ssimOfPlanes(const cv::Mat& a, const cv::Mat& b);
+
+    MetricsOptions options_;
+    cv::Mat gray_a_, gray_b_, small_a_, small_b_, difference_, squared_;
+    std::vector<cv::Mat> planes_a_, planes_b_;
+    std::vector<ScaleBuffers> scales_;
+};
+
 class VideoProcessor {
 public:
-    VideoProcessor();
+    // Number of real (non-padding) features extracted per frame: channel
+    // mean/stddev, edge density and four GLCM texture statistics
+    static constexpr int kFrameFeatureCount = 11;
+    // Length of the zero-padded feature vector returned by analyzeFrame
+    static constexpr int kFeatureVectorSize = 128;
+    // Content features of the rate-quality model: the frame features averaged
+    // over sampled frames, then mean SI, TI, motion, motion residual and
+    // segment complexity from analyzeVideo
+    static constexpr int kContentFeatureCount = kFrameFeatureCount + 5;
+    // Frame features depend on resolution, so the model's are computed on
+    // frames scaled down to at most this width (as in rate_quality.py)
+    static constexpr int kContentAnalysisWidth = 640;
+
+    // Loads a rate-quality model written by rate_quality.py when a path is
+    // given; without one the optimizer falls back to a bits-per-pixel heuristic
+    explicit VideoProcessor(const std::string& rate_quality_model_path = std::string());
     ~VideoProcessor();
 
     // Frame processing functions
     std::vector<float> analyzeFrame(const cv::Mat& frame);
+    // Writes one row of kFrameFeatureCount features per frame into features.
+    // A correctly sized CV_32F matrix is filled in place, otherwise it is reallocated.
+    void analyzeFrames(const std::vector<cv::Mat>& frames, cv::Mat& features);
     float calculatePSNR(const cv::Mat& original, const cv::Mat& compressed);
     float calculateSSIM(const cv::Mat& original, const cv::Mat& compressed);
     
@@ -23,20 +89,126 @@ public:
         int height;
         std::string preset;
         float target_quality;
+        int crf = -1;  // chosen CRF when a rate-quality model is loaded
+    };
+
+    // Learned rate-quality model
+    struct RateQualityCandidate {
+        float crf;
+        float scale;   // output height / source height
+    };
+
+    struct RateQualityPrediction {
+        float ssim;
+        float bits_per_pixel;
     };
 
+    void loadRateQualityModel(const std::string& path);
+    bool hasRateQualityModel() const { return !rate_quality_weights_.empty(); }
+    // Predicts every candidate with one matrix product. content holds
+    // kContentFeatureCount values; NaN marks unknown ones, which are replaced
+    // by their training means.
+    void predictRateQuality(const float* content, const std::vector<RateQualityCandidate>& candidates,
+                            std::vector<RateQualityPrediction>& predictions) const;
+
     CompressionParams optimizeParameters(const cv::Mat& frame, float target_quality);
+
+    // Streaming temporal-complexity analysis
+    struct TemporalOptions {
+        int analysis_width = 320;      // frames are analyzed downscaled to this width
+        int frame_step = 1;            // analyze every n-th frame
+        int max_frames = 0;            // 0 analyzes the whole video
+        int block_size = 16;           // motion estimation block size, in analysis pixels
+        int search_range = 8;          // motion search radius, in analysis pixels
+        float scene_threshold = 0.4f;  // histogram (Bhattacharyya) distance marking a cut
+        double segment_seconds = 2.0;  // segments end after this long or at a scene cut
+    };
+
+    struct SegmentComplexity {
+        int start_frame = 0;
+        int end_frame = 0;                  // exclusive
+        double start_time = 0.0;
+        double end_time = 0.0;
+        bool starts_with_cut = false;
+        float spatial_information = 0.0f;   // mean ITU-T P.910 SI (Sobel magnitude stddev)
+        float temporal_information = 0.0f;  // mean P.910 TI (frame difference stddev)
+        float motion = 0.0f;                // mean block motion, analysis pixels per frame
+        float motion_residual = 0.0f;       // mean motion-compensated error, 0-1
+        float texture_contrast = 0.0f;      // mean GLCM contrast
+        float complexity = 0.0f;            // combined coding difficulty, 0-1
+    };
+
+    struct TemporalProfile {
+        double fps = 0.0;
+        int width = 0;
+        int height = 0;
+        std::vector<int> frame_indices;
+        std::vector<float> spatial_information;
+        std::vector<float> temporal_information;
+        std::vector<float> motion;
+        std::vector<float> motion_residual;
+        std::vector<float> texture_contrast;
+        std::vector<int> scene_cuts;        // frame indices that start a new scene
+        std::vector<SegmentComplexity> segments;
+    };
+
+    // Walks the video once, keeping only the current and previous downscaled
+    // frames in memory.
+    TemporalProfile analyzeVideo(const std::string& path, const TemporalOptions& options);
+
+    // Bitrate and resolution for one analyzed segment of a width x height video
+    CompressionParams optimizeParameters(const SegmentComplexity& segment, int width, int height,
+                                         double fps, float target_quality);
+
+    // Full-video quality comparison
+    struct ComparisonOptions {
+        int batch_size = 32;   // frame pairs decoded before each parallel metrics pass
+        int frame_step = 1;    // compare every n-th frame
+        int max_frames = 0;    // 0 compares until the shorter stream ends
+        MetricsOptions metrics;
+    };
+
+    struct VideoComparison {
+        std::vector<int> frame_indices;
+        std::vector<float> psnr;
+        std::vector<float> ssim;
+        int reference_frames = 0;
+        int distorted_frames = 0;
+        float psnr_mean = 0.0f;
+        float psnr_min = 0.0f;
+        float ssim_mean = 0.0f;
+        float ssim_min = 0.0f;
+    };
+
+    VideoComparison compareVideos(const std::string& reference_path,
+                                  const std::string& distorted_path,
+                                  const ComparisonOptions& options);
+
+    // Process-wide counters of the public calls above, keyed by call name.
+    // They are always on: a pair of steady_clock reads and three relaxed
+    // atomic adds per call.
+    struct CallStats {
+        uint64_t calls = 0;
+        uint64_t frames = 0;    // frames (or frame pairs) processed
+        double seconds = 0.0;   // wall time spent inside the calls
+    };
+
+    static std::map<std::string, CallStats> stats();
+    static void resetStats();
     
 private:
     // Internal helper functions
     std::vector<float> extractFeatures(const cv::Mat& frame);
-    float predictQuality(const std::vector<float>& features);
+    void extractFeatures(const cv::Mat& frame, float* features);
+    CompressionParams chooseParameters(const float* content, int width, int height, double fps,
+                                       float target_quality) const;
     
-    // ML model weights (to be loaded from file)
-    std::vector<float> model_weights_;
+    // Rate-quality model: one row of (SSIM, log bits per pixel) weights per
+    // model input, and the training mean of each content feature
+    cv::Mat rate_quality_weights_;
+    std::vector<float> content_mean_;
     
     // Cache for performance optimization
-    cv::Mat working_frame_;
     std::vector<float> feature_cache_;
 };
 
@@ -0,0 +1,190 @@
+import subprocess
+import threading
+import time
+from collections import deque
+
+import ffmpeg
+
+from telemetry import get_telemetry
+
+
+class EncodeCancelled(Exception):
+    """Raised when an encode is stopped through its cancel_event."""
+
+
+def _parse_number(value, suffix=''):
+    """Parse values such as '1.52x' or '2345.6kbits/s'; None for 'N/A'."""
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_out_time(fields):
+    """Return the encoded position in seconds from a progress block."""
+    # out_time_ms is, despite its name, in microseconds as well
+    for key in ('out_time_us', 'out_time_ms'):
+        value = _parse_number(fields.get(key, ''))
+        if value is not None:
+            return max(0.0, value / 1e6)
+    out_time = fields.get('out_time', '')
+    try:
+        hours, minutes, seconds = out_time.split(':')
+        return max(0.0, int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    except ValueError:
+        return None
+
+
+class FFmpegProgress:
+    """Turn ffmpeg's ``-progress`` key=value stream into progress reports.
+
+    ffmpeg emits one block of ``key=value`` lines per update, terminated by
+    ``progress=continue`` (or ``progress=end`` for the last one). Each block
+    is reduced to a stats dict with percent, out_time, fps, speed,
+    bitrate_kbps, total_size and eta; callback receives it at most once per
+    min_interval seconds, plus once for the final block.
+    """
+
+    def __init__(self, duration, callback=None, min_interval=0.5):
+        self.duration = duration
+        self.callback = callback
+        self.min_interval = min_interval
+        self.stats = {'percent': 0.0, 'finished': False}
+        self._fields = {}
+        self._started = time.monotonic()
+        self._last_report = None
+
+    def feed_line(self, line):
+        """Consume one line of ffmpeg progress output."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+        if key != 'progress':
+            self._fields[key] = value
+            return
+
+        self._update(finished=value.strip() == 'end')
+        self._fields = {}
+
+    def _update(self, finished):
+        fields = self._fields
+        out_time = _parse_out_time(fields)
+        if out_time is None:
+            out_time = self.stats.get('out_time', 0.0)
+        speed = _parse_number(fields.get('speed', ''), 'x')
+
+        percent = 100.0 if finished else 0.0
+        if not finished and self.duration:
+            percent = min(100.0, 100.0 * out_time / self.duration)
+
+        eta = None
+        if finished:
+            eta = 0.0
+        elif self.duration and speed:
+            eta = max(0.0, (self.duration - out_time) / speed)
+        elif percent > 0:
+            elapsed = time.monotonic() - self._started
+            eta = elapsed * (100.0 - percent) / percent
+
+        total_size = _parse_number(fields.get('total_size', ''))
+        frame = _parse_number(fields.get('frame', ''))
+        self.stats = {
+            'percent': percent,
+            'out_time': out_time,
+            'frame': int(frame) if frame is not None else None,
+            'fps': _parse_number(fields.get('fps', '')),
+            'speed': speed,
+            'bitrate_kbps': _parse_number(fields.get('bitrate', ''), 'kbits/s'),
+            'total_size': int(total_size) if total_size is not None else None,
+            'eta': eta,
+            'finished': finished,
+        }
+
+        now = time.monotonic()
+        due = self._last_report is None or now - self._last_report >= self.min_interval
+        if self.callback and (due or finished):
+            self._last_report = now
+            self.callback(dict(self.stats))
+
+
+class AggregateProgress:
+    """Combine progress of several concurrent ffmpeg runs into one report.
+
+    Each part reports how many seconds of output it has produced; callback
+    receives the overall percentage, throttled to one call per min_interval.
+    """
+
+    def __init__(self, total_duration, callback=None, min_interval=0.5):
+        self.total_duration = total_duration
+        self.callback = callback
+        self.min_interval = min_interval
+        self._done = {}
+        self._lock = threading.Lock()
+        self._last_report = None
+
+    def update(self, part, seconds, force=False):
+        with self._lock:
+            self._done[part] = seconds
+            percent = 0.0
+            if self.total_duration:
+                percent = min(100.0, 100.0 * sum(self._done.values()) / self.total_duration)
+            now = time.monotonic()
+            due = self._last_report is None or now - self._last_report >= self.min_interval
+            if not (self.callback and (due or force)):
+                return
+            self._last_report = now
+        self.callback(percent)
+
+    def part_callback(self, part):
+        """Return an FFmpegProgress callback that feeds this aggregate."""
+        return lambda stats: self.update(part, stats['out_time'], force=stats['finished'])
+
+
+def run_with_progress(stream, duration=None, callback=None, min_interval=0.5, stderr_lines=200,
+                      cancel_event=None):
+    """Run an ffmpeg-python output stream, reporting progress without polling.
+
+    ffmpeg writes machine-readable progress to stdout, which is read line by
+    line (blocking reads, no busy loop) while a background thread drains
+    stderr so a chatty encode can never fill the pipe and stall. Only the
+    last stderr_lines lines are kept for error reporting.
+
+    Setting cancel_event (a threading.Event) kills ffmpeg at its next
+    progress update, about every half second, and raises EncodeCancelled.
+
+    Returns the final stats dict; raises ffmpeg.Error if ffmpeg fails.
+    """
+    args = ffmpeg.compile(
+        stream.global_args('-progress', 'pipe:1', '-nostats'),
+        overwrite_output=True,
+    )
+    tracker = FFmpegProgress(duration, callback, min_interval)
+    stderr_tail = deque(maxlen=stderr_lines)
+
+    process = subprocess.Popen(
+        args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    drainer = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+    drainer.start()
+    try:
+        for line in process.stdout:
+            if cancel_event is not None and cancel_event.is_set():
+                raise EncodeCancelled("Encode cancelled")
+            tracker.feed_line(line.decode(errors='replace'))
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        drainer.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, b''.join(stderr_tail))
+    get_telemetry().record_encode(tracker.stats)
+    return tracker.stats
@@ -0,0 +1,192 @@
+import queue
+import subprocess
+import threading
+from collections import deque
+
+import ffmpeg
+import numpy as np
+
+from metadata_cache import get_metadata_cache
+
+PIX_FMT_CHANNELS = {'rgb24': 3, 'bgr24': 3, 'gray': 1}
+
+
+class FrameSource:
+    """Decoded frames streamed from an ffmpeg subprocess as rawvideo.
+
+    Frame selection (frame_indices or every_nth), scaling and pixel-format
+    conversion all happen inside ffmpeg, so Python only ever sees frames
+    that are used, already at their final size and layout. Frames are
+    read with readinto into a small ring of preallocated buffers and
+    yielded as np.frombuffer views over them: a yielded frame stays valid
+    until the next one is requested and must be copied to be kept.
+
+    With read_ahead > 0 a background thread decodes that many frames ahead
+    of the consumer. read_batch fills a caller-provided array instead,
+    which is the way to collect frames for batch processing.
+    """
+
+    def __init__(self, path, width=None, height=None, pix_fmt='rgb24', frame_indices=None,
+                 every_nth=None, start=None, read_ahead=2, threads=None, metadata_cache=None):
+        if pix_fmt not in PIX_FMT_CHANNELS:
+            raise ValueError(f"Unsupported pixel format: {pix_fmt!r} (expected one of {tuple(PIX_FMT_CHANNELS)})")
+        self.path = str(path)
+        self.pix_fmt = pix_fmt
+        self.read_ahead = read_ahead
+
+        if width is None or height is None:
+            info = (metadata_cache or get_metadata_cache()).video_info(self.path)
+            source_width, source_height = int(info['width']), int(info['height'])
+            if width is None and height is None:
+                width, height = source_width, source_height
+            elif width is None:
+                width = max(2, round(source_width * height / source_height / 2) * 2)
+            else:
+                height = max(2, round(source_height * width / source_width / 2) * 2)
+        self.width, self.height = int(width), int(height)
+        channels = PIX_FMT_CHANNELS[pix_fmt]
+        self.frame_shape = (self.height, self.width) if channels == 1 else (self.height, self.width, channels)
+        self.frame_size = self.width * self.height * channels
+
+        input_kwargs = {'ss': start} if start else {}
+        if threads:
+            input_kwargs['threads'] = threads
+        stream = ffmpeg.input(self.path, **input_kwargs)
+        if frame_indices is not None:
+            frame_indices = sorted(set(int(i) for i in frame_indices))
+            expression = '+'.join(f"eq(n,{i})" for i in frame_indices) or '0'
+            stream = stream.filter('select', expression)
+        elif every_nth and every_nth > 1:
+            stream = stream.filter('select', f"not(mod(n,{int(every_nth)}))")
+        stream = stream.filter('scale', self.width, self.height, flags='area')
+        # passthrough keeps ffmpeg from duplicating frames to fill the gaps left by select
+        args = ffmpeg.compile(
+            stream.output('pipe:', format='rawvideo', pix_fmt=pix_fmt, vsync='passthrough', an=None)
+            .global_args('-nostdin', '-loglevel', 'error')
+        )
+        self._stderr_tail = deque(maxlen=50)
+        self._closed = False
+        self._process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, bufsize=0)
+        self._drainer = threading.Thread(target=self._stderr_tail.extend, args=(self._process.stderr,),
+                                         daemon=True)
+        self._drainer.start()
+
+        self._finished = False
+        self._buffers = [bytearray(self.frame_size) for _ in range(max(1, read_ahead + 1))]
+        self._views = [np.frombuffer(buffer, dtype=np.uint8).reshape(self.frame_shape)
+                       for buffer in self._buffers]
+        self._held = None
+        self._reader = None
+        if read_ahead > 0:
+            self._free = queue.Queue()
+            for index in range(1, len(self._buffers)):
+                self._free.put(index)
+            self._ready = queue.Queue()
+            self._reader = threading.Thread(target=self._read_ahead, args=(0,), daemon=True)
+            self._reader.start()
+
+    def _read_frame(self, buffer):
+        """Fill buffer with the next frame; False at the end of the stream."""
+        view = memoryview(buffer)
+        filled = 0
+        while filled < self.frame_size:
+            count = self._process.stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def _read_ahead(self, index):
+        try:
+            while not self._closed:
+                if not self._read_frame(self._buffers[index]):
+                    break
+                self._ready.put(index)
+                index = self._free.get()
+                if index is None:
+                    return
+        except (OSError, ValueError):
+            pass  # the pipe was closed by close()
+        self._ready.put(None)
+
+    def _finish(self):
+        """Reap ffmpeg at the end of the stream and report a failed decode."""
+        if self._finished:
+            return
+        self._finished = True
+        self._process.wait()
+        self._drainer.join()
+        if self._process.returncode != 0 and not self._closed:
+            raise ffmpeg.Error('ffmpeg', None, b''.join(self._stderr_tail))
+
+    def _next_frame(self):
+        """Return a view of the next frame, or None at the end of the stream."""
+        if self._reader is None:
+            if not self._finished and self._read_frame(self._buffers[0]):
+                return self._views[0]
+        else:
+            if self._held is not None:
+                self._free.put(self._held)  # the consumer is done with the last frame
+                self._held = None
+            index = self._ready.get()
+            if index is not None:
+                self._held = index
+                return self._views[index]
+            self._ready.put(None)  # later calls see the end too
+        self._finish()
+        return None
+
+    def __iter__(self):
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def read_batch(self, out):
+        """Decode up to len(out) frames into out, a C-contiguous (N, *frame_shape) uint8 array.
+
+        Without read-ahead, ffmpeg's output is read straight into out.
+        Returns the number of frames written; fewer than len(out) means the
+        stream has ended.
+        """
+        count = 0
+        while count < len(out):
+            if self._reader is None:
+                if self._finished or not self._read_frame(memoryview(out[count]).cast('B')):
+                    self._finish()
+                    break
+            else:
+                frame = self._next_frame()
+                if frame is None:
+                    break
+                out[count] = frame
+            count += 1
+        return count
+
+    def close(self):
+        """Stop decoding early and release the ffmpeg process."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._process.poll() is None:
+            self._process.kill()
+        if self._reader is not None:
+            self._free.put(None)
+        self._process.wait()
+        self._drainer.join()
+        self._process.stdout.close()
+        self._process.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_frames(path, **options):
+    """Return a list with a copy of every frame a FrameSource yields."""
+    with FrameSource(path, **options) as source:
+        return [frame.copy() for frame in source]
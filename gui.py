@@ -1,174 +1,318 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
+import itertools
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from batch import default_jobs
+from ffmpeg_progress import EncodeCancelled
+
+# The Tk loop applies queued worker events at most this often
+UPDATE_INTERVAL_MS = 100
+
+
 class VideoCompressorGUI:
+    """Job list of videos compressed concurrently on worker threads.
+
+    Workers never touch Tk: they post (kind, job_id, value) events to a
+    queue that the Tk loop drains every UPDATE_INTERVAL_MS, keeping only
+    the latest progress per job, so a saturated machine cannot flood the
+    event loop. Jobs wait for one of max_jobs encode slots, so changing the
+    concurrency applies to queued jobs without a second worker pool.
+    """
+
     def __init__(self, compressor, quality_assessor):
         # Create the root window
         self.root = tk.Tk()
         self.root.title('Intelligent Video Compression Optimizer')
         self.root.geometry('800x600')
-        
+
         # Store references to components
         self.compressor = compressor
         self.quality_assessor = quality_assessor
-        self.video_path = None
-        
+        self.jobs = {}
+        self._job_ids = itertools.count(1)
+        self._events = queue.Queue()
+        self._executor = None
+        self._slots = threading.Condition()
+        self._max_running = default_jobs()
+        self._running = 0
+
         # Initialize GUI components
         self._init_gui()
-        
+
         # Configure window close handler
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
-        
+        self.root.after(UPDATE_INTERVAL_MS, self._drain_events)
+
     def _init_gui(self):
         """Initialize all GUI components"""
         # Main container
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # File selection
-        file_frame = ttk.LabelFrame(main_frame, text="Video Selection", padding="5")
-        file_frame.pack(fill=tk.X, pady=(0, 10))
-        
-        self.file_label = ttk.Label(file_frame, text='No file selected')
-        self.file_label.pack(side=tk.LEFT, expand=True, padx=5)
-        
-        select_button = ttk.Button(file_frame, text='Select Video', command=self._select_file)
-        select_button.pack(side=tk.RIGHT, padx=5)
-        
+
+        # Job list
+        jobs_frame = ttk.LabelFrame(main_frame, text="Videos", padding="5")
+        jobs_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+
+        self.job_list = ttk.Treeview(jobs_frame, columns=('status', 'progress'), height=8)
+        self.job_list.heading('#0', text='File')
+        self.job_list.heading('status', text='Status')
+        self.job_list.heading('progress', text='Progress')
+        self.job_list.column('#0', width=420)
+        self.job_list.column('status', width=220)
+        self.job_list.column('progress', width=80, anchor=tk.E)
+        self.job_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(jobs_frame, orient=tk.VERTICAL, command=self.job_list.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.job_list['yscrollcommand'] = scrollbar.set
+
+        list_buttons = ttk.Frame(main_frame)
+        list_buttons.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(list_buttons, text='Add Videos', command=self._select_files).pack(side=tk.LEFT, padx=5)
+        ttk.Button(list_buttons, text='Remove', command=self._remove_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(list_buttons, text='Cancel', command=self._cancel_selected).pack(side=tk.LEFT, padx=5)
+
         # Settings
         settings_frame = ttk.LabelFrame(main_frame, text="Compression Settings", padding="5")
         settings_frame.pack(fill=tk.X, pady=(0, 10))
-        
+
         # Quality preset
         preset_frame = ttk.Frame(settings_frame)
         preset_frame.pack(fill=tk.X, pady=5)
-        
+
         ttk.Label(preset_frame, text='Quality Preset:').pack(side=tk.LEFT, padx=5)
         self.preset_var = tk.StringVar(value='Medium')
         preset_combo = ttk.Combobox(preset_frame, textvariable=self.preset_var, state='readonly')
         preset_combo['values'] = ('Low', 'Medium', 'High', 'Custom')
         preset_combo.pack(side=tk.LEFT, padx=5)
-        
+
         # Bitrate
         bitrate_frame = ttk.Frame(settings_frame)
         bitrate_frame.pack(fill=tk.X, pady=5)
-        
+
         ttk.Label(bitrate_frame, text='Target Bitrate (Mbps):').pack(side=tk.LEFT, padx=5)
         self.bitrate_var = tk.DoubleVar(value=5.0)
         bitrate_spin = ttk.Spinbox(bitrate_frame, from_=0.1, to=50.0, increment=0.1,
                                 textvariable=self.bitrate_var, width=10)
         bitrate_spin.pack(side=tk.LEFT, padx=5)
-        
+
         # Resolution
         resolution_frame = ttk.Frame(settings_frame)
         resolution_frame.pack(fill=tk.X, pady=5)
-        
+
         ttk.Label(resolution_frame, text='Output Resolution:').pack(side=tk.LEFT, padx=5)
         self.resolution_var = tk.StringVar(value='Original')
         resolution_combo = ttk.Combobox(resolution_frame, textvariable=self.resolution_var, state='readonly')
         resolution_combo['values'] = ('Original', '1080p', '720p', '480p')
         resolution_combo.pack(side=tk.LEFT, padx=5)
-        
-        # Progress
+
+        # Concurrent jobs
+        jobs_count_frame = ttk.Frame(settings_frame)
+        jobs_count_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(jobs_count_frame, text='Concurrent Jobs:').pack(side=tk.LEFT, padx=5)
+        self.max_jobs_var = tk.IntVar(value=default_jobs())
+        ttk.Spinbox(jobs_count_frame, from_=1, to=max(1, os.cpu_count() or 1), increment=1,
+                    textvariable=self.max_jobs_var, width=10).pack(side=tk.LEFT, padx=5)
+
+        # Overall progress
         progress_frame = ttk.Frame(main_frame)
         progress_frame.pack(fill=tk.X, pady=(0, 10))
-        
+
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var,
                                          maximum=100, mode='determinate')
         self.progress_bar.pack(fill=tk.X)
-        
+
         # Control buttons
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X)
-        
+
         self.start_button = ttk.Button(button_frame, text='Start Compression',
                                     command=self._start_compression)
         self.start_button.pack(pady=5)
         self.start_button['state'] = 'disabled'
-        
+
         # Status
-        self.status_label = ttk.Label(main_frame, text='Ready')
+        self.status_label = ttk.Label(main_frame, text='Add videos to compress')
         self.status_label.pack(pady=5)
-    
-    def _select_file(self):
-        """Handle file selection"""
+
+    def _select_files(self):
+        """Add the chosen videos to the job list"""
         filetypes = (
             ('Video files', '*.mp4 *.avi *.mkv *.mov'),
             ('All files', '*.*')
         )
-        
-        filename = filedialog.askopenfilename(
-            title='Select a video file',
+
+        filenames = filedialog.askopenfilenames(
+            title='Select video files',
             filetypes=filetypes
         )
-        
-        if filename:
-            self.video_path = filename
-            self.file_label['text'] = Path(filename).name
+
+        for filename in filenames:
+            job_id = str(next(self._job_ids))
+            self.jobs[job_id] = {'path': filename, 'state': 'pending', 'progress': 0.0,
+                                 'cancel': threading.Event(), 'result': None}
+            self.job_list.insert('', tk.END, iid=job_id, text=Path(filename).name,
+                                 values=('Pending', ''))
+        if filenames:
             self.start_button['state'] = 'normal'
-            self.status_label['text'] = 'Ready to compress'
-    
-    def _update_progress(self, value):
-        """Update progress bar"""
-        self.progress_var.set(value)
-        self.root.update_idletasks()
-    
+            self._update_status()
+
+    def _remove_selected(self):
+        """Remove selected jobs that are not running"""
+        for job_id in self.job_list.selection():
+            if self.jobs[job_id]['state'] in ('queued', 'running'):
+                continue
+            self.job_list.delete(job_id)
+            del self.jobs[job_id]
+        self._update_status()
+
+    def _cancel_selected(self):
+        """Cancel selected queued or running jobs"""
+        for job_id in self.job_list.selection():
+            job = self.jobs[job_id]
+            if job['state'] in ('queued', 'running'):
+                # A running encode stops at its next progress update
+                job['cancel'].set()
+                self.job_list.set(job_id, 'status', 'Cancelling...')
+
     def _start_compression(self):
-        """Handle compression start"""
-        if not self.video_path:
-            messagebox.showerror('Error', 'Please select a video file first')
+        """Queue every pending job on the worker pool"""
+        pending = [job_id for job_id, job in self.jobs.items() if job['state'] in ('pending', 'failed', 'cancelled')]
+        if not pending:
+            messagebox.showerror('Error', 'Please add a video file first')
             return
-        
+
         settings = {
             'preset': self.preset_var.get().lower(),
             'bitrate': self.bitrate_var.get(),
-            'resolution': self.resolution_var.get()
+            'resolution': self.resolution_var.get().lower(),
         }
-        
-        self.start_button['state'] = 'disabled'
-        self.progress_var.set(0)
-        self.status_label['text'] = 'Compressing...'
-        
-        # Run compression in a separate thread
-        def compression_thread():
+
+        with self._slots:
+            self._max_running = max(1, self.max_jobs_var.get())
+            self._slots.notify_all()
+        if self._executor is None:
+            # Threads beyond the slot count only wait for a slot
+            self._executor = ThreadPoolExecutor(max_workers=max(1, os.cpu_count() or 1),
+                                                thread_name_prefix='compress')
+        for job_id in pending:
+            job = self.jobs[job_id]
+            job.update(state='queued', progress=0.0, result=None)
+            job['cancel'].clear()
+            self.job_list.item(job_id, values=('Queued', '0%'))
+            self._executor.submit(self._run_job, job_id, job['path'], dict(settings), job['cancel'])
+        self._update_status()
+
+    def _run_job(self, job_id, path, settings, cancel):
+        """Compress one video; runs on a worker thread and only posts events"""
+        with self._slots:
+            while self._running >= self._max_running and not cancel.is_set():
+                self._slots.wait(0.5)
+            if cancel.is_set():
+                self._events.put(('cancelled', job_id, None))
+                return
+            self._running += 1
+            # Concurrent encodes split the cores between them
+            settings['threads'] = max(1, (os.cpu_count() or 1) // self._max_running)
+        self._events.put(('started', job_id, None))
+        try:
+            result = self.compressor.compress_video(
+                path,
+                settings,
+                progress_callback=lambda value: self._events.put(('progress', job_id, value)),
+                cancel_event=cancel
+            )
+            self._events.put(('done', job_id, result))
+        except EncodeCancelled:
+            self._events.put(('cancelled', job_id, None))
+        except Exception as e:
+            self._events.put(('failed', job_id, str(e)))
+        finally:
+            with self._slots:
+                self._running -= 1
+                self._slots.notify_all()
+
+    def _drain_events(self):
+        """Apply queued worker events on the Tk thread, then reschedule"""
+        progress = {}
+        finished = []
+        while True:
             try:
-                result = self.compressor.compress_video(
-                    self.video_path,
-                    settings,
-                    progress_callback=self._update_progress
-                )
-                self.root.after(0, self._compression_finished, result)
-            except Exception as e:
-                self.root.after(0, self._compression_error, str(e))
-        
-        threading.Thread(target=compression_thread, daemon=True).start()
-    
-    def _compression_finished(self, result):
-        """Handle compression completion"""
-        self.status_label['text'] = (
-            f'Compression completed!\n'
-            f'Output: {Path(result["output_path"]).name}\n'
-            f'Quality Score: {result["quality_score"]:.2f}\n'
-            f'Compression Ratio: {result["compression_ratio"]:.2f}x'
-        )
-        self.start_button['state'] = 'normal'
-    
-    def _compression_error(self, error_msg):
-        """Handle compression error"""
-        messagebox.showerror('Error', f'Compression failed: {error_msg}')
-        self.status_label['text'] = 'Error occurred during compression'
-        self.start_button['state'] = 'normal'
-    
+                kind, job_id, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress[job_id] = value  # only the latest value is drawn
+            else:
+                finished.append((kind, job_id, value))
+
+        for job_id, value in progress.items():
+            job = self.jobs.get(job_id)
+            if job is not None and job['state'] == 'running':
+                job['progress'] = value
+                self.job_list.set(job_id, 'progress', f'{value:.0f}%')
+        for kind, job_id, value in finished:
+            if job_id in self.jobs:
+                self._job_event(job_id, kind, value)
+        if progress or finished:
+            self._update_status()
+
+        self.root.after(UPDATE_INTERVAL_MS, self._drain_events)
+
+    def _job_event(self, job_id, kind, value):
+        """Record a job's state change and show it in the job list"""
+        job = self.jobs[job_id]
+        if kind == 'started':
+            job['state'] = 'running'
+            if not job['cancel'].is_set():
+                self.job_list.set(job_id, 'status', 'Compressing...')
+        elif kind == 'done':
+            job.update(state='done', progress=100.0, result=value)
+            quality = value['quality_score']
+            self.job_list.item(job_id, values=(
+                f'Done: {value["compression_ratio"]:.2f}x'
+                + (f', quality {quality:.2f}' if quality is not None else ''),
+                '100%'
+            ))
+        elif kind == 'cancelled':
+            job['state'] = 'cancelled'
+            self.job_list.set(job_id, 'status', 'Cancelled')
+        elif kind == 'failed':
+            job['state'] = 'failed'
+            self.job_list.set(job_id, 'status', f'Failed: {value.splitlines()[0] if value else ""}')
+
+    def _update_status(self):
+        """Refresh the overall progress bar and the status line"""
+        if not self.jobs:
+            self.progress_var.set(0)
+            self.status_label['text'] = 'Add videos to compress'
+            return
+        counts = {}
+        for job in self.jobs.values():
+            counts[job['state']] = counts.get(job['state'], 0) + 1
+        active = [job for job in self.jobs.values() if job['state'] != 'pending']
+        if active:
+            self.progress_var.set(sum(job['progress'] for job in active) / len(active))
+        self.status_label['text'] = ', '.join(f'{count} {state}' for state, count in sorted(counts.items()))
+
     def _on_closing(self):
         """Handle window closing"""
-        if messagebox.askokcancel("Quit", "Do you want to quit?"):
+        running = any(job['state'] in ('queued', 'running') for job in self.jobs.values())
+        message = "Compressions are still running. Cancel them and quit?" if running else "Do you want to quit?"
+        if messagebox.askokcancel("Quit", message):
+            for job in self.jobs.values():
+                job['cancel'].set()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
             self.root.quit()
             self.root.destroy()
-    
+
     def run(self):
         """Start the GUI main loop"""
         try:
@@ -179,7 +323,7 @@ class VideoCompressorGUI:
             x = (self.root.winfo_screenwidth() // 2) - (width // 2)
             y = (self.root.winfo_screenheight() // 2) - (height // 2)
             self.root.geometry(f'{width}x{height}+{x}+{y}')
-            
+
             # Start main loop
             self.root.mainloop()
         except Exception as e:
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Local job server for compress, score and analyze jobs.
+
+A small HTTP/1.1 API on asyncio, served on localhost TCP or a Unix
+socket::
+
+    python job_server.py --port 8765 --max-encodes 2
+    curl -X POST localhost:8765/jobs -d '{"type": "compress", "input": "a.mp4",
+         "settings": {"preset": "medium", "resolution": "720p"}, "priority": 0}'
+    curl localhost:8765/jobs/1/events      # newline-delimited JSON progress
+
+Endpoints: GET /health, GET /jobs, POST /jobs, GET /jobs/<id>,
+GET /jobs/<id>/events, DELETE /jobs/<id> (cancels a queued job),
+GET /metrics (Prometheus text format) and GET /trace (Chrome trace JSON,
+recorded with --trace).
+Lower priority values run first; jobs of equal priority run in
+submission order.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from telemetry import get_telemetry
+
+JOB_TYPES = ('compress', 'score', 'analyze')
+TERMINAL_STATES = ('done', 'failed', 'cancelled')
+MAX_BODY_BYTES = 1 << 20
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large'}
+
+
+def _to_json(value):
+    """Convert native results (arrays, bound structs) into JSON values."""
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'complexity'):  # VideoProcessor.SegmentComplexity
+        return {name: getattr(value, name) for name in dir(value)
+                if not name.startswith('_') and not callable(getattr(value, name))}
+    return value
+
+
+class Job:
+    """One queued request and the progress events published for it."""
+
+    def __init__(self, job_id, job_type, input_path, settings, priority):
+        self.id = job_id
+        self.type = job_type
+        self.input = input_path
+        self.settings = settings
+        self.priority = priority
+        self.state = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self._subscribers = set()
+
+    def publish(self, event, **fields):
+        """Update the job's state and hand the event to every streaming client."""
+        if 'state' in fields:
+            self.state = fields['state']
+        if 'progress' in fields:
+            self.progress = fields['progress']
+        message = dict(fields, event=event, job=self.id, time=time.time())
+        for subscriber in self._subscribers:
+            subscriber.put_nowait(message)
+
+    def subscribe(self):
+        """Stream later events, starting with a 'state' event holding the job as it is now."""
+        subscriber = asyncio.Queue()
+        subscriber.put_nowait(dict(self.to_dict(), event='state', job=self.id, time=time.time()))
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'input': self.input, 'settings': self.settings,
+                'priority': self.priority, 'state': self.state, 'progress': self.progress,
+                'result': self.result, 'error': self.error}
+
+
+class JobServer:
+    """Priority-queued compress/score/analyze jobs sharing warm components.
+
+    Encodes and analysis jobs (score, analyze) have separate priority
+    queues and worker counts, so a long encode never blocks scoring. One
+    QualityAssessor (and its loaded model) and a pool of VideoProcessor
+    instances are created once and shared by every job; the blocking work
+    itself runs on a thread pool.
+    """
+
+    def __init__(self, compressor=None, quality_assessor=None, processor_factory=None,
+                 max_encodes=1, max_analysis=2, processor_pool_size=2):
+        if compressor is None:
+            from compression import VideoCompressor
+            from quality_assessment import QualityAssessor
+
+            quality_assessor = quality_assessor or QualityAssessor()
+            compressor = VideoCompressor(quality_assessor=quality_assessor)
+        self.compressor = compressor
+        self.quality_assessor = quality_assessor or compressor.quality_assessor
+        if processor_factory is None:
+            from native import load_video_processor
+            processor_factory = load_video_processor()
+        self._processors = queue.Queue()
+        if processor_factory is not None:
+            for _ in range(processor_pool_size):
+                self._processors.put(processor_factory())
+        self._has_processors = processor_factory is not None
+
+        self.telemetry = get_telemetry()
+        self.max_encodes = max_encodes
+        self.max_analysis = max_analysis
+        # Concurrent encodes split the cores, as in BatchRunner
+        self.encode_threads = max(1, (os.cpu_count() or 1) // max_encodes)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=max_encodes + max_analysis)
+        self._queues = None
+        self._workers = []
+        self._server = None
+
+    # Job execution
+
+    def _queue_for(self, job):
+        return self._queues['encode' if job.type == 'compress' else 'analysis']
+
+    def submit(self, job_type, input_path, settings=None, priority=0):
+        """Queue a job and return it."""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type!r} (expected one of {JOB_TYPES})")
+        if settings is not None and not isinstance(settings, dict):
+            raise ValueError("settings must be an object")
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ValueError("priority must be an integer")
+        job = Job(next(self._ids), job_type, str(input_path), dict(settings or {}), priority)
+        self.jobs[job.id] = job
+        job.publish('queued', state='queued', progress=0.0)
+        self._queue_for(job).put_nowait((job.priority, next(self._order), job))
+        return job
+
+    def cancel(self, job):
+        """Cancel a job that has not started yet; returns whether it was cancelled."""
+        if job.state != 'queued':
+            return False
+        job.publish('cancelled', state='cancelled')
+        return True
+
+    def _run_compress(self, job, progress):
+        settings = dict(job.settings)
+        chunked = settings.pop('chunked', False)
+        resume = settings.pop('resume', False)
+        if chunked:
+            # The chunk encoders share this job's cores
+            chunk_workers = max(1, self.encode_threads // 4)
+            settings.setdefault('threads', max(1, self.encode_threads // chunk_workers))
+            return self.compressor.compress_video_chunked(job.input, settings, progress,
+                                                          max_workers=chunk_workers, resume=resume)
+        settings.setdefault('threads', self.encode_threads)
+        return self.compressor.compress_video(job.input, settings, progress)
+
+    def _run_score(self, job, progress):
+        frame_scores = self.quality_assessor.assess_frames(job.input, job.settings.get('num_frames'))
+        return {'quality_score': float(np.mean(frame_scores)), 'frame_scores': frame_scores}
+
+    def _run_analyze(self, job, progress):
+        if not self._has_processors:
+            raise RuntimeError("Analyze jobs need the compiled VideoProcessor extension")
+        processor = self._processors.get()
+        try:
+            return processor.analyze_video(job.input, **job.settings)
+        finally:
+            self._processors.put(processor)
+
+    async def _worker(self, jobs):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await jobs.get()
+            if job.state != 'queued':  # cancelled while waiting
+                continue
+
+            def progress(percent, job=job):
+                # Called from the worker thread
+                loop.call_soon_threadsafe(lambda: job.publish('progress', progress=float(percent)))
+
+            job.publish('started', state='running')
+            run = getattr(self, f"_run_{job.type}")
+            try:
+                result = await loop.run_in_executor(self._executor, run, job, progress)
+            except Exception as e:
+                job.error = str(e)
+                job.publish('failed', state='failed', error=job.error)
+            else:
+                job.result = _to_json(result)
+                job.publish('done', state='done', progress=100.0, result=job.result)
+
+    # HTTP
+
+    async def _respond(self, writer, status, body):
+        data = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def _respond_text(self, writer, text, content_type='text/plain; version=0.0.4'):
+        data = text.encode()
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def _stream_events(self, writer, job):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        subscriber = job.subscribe()
+        try:
+            while True:
+                message = await subscriber.get()
+                writer.write(json.dumps(message).encode() + b'\n')
+                await writer.drain()
+                if message.get('state') in TERMINAL_STATES:
+                    break
+        finally:
+            job.unsubscribe(subscriber)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode(errors='replace').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode(errors='replace').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length', 0) or 0)
+            except ValueError:
+                length = -1
+            if len(request_line) < 2 or length < 0:
+                return await self._respond(writer, 400, {'error': 'Malformed request'})
+            if length > MAX_BODY_BYTES:
+                return await self._respond(writer, 413, {'error': f"Body exceeds {MAX_BODY_BYTES} bytes"})
+            body = await reader.readexactly(length)
+            await self._route(writer, request_line[0].upper(), request_line[1].split('?')[0], body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, writer, method, path, body):
+        parts = [p for p in path.split('/') if p]
+        if parts == ['health']:
+            return await self._respond(writer, 200, {
+                'status': 'ok',
+                'queued': sum(job.state == 'queued' for job in self.jobs.values()),
+                'running': sum(job.state == 'running' for job in self.jobs.values()),
+            })
+        if parts == ['metrics']:
+            return await self._respond_text(writer, self.telemetry.prometheus_text())
+        if parts == ['trace']:
+            return await self._respond(writer, 200, self.telemetry.chrome_trace())
+        if not parts or parts[0] != 'jobs' or len(parts) > 3:
+            return await self._respond(writer, 404, {'error': f"No such endpoint: {path}"})
+
+        if len(parts) == 1:
+            if method == 'GET':
+                return await self._respond(writer, 200, [job.to_dict() for job in self.jobs.values()])
+            if method != 'POST':
+                return await self._respond(writer, 405, {'error': f"{method} not allowed"})
+            try:
+                request = json.loads(body or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError("the body must be a JSON object")
+                job = self.submit(request.get('type'), request['input'], request.get('settings'),
+                                  request.get('priority', 0))
+            except (ValueError, KeyError, TypeError) as e:
+                return await self._respond(writer, 400, {'error': f"Invalid job: {e}"})
+            return await self._respond(writer, 202, job.to_dict())
+
+        job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            return await self._respond(writer, 404, {'error': f"No such job: {parts[1]}"})
+        if len(parts) == 3:
+            if parts[2] != 'events' or method != 'GET':
+                return await self._respond(writer, 404, {'error': f"No such endpoint: {path}"})
+            return await self._stream_events(writer, job)
+        if method == 'GET':
+            return await self._respond(writer, 200, job.to_dict())
+        if method == 'DELETE':
+            if not self.cancel(job):
+                return await self._respond(writer, 409, {'error': f"Job {job.id} is already {job.state}"})
+            return await self._respond(writer, 200, job.to_dict())
+        return await self._respond(writer, 405, {'error': f"{method} not allowed"})
+
+    # Lifecycle
+
+    async def start(self, host='127.0.0.1', port=8765, unix_socket=None):
+        """Start the workers and the listener; returns the asyncio server."""
+        self._queues = {'encode': asyncio.PriorityQueue(), 'analysis': asyncio.PriorityQueue()}
+        self._workers = (
+            [asyncio.ensure_future(self._worker(self._queues['encode'])) for _ in range(self.max_encodes)] +
+            [asyncio.ensure_future(self._worker(self._queues['analysis'])) for _ in range(self.max_analysis)]
+        )
+        if unix_socket:
+            self._server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def warm_up(self):
+        """Load the quality model before the first job needs it."""
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: self.quality_assessor.predictor)
+
+
+async def _serve(args):
+    telemetry = get_telemetry()
+    telemetry.trace = telemetry.trace or args.trace
+    server = JobServer(max_encodes=args.max_encodes, max_analysis=args.max_analysis,
+                       processor_pool_size=args.max_analysis)
+    listener = await server.start(args.host, args.port, args.unix_socket)
+    if not args.no_warm_up:
+        await server.warm_up()
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Job server listening on {where}", flush=True)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.stop()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-encodes', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help='concurrent compress jobs')
+    parser.add_argument('--max-analysis', type=int, default=2, help='concurrent score/analyze jobs')
+    parser.add_argument('--trace', action='store_true', help='record stage timings for GET /trace')
+    parser.add_argument('--no-warm-up', action='store_true', help='load the quality model on first use')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -11,8 +11,9 @@ def main():
     try:
         # Initialize core components
         print("Initializing components...")
-        compressor = VideoCompressor()
+        # The quality model itself is loaded lazily on first use
         quality_assessor = QualityAssessor()
+        compressor = VideoCompressor(quality_assessor=quality_assessor)
         
         print("Creating GUI...")
         # Create and run the GUI
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+
+import ffmpeg
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get('VCO_CACHE_DIR', Path.home() / '.cache' / 'video_compression_optimizer')
+)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
+
+
+class MetadataCache:
+    """ffprobe results cached by (path, size, mtime).
+
+    Lookups go through an in-memory LRU first and a small SQLite store
+    second, so a probe survives across processes; ffprobe only runs for
+    files that are new or have changed since they were last probed. Pass
+    db_path=None for a purely in-memory cache. Safe to share between
+    threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_DIR / 'metadata.sqlite', max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path is not None:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS probes ('
+                    'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, probe TEXT)'
+                )
+                self._db.commit()
+            except (OSError, sqlite3.Error):
+                self._db = None  # Unwritable cache location: keep the memory cache only
+
+    def _file_key(self, path):
+        stat = os.stat(path)
+        return str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns
+
+    def _lookup(self, key):
+        with self._lock:
+            probe = self._entries.get(key)
+            if probe is not None:
+                self._entries.move_to_end(key)
+                return probe
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                'SELECT probe FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?', key
+            ).fetchone()
+        if row is None:
+            return None
+        probe = json.loads(row[0])
+        self._remember(key, probe)
+        return probe
+
+    def _remember(self, key, probe):
+        with self._lock:
+            self._entries[key] = probe
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _store(self, key, probe):
+        self._remember(key, probe)
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO probes (path, size, mtime_ns, probe) VALUES (?, ?, ?, ?)',
+                key + (json.dumps(probe),)
+            )
+            self._db.commit()
+
+    def probe(self, path):
+        """Return the full ffprobe report for path, probing only on a miss.
+
+        The returned dict is shared with the cache and must not be modified.
+        """
+        key = self._file_key(path)
+        probe = self._lookup(key)
+        if probe is None:
+            probe = ffmpeg.probe(str(path))
+            self._store(key, probe)
+        return probe
+
+    def video_info(self, path):
+        """Return the first video stream of path."""
+        return next(s for s in self.probe(path)['streams'] if s['codec_type'] == 'video')
+
+    def frame_count(self, path):
+        """Return the number of video frames, estimated from duration if needed."""
+        probe = self.probe(path)
+        video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+        if video_info.get('nb_frames'):
+            return int(video_info['nb_frames'])
+        duration = float(video_info.get('duration') or probe['format'].get('duration') or 0)
+        rate = video_info.get('avg_frame_rate', '0/0')
+        fps = float(Fraction(rate)) if rate != '0/0' else 0.0
+        return int(round(duration * fps))
+
+    def prefetch(self, directory, max_workers=None, extensions=VIDEO_EXTENSIONS, recursive=True):
+        """Probe every video under directory with a pool of ffprobe workers.
+
+        Returns a dict mapping paths that could not be probed to the error.
+        """
+        pattern = '**/*' if recursive else '*'
+        paths = [p for p in Path(directory).glob(pattern)
+                 if p.is_file() and p.suffix.lower() in extensions]
+
+        def probe_one(path):
+            try:
+                self.probe(path)
+            except (ffmpeg.Error, OSError) as e:
+                return path, e
+            return path, None
+
+        with ThreadPoolExecutor(max_workers=max_workers or min(32, (os.cpu_count() or 1) * 2)) as executor:
+            return {str(path): error for path, error in executor.map(probe_one, paths) if error is not None}
+
+    def clear(self):
+        """Drop every cached probe, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM probes')
+                self._db.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """Return the process-wide cache shared by the compressor and the assessor."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache()
+        return _default_cache
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pre-probe every video in a directory')
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    failures = get_metadata_cache().prefetch(args.directory, max_workers=args.workers)
+    for path, error in failures.items():
+        print(f"Could not probe {path}: {error}")
@@ -0,0 +1,20 @@
+def load_native_module():
+    """Return the compiled video_processor module, or None if it isn't built.
+
+    setup.py installs the extension as a top-level ``video_processor``
+    module, the CMake build leaves it in cpp_src/build.
+    """
+    try:
+        import video_processor
+    except ImportError:
+        try:
+            from cpp_src.build import video_processor
+        except ImportError:
+            return None
+    return video_processor
+
+
+def load_video_processor():
+    """Return the compiled VideoProcessor class, or None if it isn't built."""
+    module = load_native_module()
+    return module.VideoProcessor if module is not None else None
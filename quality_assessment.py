@@ -1,90 +1,199 @@
-import torch
-import torch.nn as nn
-import torchvision.models as models
-import torchvision.transforms as transforms
 import cv2
 import numpy as np
-from pathlib import Path
-
-class QualityNet(nn.Module):
-    def __init__(self):
-        super(QualityNet, self).__init__()
-        # Use ResNet-18 as backbone
-        resnet = models.resnet18(pretrained=True)
-        # Remove the last fully connected layer
-        self.features = nn.Sequential(*list(resnet.children())[:-1])
-        # Add quality assessment head
-        self.quality_head = nn.Sequential(
-            nn.Linear(512, 256),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(256, 1),
-            nn.Sigmoid()
-        )
-
-    def forward(self, x):
-        features = self.features(x)
-        features = features.view(features.size(0), -1)
-        quality = self.quality_head(features)
-        return quality
+import ffmpeg
+from frame_source import FrameSource
+from metadata_cache import get_metadata_cache
+from quality_backends import MODEL_PATH
+from score_cache import ScoreCache, checkpoint_fingerprint, file_fingerprint, get_score_cache
+from telemetry import get_telemetry
+
+# Part of the score cache key; bumped whenever frame sampling changes the
+# model's inputs (2: frames selected and area-scaled by ffmpeg, not OpenCV)
+SAMPLING_VERSION = 2
+
+# torch/torchvision take seconds to import, so they are only pulled in (via
+# quality_model) the first time a model is actually needed.
+
+
+def __getattr__(name):
+    if name == 'QualityNet':
+        from quality_model import QualityNet
+        return QualityNet
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class QualityAssessor:
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = QualityNet().to(self.device)
-        self.transform = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                              std=[0.229, 0.224, 0.225])
-        ])
-        
-        # Load pre-trained weights if available
-        model_path = Path(__file__).parent / 'models' / 'quality_net.pth'
-        if model_path.exists():
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-        self.model.eval()
+    def __init__(self, num_frames=10, batch_size=16, metadata_cache=None, model_path=None,
+                 backend='torch', num_threads=None, score_cache=None):
+        self.num_frames = num_frames
+        self.batch_size = batch_size
+        self.input_size = (224, 224)
+        self.mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        self.std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+        self.metadata_cache = metadata_cache or get_metadata_cache()
+        # backend: 'torch' (eager fp32, model_path is the checkpoint) or
+        # 'torchscript'/'onnx' (model_path is an artifact from quality_export.py)
+        self.model_path = model_path
+        self.backend = backend
+        self.num_threads = num_threads
+        # None shares the process-wide score cache, False disables caching
+        self.score_cache = get_score_cache() if score_cache is None else score_cache
+        self.telemetry = get_telemetry()
+        self._device = None
+        # Set by train(): this assessor's own model and predictor
+        self._trained_model = None
+        self._trained_predictor = None
+
+    @property
+    def device(self):
+        if self._device is None:
+            import torch
+            self._device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        return self._device
+
+    @property
+    def predictor(self):
+        """Shared scoring function for the configured backend."""
+        if self._trained_predictor is not None:
+            return self._trained_predictor
+        from quality_backends import get_quality_predictor
+        device = self.device if self.backend == 'torch' else 'cpu'
+        return get_quality_predictor(self.backend, self.model_path, device, self.num_threads)
+
+    @property
+    def model(self):
+        """The shared QualityNet, loaded (offline) on first access."""
+        if self._trained_model is not None:
+            return self._trained_model
+        from quality_model import get_quality_model
+        return get_quality_model(self.device, self.model_path or MODEL_PATH)
 
     def _extract_frames(self, video_path, num_frames=10):
-        """Extract evenly spaced frames from video for quality assessment."""
+        """Extract evenly spaced RGB frames at the model input size.
+
+        Frame selection, scaling and color conversion run inside an ffmpeg
+        rawvideo pipe and the frames are read straight into one array; the
+        OpenCV path is the fallback when ffmpeg cannot be used.
+        """
+        try:
+            total_frames = self.metadata_cache.frame_count(video_path)
+        except (ffmpeg.Error, OSError, StopIteration):
+            return self._extract_frames_opencv(video_path, num_frames)
+        if total_frames <= 0:
+            return []
+        frame_indices = sorted(set(np.linspace(0, total_frames-1, num_frames, dtype=int).tolist()))
+
+        try:
+            with FrameSource(video_path, *self.input_size, pix_fmt='rgb24', frame_indices=frame_indices,
+                             read_ahead=0, metadata_cache=self.metadata_cache) as source:
+                frames = np.empty((len(frame_indices),) + source.frame_shape, dtype=np.uint8)
+                count = source.read_batch(frames)
+        except (ffmpeg.Error, OSError):
+            return self._extract_frames_opencv(video_path, num_frames)
+        return list(frames[:count])
+
+    def _extract_frames_opencv(self, video_path, num_frames=10):
+        """Extract evenly spaced frames in a single sequential pass over the video.
+
+        Frames between samples are only grabbed (no seeking, so nothing is
+        decoded twice) and sampled frames are shrunk to the model input size
+        straight away.
+        """
         cap = cv2.VideoCapture(video_path)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_indices = np.linspace(0, total_frames-1, num_frames, dtype=int)
-        
+        if total_frames <= 0:
+            cap.release()
+            return []
+        frame_indices = set(np.linspace(0, total_frames-1, num_frames, dtype=int).tolist())
+        last_index = max(frame_indices)
+
         frames = []
-        for idx in frame_indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            ret, frame = cap.read()
+        for idx in range(last_index + 1):
+            if not cap.grab():
+                break
+            if idx not in frame_indices:
+                continue
+            ret, frame = cap.retrieve()
             if ret:
+                frame = cv2.resize(frame, self.input_size, interpolation=cv2.INTER_AREA)
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 frames.append(frame)
         
         cap.release()
         return frames
 
-    def assess_quality(self, video_path):
-        """Assess the quality of a video using the ML model."""
-        frames = self._extract_frames(video_path)
+    def _frames_to_batch(self, frames):
+        """Stack RGB uint8 frames into a normalized NCHW float32 array."""
+        batch = np.stack(frames).astype(np.float32) / 255.0
+        batch = (batch - self.mean) / self.std
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def _score_key(self, video_path, num_frames):
+        """Cache key for the scores of video_path, or None if they can't be cached.
+
+        A model without a checkpoint is randomly initialized in every
+        process, so its scores are not worth keeping.
+        """
+        model = checkpoint_fingerprint(self.model_path or MODEL_PATH)
+        if not self.score_cache or model is None:
+            return None
+        return ScoreCache.make_key('quality', SAMPLING_VERSION, file_fingerprint(video_path), self.backend,
+                                   model, num_frames, self.input_size)
+
+    def assess_frames(self, video_path, num_frames=None, batch_size=None):
+        """Return the model's score for each sampled frame of a video."""
+        num_frames = num_frames or self.num_frames
+        batch_size = batch_size or self.batch_size
+
+        telemetry = self.telemetry
+        with telemetry.stage('score_cache_lookup'):
+            key = self._score_key(video_path, num_frames)
+            cached = self.score_cache.get(key) if key is not None else None
+        if cached is not None:
+            return np.asarray(cached['frame_scores'], dtype=np.float32)
+
+        with telemetry.stage('extract_frames'):
+            frames = self._extract_frames(video_path, num_frames)
         if not frames:
             raise ValueError("No frames could be extracted from the video")
 
-        # Process frames through the model
-        quality_scores = []
-        with torch.no_grad():
-            for frame in frames:
-                # Prepare input
-                input_tensor = self.transform(frame).unsqueeze(0).to(self.device)
-                
-                # Get quality prediction
-                quality_score = self.model(input_tensor).item()
-                quality_scores.append(quality_score)
+        with telemetry.stage('model_load'):
+            predictor = self.predictor
+        # Score the frames in batches instead of one forward pass per frame
+        with telemetry.stage('inference', frames=len(frames)):
+            quality_scores = []
+            for start in range(0, len(frames), batch_size):
+                quality_scores.append(predictor(self._frames_to_batch(frames[start:start + batch_size])))
+            frame_scores = np.concatenate(quality_scores)
+
+        if key is not None:
+            self.score_cache.put(key, {'score': float(np.mean(frame_scores)),
+                                       'frame_scores': frame_scores.tolist()})
+        return frame_scores
 
+    def assess_quality(self, video_path, num_frames=None, batch_size=None):
+        """Assess the quality of a video using the ML model."""
         # Return average quality score
-        return np.mean(quality_scores)
+        return float(np.mean(self.assess_frames(video_path, num_frames, batch_size)))
 
     def train(self, train_loader, num_epochs=10):
-        """Train the quality assessment model (for future improvements)."""
+        """Train the quality assessment model (for future improvements).
+
+        Training starts from a private copy of the checkpoint, so other
+        assessors sharing the process-wide model keep their scores. This
+        assessor scores with the trained model from then on, and stops
+        caching scores, which are keyed by the checkpoint.
+        """
+        import torch
+        import torch.nn as nn
+        from quality_backends import _torch_predictor
+        from quality_model import build_quality_model
+
+        if self._trained_model is None:
+            self._trained_model = build_quality_model(self.model_path or MODEL_PATH, self.device)
+            self._trained_predictor = _torch_predictor(self._trained_model, self.device, False)
+            self.score_cache = False
+
         criterion = nn.MSELoss()
         optimizer = torch.optim.Adam(self.model.parameters(), lr=0.001)
         
@@ -102,3 +211,4 @@ class QualityAssessor:
                 
                 if batch_idx % 100 == 0:
                     print(f'Epoch: {epoch}, Batch: {batch_idx}, Loss: {loss.item():.4f}')
+        self.model.eval()
@@ -0,0 +1,91 @@
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+
+BACKENDS = ('torch', 'torchscript', 'onnx')
+# Defined here rather than in quality_model so it is available without importing torch
+MODEL_PATH = Path(__file__).parent / 'models' / 'quality_net.pth'
+
+
+def read_export_info(artifact_path):
+    """Return the metadata written next to an exported model, if any."""
+    info_path = Path(str(artifact_path) + '.json')
+    if info_path.exists():
+        return json.loads(info_path.read_text())
+    return {}
+
+
+def _torch_predictor(model, device, channels_last):
+    import torch
+
+    def predict(batch):
+        tensor = torch.from_numpy(batch).to(device)
+        if channels_last:
+            tensor = tensor.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            return model(tensor).reshape(-1).cpu().numpy()
+    return predict
+
+
+def _load_predictor(backend, model_path, device, num_threads):
+    if backend == 'onnx':
+        # onnxruntime is optional and only needed for this backend
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        return lambda batch: session.run(None, {input_name: batch})[0].reshape(-1)
+
+    import torch
+
+    if num_threads:
+        # Intra-op parallelism is a process-wide setting in PyTorch
+        torch.set_num_threads(num_threads)
+
+    if backend == 'torchscript':
+        model = torch.jit.load(str(model_path), map_location='cpu')
+        model.eval()
+        channels_last = read_export_info(model_path).get('channels_last', False)
+        return _torch_predictor(model, 'cpu', channels_last)
+
+    from quality_model import get_quality_model
+    model = get_quality_model(device, model_path or MODEL_PATH)
+    return _torch_predictor(model, device, False)
+
+
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+def get_quality_predictor(backend='torch', model_path=None, device='cpu', num_threads=None):
+    """Return a shared function scoring a normalized (N, 3, H, W) float32 batch.
+
+    backend 'torch' runs the eager fp32 QualityNet (model_path is its
+    checkpoint), 'torchscript' and 'onnx' load an artifact produced by
+    quality_export.py. Predictors are created once per process and reused.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown quality backend: {backend!r} (expected one of {BACKENDS})")
+    if backend != 'torch' and not model_path:
+        raise ValueError(f"The {backend} backend needs the path of an exported model")
+
+    key = (backend, str(model_path), str(device), num_threads)
+    with _predictors_lock:
+        predictor = _predictors.get(key)
+        if predictor is None:
+            predictor = _load_predictor(backend, model_path, device, num_threads)
+            _predictors[key] = predictor
+        return predictor
+
+
+def predict_in_batches(predictor, batch, batch_size):
+    """Score a large normalized batch batch_size frames at a time."""
+    return np.concatenate([
+        predictor(np.ascontiguousarray(batch[start:start + batch_size]))
+        for start in range(0, len(batch), batch_size)
+    ])
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Export QualityNet for CPU inference and compare backends.
+
+Examples::
+
+    # int8 TorchScript model calibrated on a few representative videos
+    python quality_export.py export models/quality_net.int8.pt \\
+        --quantize static --channels-last --calibration-videos a.mp4 b.mp4
+
+    # accuracy delta and frames/sec of exported models against eager fp32
+    python quality_export.py compare --videos a.mp4 b.mp4 \\
+        --artifacts models/quality_net.int8.pt models/quality_net.onnx
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from quality_assessment import QualityAssessor
+from quality_backends import get_quality_predictor, predict_in_batches, read_export_info
+from quality_model import MODEL_PATH, build_quality_model
+
+# QualityNet.features is the ResNet-18 children list without its fc layer
+_BACKBONE_NAMES = ['conv1', 'bn1', 'relu', 'maxpool', 'layer1', 'layer2', 'layer3', 'layer4', 'avgpool']
+
+
+def _quantization():
+    # torch.ao.quantization superseded torch.quantization in newer releases
+    return torch.ao.quantization if hasattr(torch, 'ao') else torch.quantization
+
+
+class StaticQuantQualityNet(nn.Module):
+    """QualityNet with an int8 backbone and the small MLP head left in fp32."""
+
+    def __init__(self, float_model):
+        super(StaticQuantQualityNet, self).__init__()
+        from torchvision.models import quantization as qmodels
+        try:
+            backbone = qmodels.resnet18(weights=None, quantize=False)
+        except TypeError:  # torchvision < 0.13
+            backbone = qmodels.resnet18(pretrained=False, quantize=False)
+        backbone.fc = nn.Identity()
+
+        state = {}
+        for key, value in float_model.features.state_dict().items():
+            index, rest = key.split('.', 1)
+            state[f"{_BACKBONE_NAMES[int(index)]}.{rest}"] = value
+        backbone.load_state_dict(state)
+
+        self.backbone = backbone
+        self.quality_head = float_model.quality_head
+
+    def forward(self, x):
+        # The quantizable ResNet quantizes its input and dequantizes its output
+        return self.quality_head(self.backbone(x))
+
+
+def _calibration_batches(video_paths, num_frames, batch_size):
+    assessor = QualityAssessor(num_frames=num_frames)
+    for video_path in video_paths:
+        frames = assessor._extract_frames(str(video_path), num_frames)
+        for start in range(0, len(frames), batch_size):
+            yield torch.from_numpy(assessor._frames_to_batch(frames[start:start + batch_size]))
+
+
+def quantize_model(model, mode, calibration_videos=(), num_frames=16, batch_size=16):
+    """Return an int8 copy of an fp32 QualityNet.
+
+    mode 'dynamic' quantizes the Linear layers of the head only; 'static'
+    quantizes the whole convolutional backbone and needs calibration videos
+    to observe activation ranges.
+    """
+    quant = _quantization()
+    if mode == 'dynamic':
+        return quant.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if mode != 'static':
+        raise ValueError(f"Unknown quantization mode: {mode!r}")
+    if not calibration_videos:
+        raise ValueError("Static quantization needs at least one calibration video")
+
+    quantized = StaticQuantQualityNet(model).eval()
+    engine = 'fbgemm' if 'fbgemm' in torch.backends.quantized.supported_engines else 'qnnpack'
+    torch.backends.quantized.engine = engine
+    quantized.backbone.fuse_model()
+    quantized.backbone.qconfig = quant.get_default_qconfig(engine)
+    quant.prepare(quantized.backbone, inplace=True)
+    with torch.no_grad():
+        for batch in _calibration_batches(calibration_videos, num_frames, batch_size):
+            quantized(batch)
+    quant.convert(quantized.backbone, inplace=True)
+    return quantized
+
+
+def export_model(output_path, fmt='torchscript', quantize=None, channels_last=False,
+                 calibration_videos=(), model_path=MODEL_PATH):
+    """Export QualityNet to TorchScript or ONNX for CPU inference.
+
+    A small JSON file written next to the artifact records how it was built,
+    which the torchscript backend uses to feed channels-last input.
+    """
+    output_path = Path(output_path)
+    model = build_quality_model(model_path, 'cpu')
+    example = torch.zeros(1, 3, 224, 224)
+
+    if fmt == 'torchscript':
+        if quantize:
+            model = quantize_model(model, quantize, calibration_videos)
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+            example = example.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(model, example).eval())
+        traced.save(str(output_path))
+    elif fmt == 'onnx':
+        torch.onnx.export(
+            model, example, str(output_path),
+            input_names=['frames'], output_names=['quality'],
+            dynamic_axes={'frames': {0: 'batch'}, 'quality': {0: 'batch'}},
+            opset_version=13,
+        )
+        if quantize == 'dynamic':
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(str(output_path), str(output_path), weight_type=QuantType.QInt8)
+        elif quantize:
+            raise ValueError("ONNX export only supports dynamic quantization")
+    else:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+
+    info = {'format': fmt, 'quantize': quantize, 'channels_last': channels_last,
+            'source_checkpoint': str(model_path)}
+    Path(str(output_path) + '.json').write_text(json.dumps(info, indent=2))
+    return output_path
+
+
+def _throughput(predictor, batch, batch_size, repeats):
+    predict_in_batches(predictor, batch[:batch_size], batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict_in_batches(predictor, batch, batch_size)
+    return repeats * len(batch) / (time.perf_counter() - start)
+
+
+def compare_backends(video_paths, artifacts, num_frames=32, batch_size=16, repeats=3,
+                     num_threads=None, model_path=MODEL_PATH):
+    """Measure accuracy delta and frames/sec of exported models against fp32.
+
+    Every backend scores the same frames sampled from video_paths. Returns
+    one dict per backend, the eager fp32 reference first.
+    """
+    assessor = QualityAssessor(num_frames=num_frames)
+    frames = []
+    for video_path in video_paths:
+        frames.extend(assessor._extract_frames(str(video_path), num_frames))
+    if not frames:
+        raise ValueError("No frames could be extracted from the videos")
+    batch = assessor._frames_to_batch(frames)
+
+    reference = get_quality_predictor('torch', model_path, 'cpu', num_threads)
+    reference_scores = predict_in_batches(reference, batch, batch_size)
+    results = [{
+        'backend': 'torch',
+        'artifact': str(model_path),
+        'mean_score': float(reference_scores.mean()),
+        'frames_per_sec': _throughput(reference, batch, batch_size, repeats),
+    }]
+
+    for artifact in artifacts:
+        backend = read_export_info(artifact).get('format') or (
+            'onnx' if str(artifact).endswith('.onnx') else 'torchscript')
+        predictor = get_quality_predictor(backend, artifact, 'cpu', num_threads)
+        scores = predict_in_batches(predictor, batch, batch_size)
+        delta = np.abs(scores - reference_scores)
+        results.append({
+            'backend': backend,
+            'artifact': str(artifact),
+            'mean_score': float(scores.mean()),
+            'mean_abs_delta': float(delta.mean()),
+            'max_abs_delta': float(delta.max()),
+            'frames_per_sec': _throughput(predictor, batch, batch_size, repeats),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export QualityNet for CPU inference')
+    export_parser.add_argument('output')
+    export_parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript')
+    export_parser.add_argument('--quantize', choices=['dynamic', 'static'], default=None)
+    export_parser.add_argument('--channels-last', action='store_true')
+    export_parser.add_argument('--calibration-videos', nargs='*', default=[])
+    export_parser.add_argument('--checkpoint', default=str(MODEL_PATH))
+
+    compare_parser = subparsers.add_parser('compare', help='Compare exported models against fp32')
+    compare_parser.add_argument('--videos', nargs='+', required=True)
+    compare_parser.add_argument('--artifacts', nargs='+', required=True)
+    compare_parser.add_argument('--num-frames', type=int, default=32)
+    compare_parser.add_argument('--batch-size', type=int, default=16)
+    compare_parser.add_argument('--threads', type=int, default=None)
+    compare_parser.add_argument('--checkpoint', default=str(MODEL_PATH))
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        path = export_model(args.output, args.format, args.quantize, args.channels_last,
+                            args.calibration_videos, args.checkpoint)
+        print(f"Exported {path}")
+    else:
+        results = compare_backends(args.videos, args.artifacts, args.num_frames, args.batch_size,
+                                   num_threads=args.threads, model_path=args.checkpoint)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+
+from quality_backends import MODEL_PATH
+
+
+def _resnet18(pretrained):
+    """Build a ResNet-18 without ever downloading weights.
+
+    With pretrained=True the ImageNet weights are used only if torchvision
+    has already cached them locally; otherwise the backbone stays randomly
+    initialized.
+    """
+    try:
+        resnet = models.resnet18(weights=None)
+    except TypeError:  # torchvision < 0.13
+        resnet = models.resnet18(pretrained=False)
+
+    if pretrained:
+        checkpoint_dir = Path(torch.hub.get_dir()) / 'checkpoints'
+        cached = sorted(checkpoint_dir.glob('resnet18-*.pth'))
+        if cached:
+            resnet.load_state_dict(torch.load(cached[0], map_location='cpu'))
+    return resnet
+
+
+class QualityNet(nn.Module):
+    def __init__(self, pretrained_backbone=False):
+        super(QualityNet, self).__init__()
+        # Use ResNet-18 as backbone
+        resnet = _resnet18(pretrained_backbone)
+        # Remove the last fully connected layer
+        self.features = nn.Sequential(*list(resnet.children())[:-1])
+        # Add quality assessment head
+        self.quality_head = nn.Sequential(
+            nn.Linear(512, 256),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(256, 1),
+            nn.Sigmoid()
+        )
+
+    def forward(self, x):
+        features = self.features(x)
+        features = features.view(features.size(0), -1)
+        quality = self.quality_head(features)
+        return quality
+
+
+def build_quality_model(model_path=MODEL_PATH, device='cpu'):
+    """Build a new eval-mode QualityNet without touching the network.
+
+    When a local checkpoint exists it supplies every weight, so the backbone
+    is built without ImageNet weights; otherwise locally cached ImageNet
+    weights are used if present.
+    """
+    model_path = Path(model_path)
+    model = QualityNet(pretrained_backbone=not model_path.exists())
+    if model_path.exists():
+        model.load_state_dict(torch.load(model_path, map_location=device))
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_quality_model(device, model_path=MODEL_PATH):
+    """Return the process-wide QualityNet for device, loading it on first use."""
+    key = (str(device), str(model_path))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = build_quality_model(model_path, device)
+            _models[key] = model
+        return model
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Learned rate-quality model: predict SSIM and bitrate of candidate encodes.
+
+Build a dataset from measured trial encodes, then fit the model offline::
+
+    python rate_quality.py build talks/*.mp4 --dataset rq.jsonl
+    python rate_quality.py train --dataset rq.jsonl --output rate_quality.vcrq
+
+The weights file is loaded by ``VideoProcessor(rate_quality_model=...)``
+(which then picks CRF and resolution in optimize_parameters without any
+trial encodes) and by RateQualityModel here.
+"""
+import argparse
+import json
+import struct
+import sys
+from fractions import Fraction
+from pathlib import Path
+
+import numpy as np
+
+from metadata_cache import DEFAULT_CACHE_DIR
+from score_cache import file_fingerprint
+
+FRAME_FEATURES = ('mean_b', 'std_b', 'mean_g', 'std_g', 'mean_r', 'std_r', 'edge_density',
+                  'glcm_contrast', 'glcm_homogeneity', 'glcm_energy', 'glcm_correlation')
+TEMPORAL_FEATURES = ('spatial_information', 'temporal_information', 'motion', 'motion_residual',
+                     'complexity')
+CONTENT_FEATURES = FRAME_FEATURES + TEMPORAL_FEATURES
+TARGETS = ('ssim', 'log_bits_per_pixel')
+
+DEFAULT_MODEL_PATH = DEFAULT_CACHE_DIR / 'rate_quality.vcrq'
+DEFAULT_CRFS = (18, 22, 26, 30, 34, 38)
+# Frame features depend on resolution, so they are always computed at this
+# width (VideoProcessor::kContentAnalysisWidth in C++)
+CONTENT_ANALYSIS_WIDTH = 640
+_MAGIC = b'VCRQ'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sIIII')
+_RESOLUTION_HEIGHTS = {'1080p': 1080, '720p': 720, '480p': 480}
+
+
+def model_inputs(content, crfs, scales):
+    """Expand content features and settings into the model's input rows.
+
+    Rows are 1, content, q, q^2, log2(scale), content * q with q = crf / 51,
+    so a linear model can learn how each content feature changes the CRF
+    slope. VideoProcessor computes the same rows in C++.
+    """
+    crfs = np.asarray(crfs, dtype=np.float64).reshape(-1)
+    scales = np.asarray(scales, dtype=np.float64).reshape(-1)
+    content = np.broadcast_to(np.asarray(content, dtype=np.float64), (len(crfs), len(CONTENT_FEATURES)))
+    q = crfs / 51.0
+    return np.column_stack([np.ones(len(crfs)), content, q, q * q,
+                            np.log2(np.maximum(scales, 1e-3)), content * q[:, None]])
+
+
+def content_features(processor, video_path, num_frames=8, analysis_width=320, frame_step=2):
+    """Content features of a title, in CONTENT_FEATURES order.
+
+    Frame features are averaged over num_frames evenly spaced frames
+    (decoded at up to CONTENT_ANALYSIS_WIDTH pixels wide); the temporal
+    ones come from one analyze_video pass.
+    """
+    from frame_source import read_frames
+
+    profile = processor.analyze_video(str(video_path), analysis_width=analysis_width, frame_step=frame_step)
+    if len(profile['frame_indices']) == 0:
+        raise ValueError(f"No frames could be analyzed in {video_path}")
+    segments = profile['segments']
+    lengths = np.array([s.end_frame - s.start_frame for s in segments], dtype=np.float64)
+    complexity = np.average([s.complexity for s in segments], weights=lengths) if lengths.sum() else 0.0
+    # The first analyzed frame has nothing to be compared with
+    after_first = lambda values: float(np.mean(values[1:])) if len(values) > 1 else 0.0
+    temporal = [float(np.mean(profile['spatial_information'])), after_first(profile['temporal_information']),
+                after_first(profile['motion']), after_first(profile['motion_residual']), complexity]
+
+    last_frame = int(profile['frame_indices'][-1])
+    indices = np.linspace(0, last_frame, num_frames, dtype=int).tolist()
+    width = min(CONTENT_ANALYSIS_WIDTH, profile['width'])
+    frames = read_frames(video_path, width=width, pix_fmt='bgr24', frame_indices=indices, read_ahead=0)
+    frame_features = np.asarray(processor.analyze_frames(frames)).mean(axis=0)
+    return np.concatenate([frame_features, temporal]).astype(np.float32)
+
+
+class DatasetBuilder:
+    """Append measured encodes of titles to a JSON-lines dataset.
+
+    Each row holds a title's content features, the encode settings (CRF,
+    resolution and the resulting scale) and the measured SSIM, PSNR and
+    bitrate. Measurements come from TargetQualitySearch.sample, whose
+    trial encodes are cached on disk, so titles searched before cost no
+    new encodes. Titles already in the dataset are skipped.
+    """
+
+    def __init__(self, dataset_path, compressor=None, processor=None, search=None):
+        self.dataset_path = Path(dataset_path)
+        if compressor is None:
+            from compression import VideoCompressor
+            compressor = VideoCompressor()
+        if processor is None:
+            from native import load_video_processor
+
+            VideoProcessor = load_video_processor()
+            if VideoProcessor is None:
+                raise RuntimeError("Building a rate-quality dataset needs the compiled VideoProcessor extension")
+            processor = VideoProcessor()
+        if search is None:
+            from target_quality import TargetQualitySearch
+            search = TargetQualitySearch(compressor)
+        self.compressor = compressor
+        self.processor = processor
+        self.search = search
+
+    def _known_fingerprints(self):
+        if not self.dataset_path.exists():
+            return set()
+        return {json.loads(line)['fingerprint'] for line in self.dataset_path.read_text().splitlines() if line}
+
+    def add_title(self, video_path, resolutions=None, crfs=DEFAULT_CRFS, preset='medium'):
+        """Measure one title and append its rows; returns the rows added."""
+        fingerprint = file_fingerprint(video_path)
+        if fingerprint in self._known_fingerprints():
+            return []
+        probe = self.compressor._probe(video_path)
+        video_info = self.compressor._video_stream(probe)
+        width, height = int(video_info['width']), int(video_info['height'])
+        fps = float(Fraction(video_info['avg_frame_rate']))
+
+        content = content_features(self.processor, video_path).tolist()
+        trials = self.search.sample(video_path, resolutions=resolutions, crfs=crfs, preset=preset)
+        rows = []
+        for trial in trials:
+            out_width, out_height = self.compressor._get_output_resolution(width, height, trial['resolution'])
+            rows.append({
+                'input': str(video_path),
+                'fingerprint': fingerprint,
+                'content': content,
+                'crf': trial['crf'],
+                'resolution': trial['resolution'],
+                'scale': out_height / height,
+                'ssim': trial['ssim'],
+                'psnr': trial['psnr'],
+                'bitrate_kbps': trial['bitrate_kbps'],
+                'bits_per_pixel': trial['bitrate_kbps'] * 1000 / (out_width * out_height * fps),
+            })
+        self.add_rows(rows)
+        return rows
+
+    def add_rows(self, rows):
+        """Append rows measured elsewhere (same keys as add_title produces)."""
+        self.dataset_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dataset_path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+
+
+def load_dataset(dataset_path):
+    """Return (content, crfs, scales, targets) arrays of a dataset file."""
+    rows = [json.loads(line) for line in Path(dataset_path).read_text().splitlines() if line.strip()]
+    if not rows:
+        raise ValueError(f"Empty rate-quality dataset: {dataset_path}")
+    content = np.array([row['content'] for row in rows], dtype=np.float64)
+    crfs = np.array([row['crf'] for row in rows], dtype=np.float64)
+    scales = np.array([row['scale'] for row in rows], dtype=np.float64)
+    targets = np.column_stack([[row['ssim'] for row in rows],
+                               np.log([row['bits_per_pixel'] for row in rows])])
+    return content, crfs, scales, targets
+
+
+class RateQualityModel:
+    """Ridge regression from content features and settings to SSIM and bitrate.
+
+    weights has one row per model input and one column per target; inputs
+    are raw (unnormalized) values, the standardization used in training is
+    folded into the weights. content_mean fills in unknown (NaN) content
+    features.
+    """
+
+    def __init__(self, weights, content_mean):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.content_mean = np.asarray(content_mean, dtype=np.float32)
+        expected = (2 * len(CONTENT_FEATURES) + 4, len(TARGETS))
+        if self.weights.shape != expected or self.content_mean.shape != (len(CONTENT_FEATURES),):
+            raise ValueError(f"Rate-quality weights must have shape {expected}")
+
+    @classmethod
+    def fit(cls, content, crfs, scales, targets, alpha=1.0):
+        """Fit on measured encodes; alpha is the ridge penalty on standardized inputs."""
+        content_mean = np.nanmean(content, axis=0)
+        content = np.where(np.isnan(content), content_mean, content)
+        inputs = model_inputs(content, crfs, scales)[:, 1:]
+        input_mean = inputs.mean(axis=0)
+        input_std = inputs.std(axis=0)
+        input_std[input_std == 0] = 1.0
+        standardized = (inputs - input_mean) / input_std
+        target_mean = targets.mean(axis=0)
+
+        gram = standardized.T @ standardized + alpha * np.eye(standardized.shape[1])
+        coefficients = np.linalg.solve(gram, standardized.T @ (targets - target_mean))
+        # y = target_mean + ((x - mean) / std) @ W, rewritten for raw inputs
+        scaled = coefficients / input_std[:, None]
+        weights = np.vstack([target_mean - input_mean @ scaled, scaled])
+        return cls(weights, content_mean)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        data = Path(path).read_bytes()
+        magic, version, num_content, num_inputs, num_outputs = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a rate-quality model: {path}")
+        if version != _FORMAT_VERSION or num_content != len(CONTENT_FEATURES):
+            raise ValueError(f"Rate-quality model {path} has an incompatible format")
+        values = np.frombuffer(data, dtype='<f4', offset=_HEADER.size)
+        if len(values) != num_content + num_inputs * num_outputs:
+            raise ValueError(f"Truncated rate-quality model: {path}")
+        return cls(values[num_content:].reshape(num_inputs, num_outputs), values[:num_content])
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        """Write the compact binary format read by VideoProcessor."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, len(CONTENT_FEATURES), *self.weights.shape)
+        path.write_bytes(header + self.content_mean.astype('<f4').tobytes()
+                         + self.weights.astype('<f4').tobytes())
+
+    def predict(self, content, crfs, scales):
+        """Predict SSIM and bits per pixel (per frame) for every candidate at once.
+
+        content is one title's features, or one row of features per candidate.
+        """
+        content = np.asarray(content, dtype=np.float32)
+        content = np.where(np.isnan(content), self.content_mean, content)
+        outputs = model_inputs(content, crfs, scales) @ self.weights
+        return {'ssim': np.clip(outputs[:, 0], 0.0, 1.0), 'bits_per_pixel': np.exp(outputs[:, 1])}
+
+    def choose(self, content, width, height, fps, target_ssim, crfs=range(16, 41), resolutions=None,
+               output_size=None):
+        """Cheapest predicted (resolution, crf) meeting target_ssim, without encoding.
+
+        resolutions defaults to the original size plus every standard size
+        below it, scaled by output_size (VideoCompressor's resolution
+        mapping by default). Falls back to the best predicted quality when
+        no candidate is predicted to meet the target.
+        """
+        if output_size is None:
+            from compression import VideoCompressor
+            output_size = VideoCompressor._get_output_resolution
+        if resolutions is None:
+            resolutions = ['original'] + [r for r, h in _RESOLUTION_HEIGHTS.items() if h < height]
+        candidates = [(resolution, crf) for resolution in resolutions for crf in crfs]
+        sizes = [output_size(width, height, resolution) for resolution, _ in candidates]
+        predicted = self.predict(content, [crf for _, crf in candidates], [h / height for _, h in sizes])
+        bitrates = predicted['bits_per_pixel'] * np.array([w * h for w, h in sizes]) * fps / 1000
+
+        meeting = np.flatnonzero(predicted['ssim'] >= target_ssim)
+        best = meeting[np.argmin(bitrates[meeting])] if len(meeting) else int(np.argmax(predicted['ssim']))
+        return {
+            'resolution': candidates[best][0],
+            'crf': int(candidates[best][1]),
+            'ssim': float(predicted['ssim'][best]),
+            'bitrate_kbps': float(bitrates[best]),
+            'met_target': bool(len(meeting)),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='measure titles and append them to a dataset')
+    build.add_argument('videos', nargs='+')
+    build.add_argument('--dataset', required=True)
+    build.add_argument('--crfs', type=int, nargs='+', default=list(DEFAULT_CRFS))
+    train = commands.add_parser('train', help='fit the model on a dataset')
+    train.add_argument('--dataset', required=True)
+    train.add_argument('--output', default=str(DEFAULT_MODEL_PATH))
+    train.add_argument('--alpha', type=float, default=1.0, help='ridge penalty')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        builder = DatasetBuilder(args.dataset)
+        for video in args.videos:
+            rows = builder.add_title(video, crfs=args.crfs)
+            print(f"{video}: {len(rows)} measurements" if rows else f"{video}: already in the dataset",
+                  file=sys.stderr)
+        return 0
+
+    content, crfs, scales, targets = load_dataset(args.dataset)
+    model = RateQualityModel.fit(content, crfs, scales, targets, alpha=args.alpha)
+    predicted = model.predict(content, crfs, scales)
+    print(f"Fit on {len(crfs)} encodes; training SSIM mean absolute error "
+          f"{np.mean(np.abs(predicted['ssim'] - targets[:, 0])):.4f}", file=sys.stderr)
+    model.save(args.output)
+    print(f"Model written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
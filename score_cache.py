@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from metadata_cache import DEFAULT_CACHE_DIR
+
+# Bumped whenever the native metrics change, so stale PSNR/SSIM values are recomputed
+METRICS_VERSION = 2
+_SAMPLE_BLOCKS = 16
+_BLOCK_SIZE = 64 * 1024
+
+
+def file_fingerprint(path, num_blocks=_SAMPLE_BLOCKS, block_size=_BLOCK_SIZE):
+    """Fast content fingerprint: the file size plus a hash of sampled blocks.
+
+    Blocks are read at evenly spaced offsets (always including the start and
+    the end of the file), so fingerprinting a multi-gigabyte video reads
+    about a megabyte. Unlike a (path, mtime) key, copies and renames of a
+    file share its fingerprint.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= num_blocks * block_size:
+            digest.update(f.read())
+        else:
+            step = (size - block_size) / (num_blocks - 1)
+            for i in range(num_blocks):
+                f.seek(int(i * step))
+                digest.update(f.read(block_size))
+    return f"{size}-{digest.hexdigest()}"
+
+
+_checkpoint_hashes = {}
+_checkpoint_hashes_lock = threading.Lock()
+
+
+def checkpoint_fingerprint(path):
+    """Full content hash of a model file, or None if it does not exist.
+
+    Hashes are remembered per (path, size, mtime), so a checkpoint is only
+    read once per process.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    with _checkpoint_hashes_lock:
+        if key in _checkpoint_hashes:
+            return _checkpoint_hashes[key]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    with _checkpoint_hashes_lock:
+        _checkpoint_hashes[key] = digest.hexdigest()
+    return _checkpoint_hashes[key]
+
+
+class ScoreCache:
+    """Quality scores and per-frame metrics keyed by content fingerprints.
+
+    Entries live in a SQLite store bounded to max_bytes of JSON values; the
+    least recently used entries are evicted once it grows past that. Pass
+    db_path=None for a cache that only lives as long as the process. Safe
+    to share between threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_DIR / 'scores.sqlite', max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        try:
+            if db_path is None:
+                raise OSError
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._create_table()
+        except (OSError, sqlite3.Error):
+            # No (or an unwritable) cache location: keep the cache in memory
+            self._db = sqlite3.connect(':memory:', check_same_thread=False)
+            self._create_table()
+
+    def _create_table(self):
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            'key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_used REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)')
+        self._db.commit()
+
+    @staticmethod
+    def make_key(kind, *parts):
+        """Combine a result kind and everything the result depends on into a key."""
+        text = json.dumps([kind] + [str(p) if isinstance(p, Path) else p for p in parts])
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            row = self._db.execute('SELECT value FROM scores WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._db.execute('UPDATE scores SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a JSON-serializable value, evicting old entries if needed."""
+        text = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO scores (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                (key, text, len(text), time.time())
+            )
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM scores').fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._db.execute(
+                    'SELECT key, size FROM scores ORDER BY last_used LIMIT 1').fetchone()
+                if oldest is None or oldest[0] == key:
+                    break
+                self._db.execute('DELETE FROM scores WHERE key = ?', (oldest[0],))
+                total -= oldest[1]
+                self._evictions += 1
+            self._db.commit()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        """Hit/miss counters for this process plus the size of the store."""
+        with self._lock:
+            entries, size = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scores').fetchone()
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'entries': entries,
+                'bytes': size,
+            }
+
+    def clear(self):
+        """Drop every cached result and reset the statistics."""
+        with self._lock:
+            self._db.execute('DELETE FROM scores')
+            self._db.commit()
+            self._hits = self._misses = self._evictions = 0
+
+
+def compare_videos_cached(processor, reference_path, distorted_path, cache=None, **options):
+    """VideoProcessor.compare_videos with the result cached by file content.
+
+    Per-frame psnr/ssim arrays are stored along with the summary values and
+    returned as numpy arrays, as from compare_videos itself.
+    """
+    cache = cache or get_score_cache()
+    key = ScoreCache.make_key('compare_videos', METRICS_VERSION, file_fingerprint(reference_path),
+                              file_fingerprint(distorted_path),
+                              [(name, repr(value)) for name, value in sorted(options.items())])
+
+    def compute():
+        result = processor.compare_videos(str(reference_path), str(distorted_path), **options)
+        return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in result.items()}
+
+    result = cache.get_or_compute(key, compute)
+    for name in ('frame_indices', 'psnr', 'ssim'):
+        result[name] = np.asarray(result[name])
+    return result
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_score_cache():
+    """Return the process-wide cache shared by the assessor and the compressor."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ScoreCache()
+        return _default_cache
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or clear the quality score cache')
+    parser.add_argument('--clear', action='store_true')
+    args = parser.parse_args()
+
+    cache = get_score_cache()
+    if args.clear:
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
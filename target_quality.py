@@ -0,0 +1,320 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+
+import ffmpeg
+
+from metadata_cache import DEFAULT_CACHE_DIR
+from native import load_video_processor
+from score_cache import METRICS_VERSION
+
+DEFAULT_TRIAL_CACHE_DIR = DEFAULT_CACHE_DIR / 'trials'
+STANDARD_RESOLUTIONS = ('original', '1080p', '720p', '480p')
+
+
+class TargetQualitySearch:
+    """Find the cheapest CRF/resolution that meets a PSNR or SSIM target.
+
+    A few short segments spread over the title are cut losslessly once and
+    then trial-encoded at candidate settings; every trial is scored against
+    its lossless reference with VideoProcessor.compare_videos. For each
+    resolution, bisection over CRF finds the highest CRF whose mean
+    quality still meets the target (quality falls monotonically with CRF),
+    and the resolution with the lowest resulting bitrate wins.
+
+    Trial results are cached on disk per title (path, size, mtime) and
+    search parameters, so repeated searches only encode what is missing.
+    """
+
+    def __init__(self, compressor, metric='ssim', num_segments=3, segment_seconds=2.0,
+                 max_workers=None, cache_dir=DEFAULT_TRIAL_CACHE_DIR):
+        if metric not in ('psnr', 'ssim'):
+            raise ValueError(f"Unknown quality metric: {metric!r}")
+        self.compressor = compressor
+        self.metric = metric
+        self.num_segments = num_segments
+        self.segment_seconds = segment_seconds
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._lock = threading.Lock()
+
+    def _segment_starts(self, duration):
+        """Evenly spread segment start times, each centered in its slice of the title."""
+        length = min(self.segment_seconds, duration / self.num_segments)
+        return [max(0.0, duration * (i + 0.5) / self.num_segments - length / 2)
+                for i in range(self.num_segments)], length
+
+    def _cache_path(self, input_path, preset, starts, length):
+        stat = os.stat(input_path)
+        key = json.dumps([str(Path(input_path).resolve()), stat.st_size, stat.st_mtime_ns,
+                          preset, [round(s, 3) for s in starts], round(length, 3), METRICS_VERSION])
+        return self.cache_dir / (hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def _load_trials(self, cache_path):
+        if cache_path and cache_path.exists():
+            try:
+                return json.loads(cache_path.read_text())
+            except ValueError:
+                pass
+        return {}
+
+    def _save_trials(self, cache_path, trials):
+        if not cache_path:
+            return
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(trials, indent=1))
+        os.replace(tmp_path, cache_path)
+
+    def _cut_reference(self, input_path, start, num_frames, fps, output_path):
+        """Cut a lossless, video-only reference segment from the source."""
+        (
+            ffmpeg.input(str(input_path), ss=f"{max(0.0, start - 0.5 / fps):.6f}")
+            .output(str(output_path), vframes=num_frames, an=None,
+                    vcodec='libx264', qp=0, preset='ultrafast')
+            .overwrite_output()
+            .run(quiet=True)
+        )
+
+    def _run_trial(self, processor, references, work_dir, resolution, crf, preset, width, height):
+        """Encode and score every reference segment at one (resolution, crf) point."""
+        output_width, output_height = self.compressor._get_output_resolution(width, height, resolution)
+
+        def encode_and_score(index):
+            reference, seconds = references[index]
+            trial_path = work_dir / f"trial_{resolution}_{crf}_{index}.mp4"
+            (
+                ffmpeg.input(str(reference))
+                .output(str(trial_path), vcodec='libx264', crf=crf, preset=preset,
+                        s=f"{output_width}x{output_height}", threads=1)
+                .overwrite_output()
+                .run(quiet=True)
+            )
+            try:
+                comparison = processor.compare_videos(str(reference), str(trial_path))
+                return comparison, os.path.getsize(trial_path), seconds
+            finally:
+                os.remove(trial_path)
+
+        # Segments are independent, so they are encoded and scored concurrently
+        with ThreadPoolExecutor(max_workers=len(references)) as executor:
+            measured = list(executor.map(encode_and_score, range(len(references))))
+
+        total_frames = sum(c['frames_compared'] for c, _, _ in measured)
+        psnr = sum(c['psnr_mean'] * c['frames_compared'] for c, _, _ in measured)
+        ssim = sum(c['ssim_mean'] * c['frames_compared'] for c, _, _ in measured)
+        total_bytes = sum(size for _, size, _ in measured)
+        total_seconds = sum(seconds for _, _, seconds in measured)
+
+        return {
+            'resolution': resolution,
+            'crf': crf,
+            'psnr': psnr / max(1, total_frames),
+            'ssim': ssim / max(1, total_frames),
+            'bitrate_kbps': total_bytes * 8 / 1000 / total_seconds,
+        }
+
+    def _explore(self, input_path, preset, resolutions, explore):
+        """Set up trial encoding for a title and run explore(trial, resolutions).
+
+        trial(resolution, crf) returns the (possibly cached) measurement for
+        one setting and is safe to call from several threads. Returns
+        explore's result and every trial known for the title.
+        """
+        VideoProcessor = load_video_processor()
+        if VideoProcessor is None:
+            raise RuntimeError("Target-quality search needs the compiled VideoProcessor extension")
+        processor = VideoProcessor()
+
+        probe = self.compressor._probe(input_path)
+        video_info = self.compressor._video_stream(probe)
+        width, height = int(video_info['width']), int(video_info['height'])
+        fps = float(Fraction(video_info['avg_frame_rate']))
+        duration = float(probe['format']['duration'])
+
+        if resolutions is None:
+            resolutions = [r for r in STANDARD_RESOLUTIONS
+                           if r == 'original' or self.compressor._get_output_resolution(width, height, r)[1] < height]
+
+        starts, length = self._segment_starts(duration)
+        num_frames = max(1, int(round(length * fps)))
+        cache_path = self._cache_path(input_path, preset, starts, length) if self.cache_dir else None
+        trials = self._load_trials(cache_path)
+
+        work_dir = Path(tempfile.mkdtemp(prefix='.trials_', dir=Path(input_path).parent))
+        try:
+            references = [(work_dir / f"reference_{i}.mkv", num_frames / fps) for i in range(len(starts))]
+            references_lock = threading.Lock()
+
+            def cut_references():
+                """Cut the reference segments once, and only if a trial is not cached."""
+                with references_lock:
+                    if all(path.exists() for path, _ in references):
+                        return
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        list(executor.map(
+                            lambda args: self._cut_reference(input_path, args[0], num_frames, fps, args[1][0]),
+                            zip(starts, references)
+                        ))
+
+            def trial(resolution, crf):
+                key = f"{resolution}:{crf}"
+                with self._lock:
+                    cached = trials.get(key)
+                if cached is None:
+                    cut_references()
+                    cached = self._run_trial(processor, references, work_dir, resolution, crf,
+                                             preset, width, height)
+                    with self._lock:
+                        trials[key] = cached
+                        self._save_trials(cache_path, trials)
+                return cached
+
+            result = explore(trial, resolutions)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return result, sorted(trials.values(), key=lambda t: (t['resolution'], t['crf']))
+
+    def _predicted_windows(self, model, input_path, target, resolutions, crf_range, margin):
+        """CRF windows around the rate-quality model's prediction, per resolution."""
+        from rate_quality import content_features
+
+        processor = load_video_processor()()
+        video_info = self.compressor._video_stream(self.compressor._probe(input_path))
+        width, height = int(video_info['width']), int(video_info['height'])
+        content = content_features(processor, input_path)
+        crfs = list(range(crf_range[0], crf_range[1] + 1))
+
+        windows = {}
+        for resolution in resolutions:
+            scale = self.compressor._get_output_resolution(width, height, resolution)[1] / height
+            ssim = model.predict(content, crfs, [scale] * len(crfs))['ssim']
+            meeting = [crf for crf, value in zip(crfs, ssim) if value >= target]
+            predicted = max(meeting) if meeting else crf_range[0]
+            windows[resolution] = (max(crf_range[0], predicted - margin), min(crf_range[1], predicted + margin))
+        return windows
+
+    def search(self, input_path, target, resolutions=None, preset='medium', crf_range=(16, 40),
+               model=None, margin=3):
+        """Return the cheapest setting meeting target along with all trials run.
+
+        target is a mean SSIM (0-1) or PSNR (dB) depending on the metric.
+        resolutions defaults to the original size plus every standard size
+        below it. The result has keys crf, resolution, quality,
+        bitrate_kbps, met_target and trials.
+
+        With a rate_quality.RateQualityModel (SSIM targets only), each
+        bisection starts in a window of +-margin CRF around the predicted
+        CRF and only widens when the answer lies outside it, which usually
+        halves the number of trial encodes.
+        """
+        if model is not None and self.metric != 'ssim':
+            raise ValueError("Rate-quality models predict SSIM; use metric='ssim'")
+
+        def explore(trial, resolutions):
+            windows = {}
+            if model is not None:
+                windows = self._predicted_windows(model, input_path, target, resolutions, crf_range, margin)
+
+            def bisect_range(resolution, low, high):
+                best = None
+                while low <= high:
+                    crf = (low + high) // 2
+                    result = trial(resolution, crf)
+                    if result[self.metric] >= target:
+                        best = result
+                        low = crf + 1
+                    else:
+                        high = crf - 1
+                return best
+
+            def bisect(resolution):
+                """Highest CRF in crf_range meeting the target at this resolution."""
+                low, high = windows.get(resolution, crf_range)
+                best = bisect_range(resolution, low, high)
+                # The prediction was off: continue below or above the window
+                if best is None and low > crf_range[0]:
+                    best = bisect_range(resolution, crf_range[0], low - 1)
+                elif best is not None and best['crf'] == high and high < crf_range[1]:
+                    best = bisect_range(resolution, high + 1, crf_range[1]) or best
+                return best or trial(resolution, crf_range[0])
+
+            # Resolutions are searched concurrently; each bisection is sequential
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(resolutions))) as executor:
+                return list(executor.map(bisect, resolutions))
+
+        candidates, trials = self._explore(input_path, preset, resolutions, explore)
+
+        meeting = [c for c in candidates if c[self.metric] >= target]
+        if meeting:
+            best = min(meeting, key=lambda c: c['bitrate_kbps'])
+        else:
+            best = max(candidates, key=lambda c: c[self.metric])
+        return {
+            'crf': best['crf'],
+            'resolution': best['resolution'],
+            'quality': best[self.metric],
+            'bitrate_kbps': best['bitrate_kbps'],
+            'met_target': bool(meeting),
+            'trials': trials,
+        }
+
+    def sample(self, input_path, resolutions=None, crfs=(20, 24, 28, 32, 36), preset='medium'):
+        """Measure every resolution/CRF combination and return the trials.
+
+        The points describe the title's rate-quality curves, e.g. as input
+        for convex_hull_ladder.
+        """
+        def explore(trial, resolutions):
+            grid = [(resolution, crf) for resolution in resolutions for crf in crfs]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(grid))) as executor:
+                return list(executor.map(lambda point: trial(*point), grid))
+
+        points, _ = self._explore(input_path, preset, resolutions, explore)
+        return points
+
+
+def convex_hull_ladder(trials, num_rungs, metric='ssim'):
+    """Pick ladder rungs from the upper rate-quality convex hull of trials.
+
+    Points are compared in (log bitrate, quality) space; only points on the
+    upper hull are efficient, i.e. no other resolution/CRF mix gives more
+    quality for the bitrate. From the hull, num_rungs points spread evenly
+    in log bitrate are returned, cheapest first.
+    """
+    points = sorted(trials, key=lambda t: (t['bitrate_kbps'], -t[metric]))
+    if not points:
+        return []
+
+    def cross(o, a, b):
+        ox, oy = math.log(o['bitrate_kbps']), o[metric]
+        return ((math.log(a['bitrate_kbps']) - ox) * (b[metric] - oy) -
+                (a[metric] - oy) * (math.log(b['bitrate_kbps']) - ox))
+
+    hull = []
+    for point in points:
+        # Drop points that gain no quality over a cheaper one, then keep the hull concave
+        if hull and point[metric] <= hull[-1][metric]:
+            continue
+        while len(hull) >= 2 and cross(hull[-2], hull[-1], point) >= 0:
+            hull.pop()
+        hull.append(point)
+
+    if len(hull) <= num_rungs:
+        return hull
+    low, high = math.log(hull[0]['bitrate_kbps']), math.log(hull[-1]['bitrate_kbps'])
+    rungs = []
+    for i in range(num_rungs):
+        target = low + (high - low) * i / max(1, num_rungs - 1)
+        nearest = min((p for p in hull if p not in rungs),
+                      key=lambda p: abs(math.log(p['bitrate_kbps']) - target))
+        rungs.append(nearest)
+    return sorted(rungs, key=lambda p: p['bitrate_kbps'])
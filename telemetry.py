@@ -0,0 +1,197 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage
+    resource = None
+
+# Peak RSS is reported by getrusage in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process and of its (ffmpeg) children.
+
+    Returns None where getrusage is unavailable (Windows).
+    """
+    if resource is None:
+        return None
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * _RSS_UNIT,
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Telemetry:
+    """Stage timings, encoder throughput and memory, exported for monitoring.
+
+    Each stage() block adds its wall time to a per-stage count/sum/max
+    summary; that is a perf_counter call and a short locked update, so the
+    instrumentation stays on in production. With trace=True every stage is
+    also kept as a Chrome trace event (the last max_events of them) for
+    chrome://tracing or Perfetto.
+    """
+
+    def __init__(self, trace=False, max_events=100000):
+        self.trace = trace
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._encodes = {'count': 0, 'frames': 0, 'fps': None, 'speed': None}
+        self._events = deque(maxlen=max_events)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def stage(self, name, **args):
+        """Time the enclosed block as one run of the named stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, started, **args)
+
+    def record(self, name, seconds, started=None, **args):
+        """Add one run of a stage that took seconds (started is a perf_counter value)."""
+        with self._lock:
+            summary = self._stages.get(name)
+            if summary is None:
+                summary = self._stages[name] = {'count': 0, 'sum': 0.0, 'max': 0.0}
+            summary['count'] += 1
+            summary['sum'] += seconds
+            summary['max'] = max(summary['max'], seconds)
+            if self.trace:
+                if started is None:
+                    started = time.perf_counter() - seconds
+                self._events.append({
+                    'name': name, 'cat': 'stage', 'ph': 'X', 'pid': self._pid,
+                    'tid': threading.get_ident(), 'ts': started * 1e6, 'dur': seconds * 1e6,
+                    'args': {k: str(v) for k, v in args.items()},
+                })
+
+    def record_encode(self, stats):
+        """Keep the fps and speed ffmpeg reported at the end of an encode."""
+        with self._lock:
+            self._encodes['count'] += 1
+            self._encodes['frames'] += stats.get('frame') or 0
+            if stats.get('fps') is not None:
+                self._encodes['fps'] = stats['fps']
+            if stats.get('speed') is not None:
+                self._encodes['speed'] = stats['speed']
+
+    def snapshot(self, native=True):
+        """All current values as a dict (native VideoProcessor counters if built)."""
+        with self._lock:
+            result = {
+                'stages': {name: dict(summary) for name, summary in self._stages.items()},
+                'encodes': dict(self._encodes),
+            }
+        result['peak_rss_bytes'] = peak_rss_bytes()
+        result['native'] = _native_stats() if native else {}
+        return result
+
+    def prometheus_text(self):
+        """Render the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP vco_stage_seconds Wall time spent in each pipeline stage.',
+            '# TYPE vco_stage_seconds summary',
+        ]
+        for name, summary in sorted(snapshot['stages'].items()):
+            label = f'stage="{_escape(name)}"'
+            lines.append(f"vco_stage_seconds_count{{{label}}} {summary['count']}")
+            lines.append(f"vco_stage_seconds_sum{{{label}}} {summary['sum']:.6f}")
+        lines += ['# HELP vco_stage_seconds_max Longest single run of each stage.',
+                  '# TYPE vco_stage_seconds_max gauge']
+        for name, summary in sorted(snapshot['stages'].items()):
+            lines.append(f"vco_stage_seconds_max{{stage=\"{_escape(name)}\"}} {summary['max']:.6f}")
+
+        encodes = snapshot['encodes']
+        lines += ['# HELP vco_encodes_total Finished ffmpeg runs.', '# TYPE vco_encodes_total counter',
+                  f"vco_encodes_total {encodes['count']}",
+                  '# HELP vco_encoded_frames_total Frames written by finished ffmpeg runs.',
+                  '# TYPE vco_encoded_frames_total counter',
+                  f"vco_encoded_frames_total {encodes['frames']}"]
+        for key, help_text in (('fps', 'Frames per second'), ('speed', 'Speed relative to real time')):
+            if encodes[key] is not None:
+                lines += [f"# HELP vco_encode_{key} {help_text} ffmpeg reported for the last run.",
+                          f"# TYPE vco_encode_{key} gauge", f"vco_encode_{key} {encodes[key]}"]
+
+        if snapshot['peak_rss_bytes'] is not None:
+            lines += ['# HELP vco_peak_rss_bytes Peak resident set size.', '# TYPE vco_peak_rss_bytes gauge']
+            for process, value in snapshot['peak_rss_bytes'].items():
+                lines.append(f'vco_peak_rss_bytes{{process="{process}"}} {value}')
+
+        if snapshot['native']:
+            for key, kind, help_text in (('calls', 'counter', 'Calls into the native VideoProcessor.'),
+                                         ('frames', 'counter', 'Frames processed by the native VideoProcessor.'),
+                                         ('seconds', 'counter', 'Time spent in native VideoProcessor calls.')):
+                metric = f"vco_native_{key}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+                for call, counters in sorted(snapshot['native'].items()):
+                    lines.append(f'{metric}{{call="{_escape(call)}"}} {counters[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the metrics for a node_exporter textfile collector (atomically)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def chrome_trace(self):
+        """The recorded stages as a Chrome trace-event document."""
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def reset(self):
+        """Drop every recorded value, including the native counters."""
+        with self._lock:
+            self._stages.clear()
+            self._encodes = {'count': 0, 'frames': 0, 'fps': None, 'speed': None}
+            self._events.clear()
+        VideoProcessor = _loaded_video_processor()
+        if VideoProcessor is not None and hasattr(VideoProcessor, 'reset_stats'):
+            VideoProcessor.reset_stats()
+
+
+def _loaded_video_processor():
+    """The VideoProcessor class if the extension has been imported; never imports it."""
+    for name in ('video_processor', 'cpp_src.build.video_processor'):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, 'VideoProcessor'):
+            return module.VideoProcessor
+    return None
+
+
+def _native_stats():
+    VideoProcessor = _loaded_video_processor()
+    if VideoProcessor is None or not hasattr(VideoProcessor, 'stats'):
+        return {}
+    return VideoProcessor.stats()
+
+
+_default_telemetry = None
+_default_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Return the process-wide Telemetry; VCO_TRACE=1 enables trace events."""
+    global _default_telemetry
+    with _default_telemetry_lock:
+        if _default_telemetry is None:
+            _default_telemetry = Telemetry(trace=os.environ.get('VCO_TRACE', '') not in ('', '0'))
+        return _default_telemetry
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import BatchRunner, discover_jobs, read_manifest
+
+
+class FakeAssessor:
+    def assess_quality(self, video_path):
+        return 0.5
+
+
+class FakeCompressor:
+    """Fails the first encode of every input, then succeeds."""
+
+    def __init__(self):
+        self.quality_assessor = FakeAssessor()
+        self.calls = []
+
+    def compress_video(self, input_path, settings, assess_quality=True):
+        self.calls.append((input_path, settings, assess_quality))
+        if sum(1 for call in self.calls if call[0] == input_path) == 1:
+            raise RuntimeError("FFmpeg error: transient")
+        return {'output_path': input_path + '.out', 'compression_ratio': 0.25,
+                'encode_stats': {'fps': 100.0}}
+
+
+def test_manifest_accepts_paths_and_json(tmp_path):
+    manifest = tmp_path / 'jobs.txt'
+    manifest.write_text('# backlog\na.mp4\n{"input": "/abs/b.mp4", "settings": {"crf": 30}}\n')
+    jobs = read_manifest(manifest)
+    assert jobs == [{'input': str(tmp_path / 'a.mp4'), 'settings': {}},
+                    {'input': '/abs/b.mp4', 'settings': {'crf': 30}}]
+
+
+def test_discover_skips_previous_outputs(tmp_path):
+    for name in ('a.mp4', 'a_compressed.mp4', 'notes.txt'):
+        (tmp_path / name).write_text('')
+    assert [job['input'] for job in discover_jobs(tmp_path)] == [str(tmp_path / 'a.mp4')]
+
+
+def test_runner_retries_and_scores_outside_the_encode():
+    compressor = FakeCompressor()
+    runner = BatchRunner(compressor, {'preset': 'medium', 'resolution': 'original'},
+                         max_jobs=2, retries=1, retry_delay=0)
+    records = runner.run([{'input': 'a.mp4', 'settings': {}},
+                          {'input': 'b.mp4', 'settings': {'threads': 3}}])
+
+    assert sorted(r['input'] for r in records) == ['a.mp4', 'b.mp4']
+    assert all(r['status'] == 'done' and r['attempts'] == 2 and r['quality_score'] == 0.5
+               for r in records)
+    assert all(assess is False for _, _, assess in compressor.calls)
+    threads = {path: settings['threads'] for path, settings, _ in compressor.calls}
+    assert threads['a.mp4'] == runner.threads and threads['b.mp4'] == 3
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import threading
+import time
+
+import ffmpeg
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ffmpeg_progress import AggregateProgress, EncodeCancelled, FFmpegProgress, run_with_progress
+
+
+PROGRESS_BLOCK = """frame=250
+fps=125.00
+stream_0_0_q=28.0
+bitrate= 812.4kbits/s
+total_size=1015808
+out_time_us=5000000
+out_time_ms=5000000
+out_time=00:00:05.000000
+dup_frames=0
+drop_frames=0
+speed=2.5x
+progress=continue
+"""
+
+
+def feed(tracker, text):
+    for line in text.splitlines():
+        tracker.feed_line(line)
+
+
+def test_progress_block_is_parsed():
+    reports = []
+    tracker = FFmpegProgress(duration=20.0, callback=reports.append)
+    feed(tracker, PROGRESS_BLOCK)
+
+    assert len(reports) == 1
+    stats = reports[0]
+    assert stats['percent'] == 25.0
+    assert stats['frame'] == 250
+    assert stats['fps'] == 125.0
+    assert stats['speed'] == 2.5
+    assert stats['bitrate_kbps'] == 812.4
+    assert stats['total_size'] == 1015808
+    assert stats['eta'] == 6.0
+    assert not stats['finished']
+
+
+def test_callbacks_are_throttled_but_end_is_always_reported():
+    reports = []
+    tracker = FFmpegProgress(duration=20.0, callback=reports.append, min_interval=3600)
+    feed(tracker, PROGRESS_BLOCK)
+    feed(tracker, PROGRESS_BLOCK)
+    feed(tracker, PROGRESS_BLOCK.replace('progress=continue', 'progress=end'))
+
+    assert len(reports) == 2
+    assert reports[-1]['finished']
+    assert reports[-1]['percent'] == 100.0
+
+
+def test_unavailable_values_do_not_break_parsing():
+    tracker = FFmpegProgress(duration=None)
+    feed(tracker, "out_time_us=N/A\nspeed=N/A\nbitrate=N/A\nprogress=continue\n")
+
+    assert tracker.stats['percent'] == 0.0
+    assert tracker.stats['speed'] is None
+    assert tracker.stats['eta'] is None
+
+
+def test_aggregate_progress_sums_parts():
+    reports = []
+    progress = AggregateProgress(10.0, reports.append, min_interval=0)
+    progress.update(0, 2.0)
+    progress.update(1, 3.0)
+    progress.update(0, 5.0)
+
+    assert reports == [20.0, 50.0, 80.0]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+def test_cancel_event_stops_the_encode(tmp_path):
+    cancel = threading.Event()
+    stream = (
+        ffmpeg.input('testsrc=size=320x240:rate=25', f='lavfi', t=600)
+        .output(str(tmp_path / 'out.mp4'), vcodec='libx264', preset='ultrafast')
+    )
+    # Cancel from the callback, i.e. from another thread's point of view mid-encode
+    callback = lambda stats: cancel.set()
+    started = time.monotonic()
+    with pytest.raises(EncodeCancelled):
+        run_with_progress(stream, 600, callback, min_interval=0, cancel_event=cancel)
+    assert time.monotonic() - started < 30
@@ -0,0 +1,48 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_source import FrameSource
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+
+
+@pytest.fixture(scope='module')
+def clip(tmp_path_factory):
+    path = tmp_path_factory.mktemp('clips') / 'testsrc.mp4'
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', 'testsrc2=size=320x240:rate=25:duration=2',
+                    '-pix_fmt', 'yuv420p', str(path)], check=True)
+    return path
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_selected_frames_are_scaled_inside_ffmpeg(clip, read_ahead):
+    with FrameSource(clip, 224, 224, frame_indices=[0, 10, 49], read_ahead=read_ahead) as source:
+        frames = [frame.copy() for frame in source]
+    assert len(frames) == 3
+    assert all(frame.shape == (224, 224, 3) and frame.dtype == np.uint8 for frame in frames)
+    assert not np.array_equal(frames[0], frames[1])
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_read_batch_fills_the_callers_array(clip, read_ahead):
+    with FrameSource(clip, 160, 120, pix_fmt='gray', every_nth=5, read_ahead=read_ahead) as source:
+        batch = np.empty((4,) + source.frame_shape, dtype=np.uint8)
+        counts = [source.read_batch(batch) for _ in range(4)]
+    assert source.frame_shape == (120, 160)
+    assert counts == [4, 4, 2, 0]
+
+
+def test_frames_are_views_over_reused_buffers(clip):
+    with FrameSource(clip, 64, 48, read_ahead=0) as source:
+        frames = iter(source)
+        first = next(frames)
+        second = next(frames)
+    assert np.shares_memory(first, second)
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_server import JobServer
+
+
+class FakeAssessor:
+    predictor = None
+
+    def assess_frames(self, video_path, num_frames=None):
+        return [0.25, 0.75]
+
+
+class FakeCompressor:
+    """Blocks every encode until release is set, reporting progress on the way."""
+
+    def __init__(self):
+        self.quality_assessor = FakeAssessor()
+        self.release = threading.Event()
+        self.order = []
+        self.threads = []
+
+    def compress_video(self, input_path, settings, progress_callback=None):
+        self.release.wait(5)
+        self.order.append(input_path)
+        self.threads.append(settings['threads'])
+        progress_callback(50.0)
+        return {'output_path': input_path + '.out', 'compression_ratio': 0.5}
+
+
+class FakeProcessor:
+    def analyze_video(self, path, **options):
+        return {'temporal_complexity': np.array([0.1, 0.2]), 'frames': np.int64(2)}
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    status = int(head.split()[1])
+    if b'x-ndjson' in head:
+        return status, [json.loads(line) for line in payload.splitlines()]
+    return status, json.loads(payload)
+
+
+def test_priority_progress_and_cancellation():
+    async def scenario():
+        compressor = FakeCompressor()
+        server = JobServer(compressor, processor_factory=FakeProcessor, max_encodes=1)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            status, first = await request(port, 'POST', '/jobs', {'type': 'compress', 'input': 'first.mp4'})
+            assert status == 202
+            await asyncio.sleep(0.05)  # let the only encode slot pick up the first job
+            _, low = await request(port, 'POST', '/jobs', {'type': 'compress', 'input': 'low.mp4', 'priority': 5})
+            _, high = await request(port, 'POST', '/jobs', {'type': 'compress', 'input': 'high.mp4', 'priority': 1})
+            _, dropped = await request(port, 'POST', '/jobs', {'type': 'compress', 'input': 'drop.mp4', 'priority': 9})
+            assert (await request(port, 'DELETE', f"/jobs/{dropped['id']}"))[0] == 200
+
+            # Encodes are blocked, but analysis jobs have their own workers
+            _, score = await request(port, 'POST', '/jobs', {'type': 'score', 'input': 'first.mp4'})
+            _, analyze = await request(port, 'POST', '/jobs', {'type': 'analyze', 'input': 'first.mp4'})
+            _, events = await request(port, 'GET', f"/jobs/{score['id']}/events")
+            assert events[-1]['state'] == 'done' and events[-1]['result']['quality_score'] == 0.5
+            _, events = await request(port, 'GET', f"/jobs/{analyze['id']}/events")
+            assert events[-1]['result'] == {'temporal_complexity': [0.1, 0.2], 'frames': 2}
+
+            stream = asyncio.ensure_future(request(port, 'GET', f"/jobs/{low['id']}/events"))
+            await asyncio.sleep(0.05)
+            compressor.release.set()
+            _, events = await stream
+            assert [e['event'] for e in events] == ['state', 'started', 'progress', 'done']
+            assert events[0]['state'] == 'queued'
+            assert compressor.order == ['first.mp4', 'high.mp4', 'low.mp4']
+            assert compressor.threads == [server.encode_threads] * 3
+
+            _, job = await request(port, 'GET', f"/jobs/{dropped['id']}")
+            assert job['state'] == 'cancelled'
+            assert (await request(port, 'POST', '/jobs', {'type': 'transcode', 'input': 'a.mp4'}))[0] == 400
+            for body in ([1, 2], 'x', 5, {'type': 'score', 'input': 'a.mp4', 'settings': [1]},
+                         {'type': 'score', 'input': 'a.mp4', 'priority': 'high'}):
+                status, reply = await request(port, 'POST', '/jobs', body)
+                assert status == 400 and 'Invalid job' in reply['error']
+            assert (await request(port, 'GET', '/jobs/99'))[0] == 404
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"POST /jobs HTTP/1.1\r\nContent-Length: lots\r\n\r\n")
+            assert (await reader.read()).startswith(b"HTTP/1.1 400")
+            writer.close()
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /metrics HTTP/1.1\r\n\r\n")
+            metrics = (await reader.read()).decode()
+            writer.close()
+            assert 'text/plain' in metrics and '# TYPE vco_stage_seconds summary' in metrics
+        finally:
+            await server.stop()
+
+    asyncio.run(scenario())
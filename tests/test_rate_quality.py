@@ -0,0 +1,139 @@
+import os
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_quality
+from rate_quality import CONTENT_FEATURES, DatasetBuilder, RateQualityModel, load_dataset, model_inputs
+from target_quality import TargetQualitySearch
+
+
+def synthetic_encodes(count=400, seed=0):
+    """Encodes whose SSIM and log bits per pixel are exactly linear in the model inputs."""
+    rng = np.random.default_rng(seed)
+    content = rng.uniform(0, 1, (count, len(CONTENT_FEATURES)))
+    crfs = rng.integers(16, 41, count).astype(float)
+    scales = rng.choice([1.0, 2 / 3, 4 / 9], count)
+    true_weights = np.zeros((2 * len(CONTENT_FEATURES) + 4, 2))
+    true_weights[0] = [1.05, 0.5]
+    true_weights[len(CONTENT_FEATURES) + 1] = [-0.3, -6.0]           # q
+    true_weights[len(CONTENT_FEATURES) + 3] = [0.02, -0.2]           # log2(scale)
+    true_weights[len(CONTENT_FEATURES) + 4:, 0] = -0.05 * rng.uniform(0, 1, len(CONTENT_FEATURES))
+    targets = model_inputs(content, crfs, scales) @ true_weights
+    return content, crfs, scales, targets
+
+
+def test_fit_save_and_load_round_trip(tmp_path):
+    content, crfs, scales, targets = synthetic_encodes()
+    model = RateQualityModel.fit(content, crfs, scales, targets, alpha=1e-6)
+
+    predicted = model.predict(content, crfs, scales)
+    assert np.abs(predicted['ssim'] - np.clip(targets[:, 0], 0, 1)).max() < 1e-3
+    assert np.allclose(np.log(predicted['bits_per_pixel']), targets[:, 1], atol=1e-3)
+
+    path = tmp_path / 'model.vcrq'
+    model.save(path)
+    data = path.read_bytes()
+    inputs = 2 * len(CONTENT_FEATURES) + 4
+    assert struct.unpack_from('<4sIIII', data) == (b'VCRQ', 1, len(CONTENT_FEATURES), inputs, 2)
+    assert len(data) == 20 + 4 * (len(CONTENT_FEATURES) + inputs * 2)
+
+    loaded = RateQualityModel.load(path)
+    assert np.array_equal(loaded.weights, model.weights)
+    # Unknown content features are predicted at their training mean
+    unknown = np.full(len(CONTENT_FEATURES), np.nan)
+    assert np.allclose(loaded.predict(unknown, [23], [1.0])['ssim'],
+                       loaded.predict(model.content_mean, [23], [1.0])['ssim'])
+
+
+def test_choose_returns_the_cheapest_prediction_meeting_the_target():
+    content, crfs, scales, targets = synthetic_encodes()
+    model = RateQualityModel.fit(content, crfs, scales, targets, alpha=1e-6)
+
+    choice = model.choose(content[0], 1920, 1080, 30.0, target_ssim=0.8)
+    assert choice['met_target'] and choice['ssim'] >= 0.8
+    candidates = [(r, crf) for r in ('original', '720p', '480p') for crf in range(16, 41)]
+    for resolution, crf in candidates:
+        height = {'original': 1080, '720p': 720, '480p': 480}[resolution]
+        width = int(height * 1920 / 1080) // 2 * 2
+        prediction = model.predict(content[0], [crf], [height / 1080])
+        if prediction['ssim'][0] >= 0.8:
+            assert prediction['bits_per_pixel'][0] * width * height * 30 / 1000 >= choice['bitrate_kbps'] - 1e-3
+
+    impossible = model.choose(content[0], 1920, 1080, 30.0, target_ssim=1.5)
+    assert not impossible['met_target'] and impossible['crf'] == 16
+
+
+def test_predicted_settings_reject_psnr_targets(tmp_path):
+    from compression import VideoCompressor
+    from metadata_cache import MetadataCache
+
+    content, crfs, scales, targets = synthetic_encodes()
+    model_path = tmp_path / 'model.vcrq'
+    RateQualityModel.fit(content, crfs, scales, targets).save(model_path)
+    compressor = VideoCompressor(quality_assessor=object(), metadata_cache=MetadataCache(db_path=None))
+    settings = {'preset': 'medium', 'resolution': 'original', 'target_quality': 40, 'quality_metric': 'psnr',
+                'rate_quality_model': str(model_path), 'trial_encodes': False}
+    with pytest.raises(ValueError, match='SSIM'):
+        compressor._resolve_target_quality(tmp_path / 'clip.mp4', settings)
+
+
+class FakeCompressor:
+    def _probe(self, path):
+        return {'streams': [{'codec_type': 'video', 'width': 1280, 'height': 720, 'avg_frame_rate': '25/1'}]}
+
+    def _video_stream(self, probe):
+        return probe['streams'][0]
+
+    def _get_output_resolution(self, width, height, resolution):
+        return (854, 480) if resolution == '480p' else (width, height)
+
+
+class FakeSearch:
+    def __init__(self):
+        self.calls = 0
+
+    def sample(self, path, resolutions=None, crfs=(), preset='medium'):
+        self.calls += 1
+        return [{'resolution': r, 'crf': crf, 'ssim': 0.9, 'psnr': 40.0, 'bitrate_kbps': 1000.0}
+                for r in ('original', '480p') for crf in crfs]
+
+
+def test_dataset_builder_records_each_title_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_quality, 'content_features',
+                        lambda processor, path: np.arange(len(CONTENT_FEATURES), dtype=np.float32))
+    video = tmp_path / 'talk.mp4'
+    video.write_bytes(b'not really a video')
+    search = FakeSearch()
+    builder = DatasetBuilder(tmp_path / 'rq.jsonl', FakeCompressor(), processor=object(), search=search)
+
+    assert len(builder.add_title(video, crfs=(20, 30))) == 4
+    assert builder.add_title(video, crfs=(20, 30)) == [] and search.calls == 1
+
+    content, crfs, scales, targets = load_dataset(tmp_path / 'rq.jsonl')
+    assert content.shape == (4, len(CONTENT_FEATURES))
+    assert sorted(scales) == pytest.approx([480 / 720, 480 / 720, 1.0, 1.0])
+    assert np.exp(targets[0, 1]) == pytest.approx(1000 * 1000 / (1280 * 720 * 25))
+
+
+def test_search_widens_a_wrong_predicted_window(monkeypatch):
+    search = TargetQualitySearch(FakeCompressor(), max_workers=1, cache_dir=None)
+    tried = []
+
+    def fake_explore(input_path, preset, resolutions, explore):
+        def trial(resolution, crf):
+            tried.append(crf)
+            return {'resolution': resolution, 'crf': crf, 'ssim': 1.0 - crf / 100, 'psnr': 40.0,
+                    'bitrate_kbps': 5000.0 / crf}
+        return explore(trial, resolutions), []
+
+    monkeypatch.setattr(search, '_explore', fake_explore)
+    # Quality meets 0.8 up to CRF 20, but the model predicted CRF 30 +- 3
+    monkeypatch.setattr(search, '_predicted_windows', lambda *args: {'original': (27, 33)})
+    result = search.search('clip.mp4', 0.8, resolutions=['original'], model=object())
+    assert result['crf'] == 20 and result['met_target']
+    assert min(tried[:3]) >= 27  # the predicted window was tried first
@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quality_assessment
+from quality_assessment import QualityAssessor
+from score_cache import ScoreCache, file_fingerprint
+
+
+def test_fingerprint_follows_content_not_path(tmp_path):
+    original = tmp_path / 'a.mp4'
+    original.write_bytes(os.urandom(3 * 1024 * 1024))
+    copy = tmp_path / 'b.mp4'
+    shutil.copy(original, copy)
+    assert file_fingerprint(original) == file_fingerprint(copy)
+
+    with open(copy, 'r+b') as f:
+        f.write(b'changed')
+    assert file_fingerprint(original) != file_fingerprint(copy)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ScoreCache(db_path=None, max_bytes=100)
+    cache.put('a', 'x' * 40)
+    cache.put('b', 'x' * 40)
+    assert cache.get('a') is not None  # 'b' is now the oldest
+    cache.put('c', 'x' * 40)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (3, 1, 1, 2)
+
+
+class CountingAssessor(QualityAssessor):
+    extracted = 0
+
+    def _extract_frames(self, video_path, num_frames=10):
+        self.extracted += 1
+        return [np.full((224, 224, 3), i * 20, dtype=np.uint8) for i in range(num_frames)]
+
+    @property
+    def predictor(self):
+        return lambda batch: batch.mean(axis=(1, 2, 3))
+
+
+def test_repeated_assessment_hits_the_cache(tmp_path, monkeypatch):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'not really a video')
+    checkpoint = tmp_path / 'model.pth'
+    checkpoint.write_bytes(b'weights')
+
+    cache = ScoreCache(db_path=None)
+    assessor = CountingAssessor(num_frames=4, model_path=checkpoint, score_cache=cache)
+    first = assessor.assess_frames(str(video))
+    score = assessor.assess_quality(str(video))
+
+    assert assessor.extracted == 1
+    assert np.allclose(first, assessor.assess_frames(str(video)))
+    assert abs(score - float(np.mean(first))) < 1e-6
+
+    # Other sampling parameters or another checkpoint are separate entries
+    assessor.assess_quality(str(video), num_frames=2)
+    checkpoint.write_bytes(b'retrained weights')
+    assessor.assess_quality(str(video))
+    assert assessor.extracted == 3
+
+    # As are scores from an older frame sampling pipeline
+    monkeypatch.setattr(quality_assessment, 'SAMPLING_VERSION', quality_assessment.SAMPLING_VERSION + 1)
+    assessor.assess_quality(str(video))
+    assert assessor.extracted == 4
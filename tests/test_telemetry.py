@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry as telemetry_module
+from telemetry import Telemetry
+
+
+def test_stage_summaries_and_prometheus_text(tmp_path):
+    telemetry = Telemetry()
+    for _ in range(3):
+        with telemetry.stage('encode'):
+            pass
+    telemetry.record('inference', 0.25)
+    telemetry.record_encode({'frame': 240, 'fps': 120.0, 'speed': 4.8})
+
+    stages = telemetry.snapshot()['stages']
+    assert stages['encode']['count'] == 3 and stages['inference']['sum'] == 0.25
+
+    text = telemetry.prometheus_text()
+    assert 'vco_stage_seconds_count{stage="encode"} 3' in text
+    assert 'vco_stage_seconds_sum{stage="inference"} 0.250000' in text
+    assert 'vco_encoded_frames_total 240' in text and 'vco_encode_speed 4.8' in text
+    assert 'vco_peak_rss_bytes{process="self"}' in text
+
+    path = tmp_path / 'metrics.prom'
+    telemetry.write_prometheus(path)
+    assert path.read_text() == text
+    # Tracing is off by default, so no events are kept
+    assert telemetry.chrome_trace()['traceEvents'] == []
+
+
+def test_peak_rss_is_optional(monkeypatch):
+    # As on Windows, where the resource module does not exist
+    monkeypatch.setattr(telemetry_module, 'resource', None)
+    telemetry = Telemetry()
+    assert telemetry.snapshot()['peak_rss_bytes'] is None
+    assert 'vco_peak_rss_bytes' not in telemetry.prometheus_text()
+
+
+def test_chrome_trace_events(tmp_path):
+    telemetry = Telemetry(trace=True, max_events=2)
+    for chunk in range(3):
+        with telemetry.stage('encode_chunk', chunk=chunk):
+            pass
+
+    path = tmp_path / 'trace.json'
+    telemetry.write_chrome_trace(path)
+    events = json.loads(path.read_text())['traceEvents']
+    assert [e['args']['chunk'] for e in events] == ['1', '2']
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+
+    telemetry.reset()
+    assert telemetry.snapshot()['stages'] == {} and telemetry.chrome_trace()['traceEvents'] == []
@@ -24,6 +24,16 @@ try:
     features = processor.analyze_frame(test_frame)
     print(f"Frame analysis features: {features}")
     
+    print("\nTesting batch frame analysis...")
+    batch = np.stack([test_frame, test_frame[::-1]])
+    feature_matrix = processor.analyze_frames(batch)
+    print(f"Feature matrix shape: {feature_matrix.shape} (num_features={VideoProcessor.num_features})")
+    try:
+        processor.analyze_frames(test_frame)
+        raise AssertionError("analyze_frames accepted a single (H, W, 3) frame")
+    except ValueError as e:
+        print(f"Single frame rejected as expected: {e}")
+    
     # Test PSNR calculation
     print("\nTesting PSNR calculation...")
     compressed_frame = cv2.GaussianBlur(test_frame, (7, 7), 0)  # Simulate compression
@@ -35,14 +45,82 @@ try:
     ssim = processor.calculate_ssim(test_frame, compressed_frame)
     print(f"SSIM value: {ssim}")
     
+    # Test the fast metric modes
+    print("\nTesting fast metric modes...")
+    from cpp_src.build.video_processor import MetricsOptions, QualityMetrics, SSIMWindow
+    fast = QualityMetrics(MetricsOptions(luma_only=True, window=SSIMWindow.BOX, downscale=2))
+    multi_scale = QualityMetrics(MetricsOptions(scales=5))
+    print(f"Luma box SSIM at half size: {fast.ssim(test_frame, compressed_frame)}")
+    print(f"MS-SSIM: {multi_scale.ssim(test_frame, compressed_frame)}")
+    print(f"Per-channel PSNR: {QualityMetrics().psnr_channels(test_frame, compressed_frame)}")
+    
+    # Test strided and grayscale inputs
+    print("\nTesting strided and grayscale inputs...")
+    crop = test_frame[100:600, 200:900]
+    print(f"Crop SSIM value: {processor.calculate_ssim(crop, compressed_frame[100:600, 200:900])}")
+    gray = cv2.cvtColor(test_frame, cv2.COLOR_BGR2GRAY)
+    print(f"Grayscale features: {processor.analyze_frame(gray)[:VideoProcessor.num_features]}")
+    
+    # Test streaming temporal analysis on a short synthetic clip
+    print("\nTesting temporal analysis...")
+    import tempfile
+    clip_path = os.path.join(tempfile.mkdtemp(), 'moving.avi')
+    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (320, 240))
+    for i in range(50):
+        writer.write(np.roll(cv2.resize(test_frame, (320, 240)), 4 * i, axis=1))
+    writer.release()
+    profile = processor.analyze_video(clip_path, segment_seconds=1.0)
+    print(f"Segments: {profile['segments']}, mean motion: {profile['motion'].mean():.2f}")
+    print(f"Segment parameters: {processor.optimize_parameters(profile['segments'][0], 320, 240, 25.0, 0.9)}")
+    
     # Test compression parameter optimization
     print("\nTesting compression parameter optimization...")
     params = processor.optimize_parameters(test_frame, 0.9)  # target quality of 0.9
     print(f"Optimized parameters: {params}")
     
+    # Native call counters accumulated by the calls above
+    print("\nNative call statistics...")
+    for call, counters in VideoProcessor.stats().items():
+        print(f"{call}: {counters['calls']} calls, {counters['frames']} frames, {counters['seconds']:.4f}s")
+    VideoProcessor.reset_stats()
+    
 except ImportError as e:
     print(f"Error importing module: {e}")
 except Exception as e:
     print(f"Error during testing: {e}")
     import traceback
     traceback.print_exc()
+
+
+def test_compare_videos_pairs_frames_in_lock_step(tmp_path):
+    import pytest
+    video_processor = pytest.importorskip('cpp_src.build.video_processor')
+    processor = video_processor.VideoProcessor()
+
+    rng = np.random.default_rng(0)
+    frames = [cv2.GaussianBlur(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8), (5, 5), 0)
+              for _ in range(30)]
+    reference = str(tmp_path / 'reference.avi')
+    blurred = str(tmp_path / 'blurred.avi')
+    for path, clip in ((reference, frames), (blurred, [cv2.GaussianBlur(f, (9, 9), 0) for f in frames[:24]])):
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (160, 120))
+        for frame in clip:
+            writer.write(frame)
+        writer.release()
+
+    # Small batches so several asynchronously decoded batches are paired
+    same = processor.compare_videos(reference, reference, batch_size=8)
+    assert same['frames_compared'] == len(same['psnr']) == len(same['ssim']) == 30
+    assert np.array_equal(same['frame_indices'], np.arange(30))
+    assert np.allclose(same['ssim'], 1.0) and np.all(same['psnr'] >= 100.0)
+
+    # The shorter distorted clip ends the comparison; frame_step keeps every other frame
+    report = processor.compare_videos(reference, blurred, batch_size=8, frame_step=2)
+    assert (report['reference_frames'], report['distorted_frames']) == (30, 24)
+    assert report['frames_compared'] == len(report['psnr']) == len(report['ssim']) == 12
+    assert np.array_equal(report['frame_indices'], np.arange(0, 24, 2))
+    assert np.all(report['ssim'] < 1.0) and np.all(report['psnr'] < 100.0)
+    assert report['psnr_mean'] == pytest.approx(float(np.mean(report['psnr'])), rel=1e-5)
+    assert report['ssim_mean'] == pytest.approx(float(np.mean(report['ssim'])), rel=1e-5)
+    assert report['psnr_min'] == pytest.approx(float(np.min(report['psnr'])))
+    assert report['ssim_min'] == pytest.approx(float(np.min(report['ssim'])))